@@ -0,0 +1,126 @@
+"""
+Benchmarks for samanta. They are not part of the test suite, run them with:
+
+    >>> python src/runbench.py [module ...] [--save FILE] [--compare FILE]
+
+Every module in this package exposes a ``run()`` function that prints its own
+report and records its numbers with :func:`report` or :func:`record`, so the
+runner can save them as a baseline or compare them with a previous one.
+"""
+import json
+import time
+import timeit
+
+RESULTS = {}
+"""Numbers recorded during the current run: {name: {metric: value}}"""
+
+
+def best_of(stmt, number=100000, repeat=5):
+    """Times the given callable and returns the best time per call.
+
+    :param stmt: callable: code to measure
+    :param number: int: calls per repetition
+    :param repeat: int: repetitions, the best one is kept
+    :return: float: seconds per call
+    """
+    timings = timeit.repeat(stmt, number=number, repeat=repeat)
+    return min(timings) / number
+
+
+def report(name, seconds):
+    """Prints and records a single line with the cost of a call"""
+    RESULTS[name] = {'ns': seconds * 1e9}
+    print('{:<40} {:>10.1f} ns/call'.format(name, seconds * 1e9))
+
+
+def percentile(samples, point):
+    """Nearest rank percentile of the given samples
+
+    :param samples: list: measured values
+    :param point: int: percentile between 0 and 100
+    :return: float
+    """
+    ordered = sorted(samples)
+    rank = max(int(round(point / 100. * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def sample(operation, setup=None, iterations=50):
+    """Runs the operation several times, measuring each call on its own.
+
+    :param operation: callable: receives whatever the setup returns
+    :param setup: callable or None: untimed preparation of every call. It must
+    return a tuple with the arguments of the operation.
+    :param iterations: int: amount of measured calls
+    :return: tuple: (list of seconds, list of queries per call)
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings, queries = [], []
+    for _ in range(iterations):
+        args = setup() if setup else ()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            operation(*args)
+            timings.append(time.perf_counter() - start)
+        queries.append(len(captured))
+    return timings, queries
+
+
+def record(name, timings, queries=None):
+    """Prints and records the latency percentiles of an operation
+
+    :param name: str: name of the operation
+    :param timings: list: seconds per call
+    :param queries: list or None: queries per call
+    :return: dict: recorded metrics
+    """
+    metrics = {
+        'p50': percentile(timings, 50) * 1e3,
+        'p90': percentile(timings, 90) * 1e3,
+        'p99': percentile(timings, 99) * 1e3,
+        'max': max(timings) * 1e3,
+    }
+    if queries:
+        metrics['queries'] = sum(queries) / float(len(queries))
+    RESULTS[name] = metrics
+    print('{:<30} p50 {p50:>8.2f} ms  p90 {p90:>8.2f} ms  p99 {p99:>8.2f} ms'
+          '  max {max:>8.2f} ms  queries {q}'.format(
+              name, q=('{:.1f}'.format(metrics['queries'])
+                       if queries else '-'), **metrics))
+    return metrics
+
+
+def save(path):
+    """Stores the recorded numbers as a baseline"""
+    with open(path, 'w') as stream:
+        json.dump(RESULTS, stream, indent=2, sort_keys=True)
+
+
+def compare(path, tolerance=0.1):
+    """Compares the recorded numbers with a saved baseline
+
+    :param path: str: file written by :func:`save`
+    :param tolerance: float: relative growth accepted before flagging
+    :return: list: names of the regressed metrics
+    """
+    with open(path) as stream:
+        baseline = json.load(stream)
+
+    regressions = []
+    print('{:<40} {:>8} {:>12} {:>12} {:>8}'.format(
+        'metric', '', 'baseline', 'current', 'change'))
+    for name in sorted(RESULTS):
+        for metric, value in sorted(RESULTS[name].items()):
+            old = baseline.get(name, {}).get(metric)
+            if old is None:
+                continue
+            change = (value - old) / old if old else 0.
+            flag = ''
+            if change > tolerance:
+                flag = 'SLOWER' if metric != 'queries' else 'MORE'
+                regressions.append('{}.{}'.format(name, metric))
+            print('{:<40} {:>8} {:>12.3f} {:>12.3f} {:>+7.1%} {}'.format(
+                name, metric, old, value, change, flag))
+    return regressions
@@ -0,0 +1,195 @@
+"""
+Latency and queries of the account hot paths. The real views and helpers are
+driven in-process with the test client against an in-memory SQLite database
+and the locmem email backend.
+"""
+import itertools
+
+from django.core import mail
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, override_settings
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from samanta.core.hasher import Hasher
+from samanta.core.mailer.mailer import EmailSender
+from samanta.models import (SamUser, UserCreationLog, PasswordRecoveryLog,
+                            EmailChangeLog)
+from samanta.views.helpers import _build_log, _build_context
+from . import sample, record, best_of, report
+
+ITERATIONS = 50
+PASSWORD = 'Bench-pass-123'
+
+_counter = itertools.count()
+
+
+def _uid(user):
+    return urlsafe_base64_encode(force_bytes(user.id)).decode()
+
+
+def new_user(active=True):
+    """Creates a fresh user, none of the measured operations share them"""
+    n = next(_counter)
+    return SamUser.objects.create_user(
+        'bench{}'.format(n), 'bench{}@bench.com'.format(n), PASSWORD,
+        is_active=active)
+
+
+def new_token(user, log_model, email=None):
+    """Stores a new token for the user and returns the raw token"""
+    log, token = _build_log(user, log_model)
+    if email:
+        log.email = email
+    log.save()
+    return token
+
+
+def logged_client(user):
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def bench_register():
+    def setup():
+        n = next(_counter)
+        data = {'username': 'reg{}'.format(n),
+                'email': 'reg{}@bench.com'.format(n),
+                'email2': 'reg{}@bench.com'.format(n),
+                'password1': PASSWORD, 'password2': PASSWORD,
+                'terms_of_service': 'on'}
+        return Client(), data
+
+    def operation(client, data):
+        assert client.post('/register/', data).status_code == 302
+
+    return sample(operation, setup, ITERATIONS)
+
+
+def bench_account_confirm():
+    def setup():
+        user = new_user(active=False)
+        token = new_token(user, UserCreationLog)
+        return Client(), '/account/confirm/{}/{}/'.format(_uid(user), token)
+
+    def operation(client, url):
+        client.get(url)
+
+    return sample(operation, setup, ITERATIONS)
+
+
+def bench_login():
+    user = new_user()
+
+    def setup():
+        return Client(), {'username': user.username, 'password': PASSWORD}
+
+    def operation(client, data):
+        assert client.post('/login/', data).status_code == 302
+
+    return sample(operation, setup, ITERATIONS)
+
+
+def bench_password_recovery_start():
+    def setup():
+        return Client(), {'email': new_user().email}
+
+    def operation(client, data):
+        client.post('/password/recover/', data)
+
+    return sample(operation, setup, ITERATIONS)
+
+
+def bench_password_recovery_change():
+    def setup():
+        user = new_user()
+        token = new_token(user, PasswordRecoveryLog)
+        uid = _uid(user)
+        data = {'hashid': uid, 'token': token,
+                'new_password1': 'New-' + PASSWORD,
+                'new_password2': 'New-' + PASSWORD}
+        return (Client(), '/password/recover/set/{}/{}/'.format(uid, token),
+                data)
+
+    def operation(client, url, data):
+        client.post(url, data)
+
+    return sample(operation, setup, ITERATIONS)
+
+
+def bench_email_change():
+    def setup():
+        user = new_user()
+        email = 'new{}@bench.com'.format(next(_counter))
+        data = {'password': PASSWORD, 'email_new': email,
+                'email_new2': email}
+        return logged_client(user), data
+
+    def operation(client, data):
+        client.post('/email/change/', data)
+
+    return sample(operation, setup, ITERATIONS)
+
+
+def bench_email_confirm():
+    def setup():
+        user = new_user()
+        email = 'new{}@bench.com'.format(next(_counter))
+        token = new_token(user, EmailChangeLog, email)
+        return (logged_client(user),
+                '/email/confirm/{}/{}/'.format(_uid(user), token))
+
+    def operation(client, url):
+        client.get(url)
+
+    return sample(operation, setup, ITERATIONS)
+
+
+def bench_mail_rendering():
+    user = new_user()
+    mailer = EmailSender('Samanta', 'testserver')
+    context = _build_context(user, Hasher().get_id(), False)
+
+    def operation():
+        mailer.activation_email(user.email, context)
+        del mail.outbox[:]
+
+    return sample(operation, iterations=ITERATIONS * 4)
+
+
+def bench_hasher():
+    hasher = Hasher()
+    raw, digest, salt = hasher.secure_set()
+    report('hasher.get_id', best_of(hasher.get_id, number=20000))
+    report('hasher.secure_set', best_of(hasher.secure_set, number=20000))
+    report('hasher.check', best_of(lambda: hasher.check(digest, salt, raw),
+                                   number=20000))
+
+
+OPERATIONS = [
+    ('register', bench_register),
+    ('account_confirm', bench_account_confirm),
+    ('login', bench_login),
+    ('password_recovery_start', bench_password_recovery_start),
+    ('password_recovery_change', bench_password_recovery_change),
+    ('email_change', bench_email_change),
+    ('email_confirm', bench_email_confirm),
+    ('mail_rendering', bench_mail_rendering),
+]
+
+
+def run():
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        with override_settings(USE_CAPTCHA=False):
+            for name, operation in OPERATIONS:
+                timings, queries = operation()
+                record(name, timings, queries)
+                del mail.outbox[:]
+            bench_hasher()
+    finally:
+        runner.teardown_databases(old_config)
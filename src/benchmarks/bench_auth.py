@@ -0,0 +1,87 @@
+"""
+Overhead of the authentication on the requests of logged in users, and of
+the logins, with the default ModelBackend and with the CachedModelBackend
+(locmem cache, so the numbers leave out the network of a shared cache).
+
+The slim projection (SLIM_USERS) is measured on wide user rows: the bytes of
+the columns read per user and the time per request.
+"""
+from django.core.cache import caches
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, override_settings
+
+from samanta.conf import settings
+from samanta.models import SamUser
+from . import sample, record, RESULTS
+
+ITERATIONS = 200
+PASSWORD = 'Bench-pass-123'
+
+BACKENDS = [
+    ('model', 'django.contrib.auth.backends.ModelBackend'),
+    ('cached', 'samanta.backends.CachedModelBackend'),
+]
+
+WIDE = {'first_name': 'F' * 30, 'last_name': 'L' * 150, 'language': 'es',
+        'location': 'CL', 'avatar': 'avatars/' + 'a' * 90 + '.png'}
+
+
+def bench_profile(user):
+    client = Client()
+    client.force_login(user)
+    client.get('/account/profile/')
+
+    def operation():
+        assert client.get('/account/profile/').status_code == 200
+
+    return sample(operation, iterations=ITERATIONS)
+
+
+def bench_login(user):
+    data = {'username': user.username, 'password': PASSWORD}
+
+    def operation():
+        assert Client().post('/login/', data).status_code == 302
+
+    return sample(operation, iterations=ITERATIONS // 4)
+
+
+def row_bytes(user, fields=None):
+    """:return: int: size of the values of the given columns of the user"""
+    row = SamUser.objects.filter(pk=user.pk).values_list(
+        *(fields or [f.attname for f in SamUser._meta.concrete_fields]))[0]
+    return sum(len(str(value).encode('utf-8')) for value in row)
+
+
+def bench_projection(user):
+    wide = row_bytes(user)
+    slim = row_bytes(user, settings.SLIM_USER_FIELDS)
+    RESULTS['user_row_bytes'] = {'full': wide, 'slim': slim}
+    print('{:<30} full {} bytes  slim {} bytes'.format('user_row', wide,
+                                                       slim))
+    for slim_users in (False, True):
+        with override_settings(
+                SLIM_USERS=slim_users,
+                AUTHENTICATION_BACKENDS=['samanta.backends.SamModelBackend']):
+            record('profile_slim' if slim_users else 'profile_full',
+                   *bench_profile(user))
+
+
+def run():
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        user = SamUser.objects.create_user('bench', 'bench@bench.com',
+                                           PASSWORD, is_active=True)
+        for name, backend in BACKENDS:
+            caches['default'].clear()
+            with override_settings(AUTHENTICATION_BACKENDS=[backend]):
+                record('profile_' + name, *bench_profile(user))
+                record('login_' + name, *bench_login(user))
+
+        SamUser.objects.filter(pk=user.pk).update(**WIDE)
+        bench_projection(SamUser.objects.get(pk=user.pk))
+    finally:
+        runner.teardown_databases(old_config)
@@ -0,0 +1,25 @@
+"""Cost of reading the samanta settings"""
+import django.conf
+
+from samanta.conf import settings, Settings
+from . import best_of, report
+
+
+def run():
+    # project defined value and app fallback
+    names = ('EMAIL_HOST_USER', 'TOKEN_SPAN_VALIDITY')
+
+    for name in names:
+        report('django.conf.settings.' + name,
+               best_of(lambda: getattr(django.conf.settings, name, None)))
+
+        def cold():
+            settings.clear_cache(name)
+            return getattr(settings, name)
+        report('samanta settings (cold) ' + name, best_of(cold))
+
+        settings.clear_cache()
+        report('samanta settings (memo) ' + name,
+               best_of(lambda: getattr(settings, name)))
+
+    report('class attribute', best_of(lambda: Settings.TEAM_NAME))
@@ -0,0 +1,62 @@
+"""
+Throughput and memory of the user table export on synthetic rows. The size
+can be changed with the environment variable BENCH_EXPORT_ROWS (default one
+million rows).
+"""
+import os
+import time
+import tracemalloc
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment
+
+from samanta.core import export
+from samanta.models import SamUser
+from . import report
+
+ROWS = int(os.environ.get('BENCH_EXPORT_ROWS', 1000000))
+BATCH = 10000
+
+
+class Sink:
+    """Discards everything, the measure is about reading and formatting"""
+
+    def write(self, data):
+        return len(data)
+
+
+def populate(rows):
+    password = 'pbkdf2_sha256$36000$x$y='
+    for start in range(0, rows, BATCH):
+        SamUser.objects.bulk_create(
+            SamUser(username='u{}'.format(i), email='u{}@bench.com'.format(i),
+                    password=password, location='CL', language='es')
+            for i in range(start, min(start + BATCH, rows)))
+
+
+def run():
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        started = time.perf_counter()
+        populate(ROWS)
+        print('{} synthetic rows created in {:.1f}s'.format(
+            ROWS, time.perf_counter() - started))
+
+        # parquet is left out, pyarrow needs a real file to write to
+        for format_ in ('csv', 'ndjson', 'columns'):
+            started = time.perf_counter()
+            total, _ = export.export_table(Sink(), format_, BATCH)
+            elapsed = time.perf_counter() - started
+            report('export {} per row'.format(format_), elapsed / total)
+            print('    {:.0f} rows/s'.format(total / elapsed))
+
+            # a second pass under tracemalloc shows the memory stays bounded
+            tracemalloc.start()
+            export.export_table(Sink(), format_, BATCH)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('    peak memory {:.1f} MiB'.format(peak / 2. ** 20))
+    finally:
+        runner.teardown_databases(old_config)
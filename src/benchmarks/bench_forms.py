@@ -0,0 +1,70 @@
+"""
+Render cost of the profile edition form, whose country select has ~250
+translated and sorted options, with the stock select of django-countries and
+with samanta's CachedCountrySelect. The view is measured as well, logged in,
+since it renders the form on every GET.
+"""
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment
+from django.utils import translation
+from django_countries.widgets import LazySelect
+
+from samanta import widgets
+from samanta.forms import SamUserEditForm
+from samanta.models import SamUser
+from . import sample, record
+
+ITERATIONS = 200
+
+
+class StockEditForm(SamUserEditForm):
+
+    class Meta(SamUserEditForm.Meta):
+        widgets = {'location': LazySelect}
+
+
+def bench_render(name, form_class, language):
+    user = SamUser(username='bench', location='CL')
+
+    def operation():
+        with translation.override(language):
+            str(form_class(instance=user))
+
+    widgets._options.clear()
+    # the first render of the cached widget fills the cache
+    record(name + '_first', *sample(operation, iterations=1))
+    record(name, *sample(operation, iterations=ITERATIONS))
+
+
+def bench_view(name, form_class):
+    from samanta.views import account
+
+    user = SamUser.objects.create_user(name, name + '@bench.com', 'pass',
+                                       is_active=True, location='CL')
+    client = Client()
+    client.force_login(user)
+    previous, account.ProfileEdit.USER_EDIT_FORM = \
+        account.ProfileEdit.USER_EDIT_FORM, form_class
+    try:
+        record(name, *sample(
+            lambda: client.get('/account/edit/', HTTP_ACCEPT_LANGUAGE='es'),
+            iterations=ITERATIONS))
+    finally:
+        account.ProfileEdit.USER_EDIT_FORM = previous
+
+
+def run():
+    for language in ('en', 'es'):
+        bench_render('edit_form_stock_' + language, StockEditForm, language)
+        bench_render('edit_form_cached_' + language, SamUserEditForm,
+                     language)
+
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        bench_view('profile_edit_stock', StockEditForm)
+        bench_view('profile_edit_cached', SamUserEditForm)
+    finally:
+        runner.teardown_databases(old_config)
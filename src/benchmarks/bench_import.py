@@ -0,0 +1,80 @@
+"""
+Startup cost of samanta, measured with ``python -X importtime`` in a fresh
+interpreter for every module so nothing is shared between the measures.
+"""
+import os
+import sys
+import subprocess
+
+MODULES = ['samanta.models', 'samanta.forms', 'samanta.views.account',
+           'samanta.urls']
+"""Modules imported by a project that uses samanta"""
+
+LAZY = ['captcha.fields', 'samanta.core.mailer.mailer']
+"""Modules that must not be imported just by importing samanta.forms and the
+views"""
+
+REPEAT = 5
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _python(code):
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'samanta.tests.test_settings')
+    env['PYTHONPATH'] = os.pathsep.join(
+        [SRC] + [p for p in [env.get('PYTHONPATH')] if p])
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True,
+                          check=True)
+
+
+def parse_importtime(stderr):
+    """Parses the output of ``-X importtime``
+
+    :param stderr: str: output of the interpreter
+    :return: dict: {module: (self_us, cumulative_us)}
+    """
+    result = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        result[name.strip()] = (int(self_us), int(cumulative))
+    return result
+
+
+def measure(module):
+    """Imports the given module after django.setup() in a fresh interpreter
+
+    :param module: str: dotted path of the module
+    :return: tuple: (cumulative_us, set of imported modules)
+    """
+    code = ('import django; django.setup(); import sys; '
+            'print("\\n".join(sys.modules))\n'
+            'import {}; print("--"); print("\\n".join(sys.modules))')
+    proc = _python(code.format(module))
+    before, after = proc.stdout.split('--\n')
+    new = set(after.split()) - set(before.split())
+    times = parse_importtime(proc.stderr)
+    cumulative = sum(times[name][0] for name in new if name in times)
+    return cumulative, new
+
+
+def run():
+    failed = False
+    for module in MODULES:
+        timings = []
+        for _ in range(REPEAT):
+            cumulative, new = measure(module)
+            timings.append(cumulative)
+        print('{:<30} {:>8.1f} ms {:>5} modules'.format(
+            module, min(timings) / 1000., len(new)))
+        if module in ('samanta.forms', 'samanta.views.account'):
+            for lazy in LAZY:
+                if lazy in new:
+                    failed = True
+                    print('    ERROR: {} imported eagerly'.format(lazy))
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,527 @@
+"""
+Concurrent load test of the account flows. Many virtual users, as threads and
+optionally processes, drive the samanta URLs over HTTP with a mix of:
+
+* register: GET and POST of the register form. A fraction of the users reuse
+  a username being registered by another one (--duplicates), which must end
+  in a form error and never in a server error.
+* confirm: opens the activation link of a registered user. A fraction of the
+  links are opened twice at once (--double), and just one of them may
+  activate the account.
+* login: GET and POST of the login form of an active user.
+* recover: asks for the password recovery of an active user, opens the
+  link and sends the new password with its form, also twice at once for a
+  fraction of them.
+
+The links are read from the email spool (see samanta.core.mailer.spool).
+By default a threaded server is started in this process on the test
+database: SQLite, or the PostgreSQL of the given settings. Against an
+external server (--url) pass its MAIL_SPOOL_DIR with --spool, and disable
+its captcha and token cooldowns.
+
+The report has the throughput, the latency percentiles and errors per flow,
+and the detected races:
+
+* duplicate_username: a duplicated registration answered with a 5xx,
+  e.g. the IntegrityError of the unique index.
+* double_activation / double_recovery: a link consumed more than once.
+* lost_token: a link of a single request that could not be used.
+
+Run it with:
+
+    >>> python src/runload.py --threads 16 --duration 30 --mix register=3,login=4
+"""
+import os
+import re
+import json
+import time
+import random
+import shutil
+import tempfile
+import threading
+import itertools
+import socketserver
+import http.client
+import multiprocessing
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from . import percentile, RESULTS
+
+PASSWORD = 'Load-pass-123'
+
+FLOWS = ('register', 'confirm', 'login', 'recover')
+
+DEFAULT_MIX = {'register': 3, 'confirm': 2, 'login': 4, 'recover': 1}
+
+CONFIRM_LINK = re.compile(
+    r'/account/confirm/[0-9A-Za-z_\-]+/[0-9A-Za-z]+/')
+RECOVER_LINK = re.compile(
+    r'/password/recover/set/[0-9A-Za-z_\-]+/[0-9A-Za-z]+/')
+# Django 1.11 quotes the attributes of the hidden input with '
+CSRF = re.compile(r"""name=['"]csrfmiddlewaretoken['"] value=['"]([^'"]+)""")
+
+
+class Client:
+    """HTTP client of a virtual user: one keep-alive connection and its
+    cookies. The redirects are not followed"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, data=None):
+        """:return: tuple: (status, Location header, body)"""
+        headers = {'Cookie': '; '.join('{}={}'.format(k, v) for k, v in
+                                       self.cookies.items())}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=60)
+            try:
+                self.connection.request(method, path, body, headers)
+                response = self.connection.getresponse()
+                content = response.read().decode('utf-8', 'replace')
+                break
+            except (http.client.HTTPException, OSError):
+                # the server closed the kept alive connection
+                self.connection.close()
+                self.connection = None
+                if attempt == 2:
+                    raise
+        for header in response.msg.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        return response.status, response.getheader('Location', ''), content
+
+    def form(self, path):
+        """GETs a form page and returns its CSRF token"""
+        status, _, content = self.request('GET', path)
+        found = CSRF.search(content)
+        if status != 200 or not found:
+            raise LoadError('GET {} answered {}'.format(path, status), status)
+        return found.group(1)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class LoadError(Exception):
+    """Unexpected answer of the server. The args are a message and the
+    status"""
+
+
+class Mailbox:
+    """Reads the links sent to the users from the email spool"""
+
+    def __init__(self, spool_dir):
+        from samanta.core.mailer import spool
+
+        self.new = spool.folders(spool_dir)['new']
+        self.seen = set()
+        self.links = {}
+        self.used = set()
+        self.lock = threading.Lock()
+
+    def scan(self):
+        from samanta.core.mailer import spool
+
+        for name in os.listdir(self.new):
+            if name in self.seen:
+                continue
+            self.seen.add(name)
+            try:
+                with open(os.path.join(self.new, name), 'rb') as stream:
+                    _, recipients, data = spool.parse(stream.read())
+            except IOError:
+                continue
+            text = data.decode('utf-8', 'replace')
+            for pattern in (CONFIRM_LINK, RECOVER_LINK):
+                for link in pattern.findall(text):
+                    for recipient in recipients:
+                        self.links.setdefault(recipient, []).append(link)
+
+    def link(self, recipient, pattern, timeout=10):
+        """:return: str or None: the newest unused link of the pattern sent
+        to the recipient"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                self.scan()
+                for link in reversed(self.links.get(recipient, [])):
+                    if pattern.match(link) and link not in self.used:
+                        self.used.add(link)
+                        return link
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(0.05)
+
+
+class Load:
+    """Virtual users of a process and their results
+
+    :param base_url: str: server
+    :param mailbox: Mailbox
+    :param mix: dict: weight per flow
+    :param duplicates: float: fraction of registrations reusing a username
+    :param double: float: fraction of links opened twice at once
+    """
+
+    def __init__(self, base_url, mailbox, mix, duplicates=0.05, double=0.1):
+        self.base_url = base_url
+        self.mailbox = mailbox
+        self.flows = [flow for flow in FLOWS if mix.get(flow)]
+        self.weights = [mix[flow] for flow in self.flows]
+        self.duplicates = duplicates
+        self.double = double
+        self.counter = itertools.count()
+        self.prefix = 'u{}x{}'.format(os.getpid(), random.randrange(10000))
+        self.lock = threading.Lock()
+        self.registering = []
+        self.duplicated = set()
+        self.registered = []
+        self.active = []
+        self.timings = {flow: [] for flow in FLOWS}
+        self.errors = {flow: {} for flow in FLOWS}
+        self.races = {}
+
+    # ======================== results ========================================
+    def error(self, flow, reason):
+        with self.lock:
+            self.errors[flow][reason] = self.errors[flow].get(reason, 0) + 1
+
+    def race(self, name):
+        with self.lock:
+            self.races[name] = self.races.get(name, 0) + 1
+
+    def pop(self, users):
+        with self.lock:
+            if users:
+                return users.pop(random.randrange(len(users)))
+
+    def results(self):
+        return {'timings': self.timings, 'errors': self.errors,
+                'races': self.races}
+
+    # ======================== flows ==========================================
+    def register(self, client):
+        duplicated = None
+        with self.lock:
+            if self.registering and random.random() < self.duplicates:
+                duplicated = random.choice(self.registering)
+                self.duplicated.add(duplicated)
+            name = duplicated or '{}n{}'.format(self.prefix,
+                                                next(self.counter))
+            self.registering.append(name)
+            del self.registering[:-50]
+        email = '{}.{}@load.test'.format(name, next(self.counter))
+        token = client.form('/register/')
+        status, location, _ = client.request('POST', '/register/', {
+            'csrfmiddlewaretoken': token, 'username': name, 'email': email,
+            'email2': email, 'password1': PASSWORD, 'password2': PASSWORD,
+            'terms_of_service': 'on'})
+        if status >= 500:
+            if duplicated:
+                self.race('duplicate_username')
+            raise LoadError('register answered {}'.format(status), status)
+        if status == 302:
+            with self.lock:
+                self.registered.append((name, email))
+        elif name not in self.duplicated:
+            # the loser of a duplicated name gets the form error
+            raise LoadError('register rejected', status)
+
+    def open_link(self, link, use):
+        """Uses a link, twice at once for a fraction of them
+
+        :param use: callable: receives a new Client and the link, and tells
+        if the link was used
+        :return: int: amount of clients that used the link
+        """
+        def attempt(_):
+            client = Client(self.base_url)
+            try:
+                return use(client, link)
+            finally:
+                client.close()
+
+        if random.random() >= self.double:
+            return int(attempt(0))
+        barrier = threading.Barrier(2)
+
+        def concurrent(_):
+            barrier.wait()
+            return attempt(_)
+        with ThreadPoolExecutor(2) as executor:
+            return sum(executor.map(concurrent, (0, 1)))
+
+    @staticmethod
+    def activate(client, link):
+        status, location, _ = client.request('GET', link)
+        if status >= 500:
+            raise LoadError('{} answered {}'.format(link, status), status)
+        return location.endswith('/login/')
+
+    @staticmethod
+    def set_password(client, link):
+        """Opens a recovery link and sends the new password, the link is
+        used if the password was changed"""
+        status, _, content = client.request('GET', link)
+        if status >= 500:
+            raise LoadError('{} answered {}'.format(link, status), status)
+        found = CSRF.search(content)
+        if status != 200 or not found:
+            return False
+        uidb64, token = link.rstrip('/').split('/')[-2:]
+        status, location, _ = client.request('POST', link, {
+            'csrfmiddlewaretoken': found.group(1), 'hashid': uidb64,
+            'token': token, 'new_password1': PASSWORD,
+            'new_password2': PASSWORD})
+        if status >= 500:
+            raise LoadError('{} answered {}'.format(link, status), status)
+        return location.endswith('/login/')
+
+    def confirm(self, client):
+        user = self.pop(self.registered)
+        if user is None:
+            return self.register(client)
+        name, email = user
+        link = self.mailbox.link(email, CONFIRM_LINK)
+        if link is None:
+            raise LoadError('activation email missing', 0)
+        used = self.open_link(link, self.activate)
+        if used > 1:
+            self.race('double_activation')
+        elif not used:
+            self.race('lost_token')
+        with self.lock:
+            self.active.append((name, email))
+
+    def login(self, client):
+        with self.lock:
+            user = random.choice(self.active) if self.active else None
+        if user is None:
+            return self.confirm(client)
+        token = client.form('/login/')
+        status, _, _ = client.request('POST', '/login/', {
+            'csrfmiddlewaretoken': token, 'username': user[0],
+            'password': PASSWORD})
+        client.request('GET', '/logout/')
+        if status != 302:
+            raise LoadError('login answered {}'.format(status), status)
+
+    def recover(self, client):
+        with self.lock:
+            user = random.choice(self.active) if self.active else None
+        if user is None:
+            return self.confirm(client)
+        token = client.form('/password/recover/')
+        status, _, _ = client.request('POST', '/password/recover/', {
+            'csrfmiddlewaretoken': token, 'email': user[1]})
+        if status >= 400:
+            raise LoadError('recovery answered {}'.format(status), status)
+        link = self.mailbox.link(user[1], RECOVER_LINK)
+        if link is None:
+            raise LoadError('recovery email missing', 0)
+        # the form shown by the link must still accept the new password
+        used = self.open_link(link, self.set_password)
+        if used > 1:
+            self.race('double_recovery')
+        elif not used:
+            self.race('lost_token')
+
+    # ======================== workers ========================================
+    def pick(self):
+        """:return: str: flow chosen by the weights of the mix"""
+        value = random.uniform(0, sum(self.weights))
+        for flow, weight in zip(self.flows, self.weights):
+            value -= weight
+            if value <= 0:
+                return flow
+        return self.flows[-1]
+
+    def step(self, client):
+        flow = self.pick()
+        started = time.perf_counter()
+        try:
+            getattr(self, flow)(client)
+        except LoadError as e:
+            self.error(flow, 'status {}'.format(e.args[1]))
+        except Exception as e:
+            self.error(flow, type(e).__name__)
+        finally:
+            with self.lock:
+                self.timings[flow].append(time.perf_counter() - started)
+
+    def worker(self, deadline):
+        client = Client(self.base_url)
+        try:
+            while time.monotonic() < deadline:
+                self.step(client)
+        finally:
+            client.close()
+
+    def run(self, threads, duration):
+        deadline = time.monotonic() + duration
+        workers = [threading.Thread(target=self.worker, args=(deadline,))
+                   for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return self.results()
+
+
+def _process(arguments):
+    base_url, spool_dir, mix, duplicates, double, threads, duration = \
+        arguments
+    # a new seed per process, the forked ones share the parent state
+    random.seed()
+    load = Load(base_url, Mailbox(spool_dir), mix, duplicates, double)
+    return load.run(threads, duration)
+
+
+def merge(results):
+    """Adds up the results of several processes"""
+    merged = {'timings': {flow: [] for flow in FLOWS},
+              'errors': {flow: {} for flow in FLOWS}, 'races': {}}
+    for result in results:
+        for flow in FLOWS:
+            merged['timings'][flow].extend(result['timings'][flow])
+            for reason, amount in result['errors'][flow].items():
+                merged['errors'][flow][reason] = \
+                    merged['errors'][flow].get(reason, 0) + amount
+        for name, amount in result['races'].items():
+            merged['races'][name] = merged['races'].get(name, 0) + amount
+    return merged
+
+
+def report(results, duration):
+    """Prints and records the results
+
+    :return: dict: summary per flow, plus the totals
+    """
+    summary = {}
+    total = 0
+    print('{:<10} {:>7} {:>9} {:>9} {:>9} {:>9} {:>7}'.format(
+        'flow', 'ops', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'errors'))
+    for flow in FLOWS:
+        timings = results['timings'][flow]
+        if not timings:
+            continue
+        errors = sum(results['errors'][flow].values())
+        total += len(timings)
+        summary[flow] = {
+            'ops': len(timings), 'errors': errors,
+            'p50': percentile(timings, 50) * 1e3,
+            'p90': percentile(timings, 90) * 1e3,
+            'p99': percentile(timings, 99) * 1e3,
+            'max': max(timings) * 1e3,
+        }
+        RESULTS['load_' + flow] = summary[flow]
+        print('{:<10} {ops:>7} {p50:>9.1f} {p90:>9.1f} {p99:>9.1f} '
+              '{max:>9.1f} {errors:>7}'.format(flow, **summary[flow]))
+        for reason, amount in sorted(results['errors'][flow].items()):
+            print('    {:<30} {}'.format(reason, amount))
+    summary['throughput'] = total / duration
+    summary['races'] = results['races']
+    RESULTS['load'] = {'throughput': summary['throughput']}
+    print('throughput {:.1f} flows/s'.format(summary['throughput']))
+    print('races {}'.format(json.dumps(results['races'], sort_keys=True)
+                            if results['races'] else 'none'))
+    return summary
+
+
+def start_server():
+    """Starts a threaded WSGI server of the current settings in a daemon
+    thread
+
+    :return: str: base url
+    """
+    from django.core.servers.basehttp import WSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    # the pending connections of many virtual users
+    Server = type('Server', (socketserver.ThreadingMixIn, WSGIServer),
+                  {'daemon_threads': True, 'request_queue_size': 128})
+    server = Server(('127.0.0.1', 0), QuietHandler)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return 'http://127.0.0.1:{}'.format(server.server_port)
+
+
+def load(threads=8, processes=1, duration=10., mix=None, duplicates=0.05,
+         double=0.1, url=None, spool_dir=None):
+    """Runs the load test
+
+    :param threads: int: virtual users per process
+    :param processes: int: client processes
+    :param duration: float: seconds
+    :param mix: dict or None: weight per flow, DEFAULT_MIX by default
+    :param url: str or None: external server, None starts one on the test
+    database
+    :param spool_dir: str or None: email spool of the server
+    :return: dict: see :func:`report`
+    """
+    mix = mix or DEFAULT_MIX
+    if url is None:
+        return _local(threads, processes, duration, mix, duplicates, double)
+    if not spool_dir and set(mix) - {'register'}:
+        raise ValueError('The flows besides register need the email spool '
+                         'of the server')
+    arguments = (url, spool_dir, mix, duplicates, double, threads, duration)
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            results = merge(pool.map(_process, [arguments] * processes))
+    else:
+        results = _process(arguments)
+    return report(results, duration)
+
+
+def _local(threads, processes, duration, mix, duplicates, double):
+    from django.db import connections
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, override_settings
+
+    setup_test_environment()
+    spool_dir, database_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    for alias in connections:
+        settings_dict = connections[alias].settings_dict
+        if settings_dict['ENGINE'].endswith('sqlite3'):
+            # the shared cache of an in memory database fails at once on a
+            # locked table, a file waits for the lock like the servers do
+            settings_dict['TEST']['NAME'] = os.path.join(
+                database_dir, alias + '.sqlite3')
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        with override_settings(
+                ALLOWED_HOSTS=['*'], USE_CAPTCHA=False, TOKEN_COOLDOWNS={},
+                ENFORCE_QUERY_BUDGETS=False,
+                MAIL_BACKEND='samanta.core.mailer.spool.SpoolEmailBackend',
+                MAIL_SPOOL_DIR=spool_dir, MAIL_SPOOL_FSYNC=False):
+            url = start_server()
+            # the forked client processes only speak HTTP
+            return load(threads, processes, duration, mix, duplicates,
+                        double, url, spool_dir)
+    finally:
+        runner.teardown_databases(old_config)
+        shutil.rmtree(database_dir, ignore_errors=True)
+
+
+def run():
+    load()
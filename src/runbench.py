@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+import os
+import sys
+import argparse
+import importlib
+
+import django
+
+DEFAULT = ['conf', 'import', 'account']
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Runs samanta benchmarks')
+    parser.add_argument('modules', nargs='*', default=DEFAULT,
+                        help='benchmarks to run, e.g. conf account')
+    parser.add_argument('--save', help='stores the results as a baseline')
+    parser.add_argument('--compare', help='compares with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative growth flagged as a regression')
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'samanta.tests.test_settings'
+    django.setup()
+
+    import benchmarks
+
+    for name in args.modules:
+        print('=' * 20, name, '=' * 20)
+        importlib.import_module('benchmarks.bench_' + name).run()
+
+    if args.save:
+        benchmarks.save(args.save)
+    if args.compare:
+        print('=' * 20, 'compare', '=' * 20)
+        sys.exit(bool(benchmarks.compare(args.compare, args.tolerance)))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import argparse
+
+import django
+
+
+def parse_mix(value):
+    """:return: dict: weight per flow of e.g. 'register=3,login=4'"""
+    from benchmarks.bench_load import FLOWS
+
+    mix = {}
+    for part in value.split(','):
+        flow, _, weight = part.partition('=')
+        if flow.strip() not in FLOWS:
+            raise argparse.ArgumentTypeError(
+                'unknown flow {}, use {}'.format(flow, ', '.join(FLOWS)))
+        mix[flow.strip()] = float(weight or 1)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Load test of the samanta account flows')
+    parser.add_argument('--url', help='external server. By default one is '
+                                      'started on the test database')
+    parser.add_argument('--spool', help='MAIL_SPOOL_DIR of the external '
+                                        'server')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='virtual users per process')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='client processes')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds')
+    parser.add_argument('--mix', type=parse_mix, default=None,
+                        help='weight per flow, e.g. '
+                             'register=3,confirm=2,login=4,recover=1')
+    parser.add_argument('--duplicates', type=float, default=0.05,
+                        help='fraction of registrations reusing a username')
+    parser.add_argument('--double', type=float, default=0.1,
+                        help='fraction of links opened twice at once')
+    parser.add_argument('--json', help='stores the summary in this file')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                          'samanta.tests.test_settings')
+    django.setup()
+
+    from benchmarks.bench_load import load
+
+    summary = load(args.threads, args.processes, args.duration, args.mix,
+                   args.duplicates, args.double, args.url, args.spool)
+    if args.json:
+        with open(args.json, 'w') as stream:
+            json.dump(summary, stream, indent=2, sort_keys=True)
+    sys.exit(bool(summary['races']))
@@ -11,5 +11,5 @@ if __name__ == "__main__":
     django.setup()
     TestRunner = get_runner(settings)
     test_runner = TestRunner()
-    failures = test_runner.run_tests(["tests"])
+    failures = test_runner.run_tests(["samanta.tests"])
     sys.exit(bool(failures))
\ No newline at end of file
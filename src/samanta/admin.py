@@ -1,3 +1,228 @@
-from django.contrib import admin
+"""
+Admin for samanta. It is meant for tables with millions of rows:
 
-# Register your models here.
+* the paginators never run an unbounded COUNT(*)
+* the searches are prefix/exact ones, served by the indexes over the
+  normalized username and email (see migration 0003)
+* the bulk actions run a single UPDATE per batch instead of saving every
+  object
+"""
+
+from datetime import timedelta
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+from .conf import settings
+from .core import usercache, demographics, events
+from .models import (SamUser, Teams, UserCreationLog, PasswordRecoveryLog,
+                     EmailChangeLog, AccountToken)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that avoids counting big tables.
+
+    * Without filters on PostgreSQL, the planner statistics are used.
+    * Otherwise the rows are counted up to ADMIN_COUNT_LIMIT.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None:
+            return len(queryset)
+
+        connection = connections[queryset.db]
+        if not query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= settings.ADMIN_COUNT_LIMIT:
+                return int(row[0])
+
+        # COUNT(*) over a LIMIT subquery
+        return queryset.order_by()[:settings.ADMIN_COUNT_LIMIT].count()
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+def in_batches(queryset):
+    """Splits the selection in lists of primary keys of ADMIN_BATCH_SIZE
+
+    :return: iterator of lists
+    """
+    last_pk = None
+    queryset = queryset.order_by('pk')
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        ids = list(page.values_list('pk', flat=True)[:settings.ADMIN_BATCH_SIZE])
+        if not ids:
+            return
+        last_pk = ids[-1]
+        yield ids
+
+
+def bulk_update(queryset, event=None, event_data=None, **values):
+    """Runs one UPDATE per batch of the selection
+
+    :param event: str or None: account event emitted for every user, see
+    samanta.core.events
+    :param event_data: dict or None: details of the events
+    :return: int: amount of updated rows
+    """
+    model = queryset.model
+    updated = 0
+    for ids in in_batches(queryset):
+        with transaction.atomic():
+            if model is not SamUser:
+                updated += model.objects.filter(pk__in=ids).update(**values)
+                continue
+            # update() does not send post_save
+            with demographics.tracking(ids, values):
+                updated += model.objects.filter(pk__in=ids).update(**values)
+            usercache.invalidate(ids)
+            if event:
+                for pk in ids:
+                    events.emit(event, pk, **(event_data or {}))
+    return updated
+
+
+# ============================== Users ========================================
+class UserActionForm(ActionForm):
+    """Extra inputs of the user actions"""
+    days = forms.IntegerField(required=False, min_value=1,
+                              label=_('Ban days'))
+    team = forms.ModelChoiceField(queryset=Teams.objects.order_by('name'),
+                                  required=False, label=_('Team'))
+
+
+@admin.register(SamUser)
+class SamUserAdmin(ScalableAdmin):
+    list_display = ('username', 'email', 'is_active', 'is_staff', 'unban_time',
+                    'date_joined', 'team_names')
+    list_filter = ('is_active', 'is_staff')
+    search_fields = ('^username', '^email')
+    raw_id_fields = ('teams', 'groups', 'user_permissions')
+    readonly_fields = ('password', 'last_login', 'date_joined', 'activated_at',
+                       'updated_at')
+    fieldsets = (
+        (None, {'fields': ('username', 'password', 'email')}),
+        (_('Personal info'), {'fields': ('first_name', 'last_name',
+                                         'date_of_birth', 'location',
+                                         'language', 'gender', 'avatar')}),
+        (_('Status'), {'fields': ('is_active', 'unban_time', 'is_staff',
+                                  'is_superuser', 'teams', 'groups',
+                                  'user_permissions')}),
+        (_('Dates'), {'fields': ('last_login', 'date_joined', 'activated_at',
+                                 'updated_at')}),
+    )
+    action_form = UserActionForm
+    actions = ['ban', 'unban', 'activate', 'assign_team']
+
+    def get_queryset(self, request):
+        queryset = super(SamUserAdmin, self).get_queryset(request)
+        return queryset.prefetch_related('teams')
+
+    def team_names(self, user):
+        return ', '.join(team.name for team in user.teams.all())
+    team_names.short_description = _('teams')
+
+    def ban(self, request, queryset):
+        form = self.action_form(request.POST)
+        # the action choices are not needed, just the days
+        form.is_valid()
+        if 'days' in form.errors:
+            self.message_user(request, _('Ban days: %s') % ' '.join(
+                form.errors['days']), messages.ERROR)
+            return
+        days = form.cleaned_data['days'] or settings.ADMIN_BAN_DAYS
+        until = timezone.now().date() + timedelta(days=days)
+        updated = bulk_update(queryset, event=events.BANNED,
+                              event_data={'until': until.isoformat()},
+                              unban_time=until, updated_at=timezone.now())
+        self.message_user(request, _('%(count)d users banned until %(until)s')
+                          % {'count': updated, 'until': until})
+    ban.short_description = _('Ban the selected users (Ban days)')
+
+    def unban(self, request, queryset):
+        updated = bulk_update(queryset, event=events.UNBANNED,
+                              unban_time=None, updated_at=timezone.now())
+        self.message_user(request, _('%d users unbanned') % updated)
+    unban.short_description = _('Unban the selected users')
+
+    def activate(self, request, queryset):
+        now = timezone.now()
+        updated = bulk_update(queryset.filter(is_active=False),
+                              event=events.ACTIVATED, is_active=True,
+                              activated_at=now, updated_at=now)
+        self.message_user(request, _('%d users activated') % updated)
+    activate.short_description = _('Activate the selected users')
+
+    def assign_team(self, request, queryset):
+        form = self.action_form(request.POST)
+        form.is_valid()
+        if 'team' in form.errors:
+            self.message_user(request, _('Team: %s') % ' '.join(
+                form.errors['team']), messages.ERROR)
+            return
+        team = form.cleaned_data['team']
+        if team is None:
+            self.message_user(request, _('Select a team first.'),
+                              messages.WARNING)
+            return
+        team_id = team.pk
+        through = SamUser.teams.through
+        added = 0
+        for ids in in_batches(queryset):
+            with transaction.atomic():
+                present = set(through.objects.filter(
+                    teams_id=team_id, samuser_id__in=ids).values_list(
+                    'samuser_id', flat=True))
+                through.objects.bulk_create(
+                    through(samuser_id=pk, teams_id=team_id)
+                    for pk in ids if pk not in present)
+                usercache.invalidate(pk for pk in ids if pk not in present)
+            added += len(ids) - len(present)
+        self.message_user(request, _('%d users added to the team') % added)
+    assign_team.short_description = _('Add the selected users to a team '
+                                      '(Team)')
+
+
+@admin.register(Teams)
+class TeamsAdmin(ScalableAdmin):
+    list_display = ('name',)
+    search_fields = ('^name',)
+    raw_id_fields = ('permissions',)
+
+
+# ============================== Tokens =======================================
+class TokenAdmin(ScalableAdmin):
+    list_display = ('user', 'email', 'date', 'status')
+    list_filter = ('status',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('^email', '=user__username')
+    readonly_fields = ('token', 'salt', 'date')
+
+
+admin.site.register(UserCreationLog, TokenAdmin)
+admin.site.register(PasswordRecoveryLog, TokenAdmin)
+admin.site.register(EmailChangeLog, TokenAdmin)
+
+
+@admin.register(AccountToken)
+class AccountTokenAdmin(TokenAdmin):
+    list_display = ('user', 'purpose', 'email', 'date', 'status')
+    list_filter = ('purpose', 'status')
@@ -1,9 +1,13 @@
 from django.apps import AppConfig
-from constants import APP_NAME
 
 
 class SamantaConfig(AppConfig):
     """
     Default class for the configurations needed to be carried by the app
     """
-    name = APP_NAME
+    name = 'samanta'
+
+    def ready(self):
+        # connects the invalidation of the cached users and the summary of
+        # the demographics
+        from .core import usercache, demographics  # noqa
@@ -0,0 +1,51 @@
+"""
+Authentication backends of samanta. Use one of them instead of the
+ModelBackend, e.g.:
+
+    AUTHENTICATION_BACKENDS = ['samanta.backends.CachedModelBackend']
+
+* SamModelBackend: the ModelBackend, honoring SLIM_USERS.
+* CachedModelBackend: serves the users from the shared cache USER_CACHE, see
+  samanta.core.usercache. Both the users of the sessions (``request.user``)
+  and the logins are served from the cache.
+
+The permissions are checked as in the ModelBackend.
+"""
+
+from django.contrib.auth.backends import ModelBackend
+
+from .core import usercache
+from .models import SamUser
+
+
+class SamModelBackend(ModelBackend):
+
+    def get_user(self, user_id):
+        try:
+            user = SamUser._default_manager.for_auth().get(pk=user_id)
+        except SamUser.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+class CachedModelBackend(SamModelBackend):
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(SamUser.USERNAME_FIELD)
+        user = usercache.get_by_natural_key(username) \
+            if username is not None else None
+        if user is None:
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user.
+            SamUser().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        user = usercache.get(user_id)
+        if user is not None and self.user_can_authenticate(user):
+            return user
+        return None
@@ -3,22 +3,51 @@ General configurations, it contains all the settings that can be imported
 within the app and correspond to the fall back for those configurations
 """
 import django.conf
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_MISSING = object()
 
 
 class AppSettings(object):
     """
     A holder for app-specific default settings that allows overriding via
     the project's settings.
+
+    Resolved values are memoized, so only the first access of a setting goes
+    through django's ``LazySettings``. The memo is dropped whenever django
+    emits ``setting_changed`` (e.g. ``override_settings`` in tests).
     """
 
+    def __init__(self):
+        self._cache = {}
+
     def __getattribute__(self, attr):
         if attr == attr.upper():
+            cache = super(AppSettings, self).__getattribute__('_cache')
             try:
-                return getattr(django.conf.settings, attr)
-            except AttributeError:
+                return cache[attr]
+            except KeyError:
                 pass
+            value = getattr(django.conf.settings, attr, _MISSING)
+            if value is _MISSING:
+                value = super(AppSettings, self).__getattribute__(attr)
+            cache[attr] = value
+            return value
         return super(AppSettings, self).__getattribute__(attr)
 
+    def clear_cache(self, setting=None):
+        """Forgets the memoized values.
+
+        :param setting: str: name of the setting to forget. If None, all the
+        memoized values are dropped.
+        :return: None
+        """
+        if setting is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(setting, None)
+
 
 class Settings(AppSettings):
 
@@ -28,6 +57,24 @@ class Settings(AppSettings):
     USE_CAPTCHA = True
     """If True, simple captcha will be used with the register forms"""
 
+    USE_CAPTCHA_POOL = False
+    """If True, with USE_CAPTCHA, the captcha challenges come from the pool
+    kept in the cache by samanta_captcha_pool instead of the database of the
+    captcha app"""
+
+    CAPTCHA_POOL_SIZE = 500
+    """Challenges kept in the pool"""
+
+    CAPTCHA_POOL_TTL = 3600
+    """Seconds a challenge stays in the pool. samanta_captcha_pool --loop
+    should refill it more often"""
+
+    CAPTCHA_TIMEOUT = 600
+    """Seconds a rendered register form can be answered"""
+
+    CAPTCHA_CACHE = 'default'
+    """Cache alias shared by the processes to keep the pool"""
+
     DEFAULT_MAIL_LANG = 'en'  # english
     """Default language to send the emails if the user has not selected any"""
 
@@ -40,10 +87,184 @@ class Settings(AppSettings):
     MAIL_TEMPLATES_FOLDER = 'samanta/emails/'
     """Default folder to hold the email templates"""
 
+    MAIL_BACKEND = None
+    """Email backend of the samanta emails, e.g.
+    'samanta.core.mailer.spool.SpoolEmailBackend'. None uses EMAIL_BACKEND"""
+
+    MAIL_SPOOL_DIR = None
+    """Maildir like folder of the SpoolEmailBackend, drained by
+    samanta_mail_spool"""
+
+    MAIL_SPOOL_FSYNC = True
+    """If True the spooled messages are synced to the disk before they are
+    visible to the drainer"""
+
+    MAIL_SPOOL_STALE = 600
+    """Seconds after which a message claimed by a drainer that did not
+    finish is sent again"""
+
     TEAM_NAME = 'Samanta Team'
     """Name of the team signing the emails"""
 
     TOKEN_SPAN_VALIDITY = 7
     """Amount of days that a token will valid to be used"""
 
+    ENFORCE_QUERY_BUDGETS = None
+    """If True the views fail when they run more queries than their
+    MAX_QUERIES. None follows DEBUG"""
+
+    PROFILE_DIR = None
+    """Folder where TimingMiddleware dumps the cProfile output of the slowest
+    requests. None disables the profiling"""
+
+    PROFILE_SAMPLE_RATE = 0.01
+    """Fraction of the requests run under cProfile when PROFILE_DIR is set"""
+
+    PROFILE_SLOWEST_PERCENT = 5
+    """Just the profiled requests within the slowest given percent are
+    dumped"""
+
+    METRICS_DIR = None
+    """Folder shared by the worker processes to add up their metrics. None
+    keeps the metrics per process"""
+
+    METRICS_FLUSH_INTERVAL = 5
+    """Seconds between the writes of the metrics of a process into
+    METRICS_DIR"""
+
+    EXPOSE_METRICS = False
+    """If True the metrics endpoint is added to the samanta urls"""
+
+    PURGE_INACTIVE_AFTER = 30
+    """Days after which never activated accounts can be purged"""
+
+    EXPORT_OVERLAP = 300
+    """Seconds before the point where the previous incremental export of
+    samanta_export_users stopped that are read again. They cover the rows
+    committed late with an earlier updated_at. The rows already exported are
+    skipped"""
+
+    ADMIN_COUNT_LIMIT = 10000
+    """The admin lists count the rows up to this value"""
+
+    ADMIN_BATCH_SIZE = 1000
+    """Rows changed per UPDATE by the admin bulk actions"""
+
+    ADMIN_BAN_DAYS = 30
+    """Default length of the bans applied from the admin"""
+
+    TOKEN_STORES = {}
+    """Dotted path of the token store per token purpose ('register',
+    'password_recovery', 'email_change'). By default the tokens are kept in
+    the database. E.g.:
+    {'password_recovery': 'samanta.core.tokens.CacheTokenStore'}"""
+
+    DEFAULT_TOKEN_STORE = 'samanta.core.tokens.DatabaseTokenStore'
+    """Token store of the purposes not listed in TOKEN_STORES. Set it to
+    'samanta.core.tokens.UnifiedTokenStore' to use the AccountToken table"""
+
+    TOKEN_CACHE = 'default'
+    """Cache alias used by the CacheTokenStore"""
+
+    TOKEN_COOLDOWNS = {
+        'password_recovery': (300, 1),
+        'email_change': (300, 1, 3),
+    }
+    """Cooldown per token purpose as (window in seconds, tokens allowed
+    within the window). Repeated requests within the window are answered
+    without sending anything. Purposes not listed have no cooldown. The
+    purposes sending the token to a new address (email_change) count it
+    per address, and a third item limits the tokens of a user to any
+    address, by default the same limit"""
+
+    COOLDOWN_CACHE = 'default'
+    """Cache alias shared by the processes to track the cooldowns"""
+
+    DATABASE_REPLICAS = []
+    """Database aliases of the read replicas used by
+    samanta.routers.ReplicaRouter"""
+
+    REPLICA_PIN_SECONDS = 5
+    """Seconds a client keeps reading from the primary after a write. It
+    should exceed the replication lag"""
+
+    REPLICA_PIN_COOKIE = 'samanta_pin'
+    """Cookie used by the ReplicaPinMiddleware"""
+
+    USER_CACHE = 'default'
+    """Cache alias shared by the processes to keep the users loaded by the
+    CachedModelBackend"""
+
+    USER_CACHE_TIMEOUT = 300
+    """Seconds a cached user is kept"""
+
+    SLIM_USERS = False
+    """If True the authentication backends of samanta load just the
+    SLIM_USER_FIELDS of the users"""
+
+    SLIM_USER_FIELDS = ('id', 'username', 'password', 'is_active', 'is_staff',
+                        'is_superuser', 'unban_time')
+    """Columns needed to authenticate and authorize a request. The password
+    is used to verify the session"""
+
+    AVATAR_SIZES = (40, 100, 200)
+    """Sizes in px of the square variants generated for the avatars"""
+
+    AVATAR_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+    """Accepted formats of the uploaded avatars, as named by Pillow"""
+
+    AVATAR_MAX_BYTES = 5 * 1024 * 1024
+    """Maximum size of an uploaded avatar"""
+
+    AVATAR_MAX_PIXELS = 4096 * 4096
+    """Maximum width * height of an uploaded avatar. It bounds the memory
+    used to decode it"""
+
+    AVATAR_QUALITY = 85
+    """Quality of the WebP or JPEG variants"""
+
+    AVATAR_WORKERS = 1
+    """Threads generating the variants after the uploads. With 0 nothing is
+    generated in the web processes, run samanta_avatar_variants instead"""
+
+    AVATAR_CACHE = 'default'
+    """Cache alias keeping the URLs of the existing variants"""
+
+    AVATAR_DEDUPE = True
+    """If True the avatars are stored once per content, under their digest"""
+
+    AVATAR_GC_GRACE = 24
+    """Hours an unreferenced avatar file is kept before samanta_avatar_gc
+    deletes it. It covers the uploads whose user is not saved yet"""
+
+    DEMOGRAPHICS = False
+    """If True the DemographicCount summary is kept up to date with the
+    changes of the users. Run samanta_demographics after enabling it"""
+
+    DEMOGRAPHICS_FLUSH_INTERVAL = 10
+    """Seconds a process buffers the changes of the demographics before
+    adding them to the summary"""
+
+    EVENT_SINKS = []
+    """Dotted paths of the sinks of the account events, see
+    samanta.core.events. Empty disables the events"""
+
+    EVENTS_BATCH_SIZE = 100
+    """Events handed to a sink at once"""
+
+    EVENTS_FLUSH_INTERVAL = 1
+    """Maximum seconds the events wait in the queue of a process"""
+
+    EVENTS_MAX_PENDING = 100000
+    """Events kept per failing sink. The oldest ones are dropped beyond it"""
+
+    EVENTS_SPOOL_FILE = None
+    """File the SpoolSink appends the events to"""
+
 settings = Settings()
+
+
+@receiver(setting_changed)
+def reload_settings(setting=None, **kwargs):
+    """Keeps the memoized settings in sync with ``override_settings``"""
+    settings.clear_cache(setting)
@@ -2,7 +2,7 @@
 idea is not to hardcode anything
 """
 
-from django.utils.translation import gettext as _
+from django.utils.translation import gettext_lazy as _
 from cgm_tools.constants import LabeledEnum
 
 APP_NAME = 'samantha'
@@ -0,0 +1,206 @@
+"""
+Avatar pipeline:
+
+* :func:`inspect` validates an upload reading just the image header: the
+  pixels are never decoded in the request.
+* once the user is saved, :func:`schedule` hands the stored upload to a
+  background worker that writes a square variant per AVATAR_SIZES, as WebP
+  if Pillow supports it or as JPEG otherwise.
+* :func:`url` returns the variant closest to the requested size, or the
+  gravatar of the user until the variants exist.
+
+The decoding memory is bounded by AVATAR_MAX_PIXELS, and JPEG uploads are
+decoded directly at a reduced scale (``Image.draft``). The command
+samanta_avatar_variants generates the missing variants in batch, e.g. when
+the workers run in a separate process.
+"""
+
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from samanta.conf import settings
+
+logger = logging.getLogger('samanta.avatars')
+
+CACHE_KEY = 'samanta:avatar:{}'
+
+_executor = None
+
+
+class InvalidAvatar(ValueError):
+    """The upload is not an accepted image. The args are a message and a
+    code, like the ValidationErrors"""
+
+
+def inspect(upload):
+    """Validates the format and dimensions of an upload from its header
+
+    :param upload: file: uploaded file
+    :return: tuple: (format, (width, height))
+    :raise InvalidAvatar: if the upload is not accepted
+    """
+    size = getattr(upload, 'size', None)
+    if size is not None and size > settings.AVATAR_MAX_BYTES:
+        raise InvalidAvatar('The image is too big', 'file_size')
+    position = upload.tell()
+    try:
+        # lazy: it reads the header only, the pixels stay undecoded
+        image = Image.open(upload)
+        format_, dimensions = image.format, image.size
+    except Exception:
+        raise InvalidAvatar('Upload a valid image', 'invalid_image')
+    finally:
+        upload.seek(position)
+    if format_ not in settings.AVATAR_FORMATS:
+        raise InvalidAvatar('Unsupported image format', 'invalid_format')
+    width, height = dimensions
+    if width * height > settings.AVATAR_MAX_PIXELS:
+        raise InvalidAvatar('The image dimensions are too big', 'dimensions')
+    return format_, dimensions
+
+
+def output_format():
+    """:return: tuple: (Pillow format, extension) of the variants"""
+    Image.init()
+    if 'WEBP' in Image.SAVE:
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def variant_name(name, size):
+    """Storage name of a variant of the stored avatar ``name``"""
+    folder, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return '{}/sizes/{}_{}.{}'.format(folder, stem, size, output_format()[1])
+
+
+def closest_size(size):
+    """:return: int: smallest configured size not below the given one"""
+    sizes = sorted(settings.AVATAR_SIZES)
+    for candidate in sizes:
+        if candidate >= size:
+            return candidate
+    return sizes[-1]
+
+
+def _storage():
+    from samanta.models import SamUser
+    return SamUser._meta.get_field('avatar').storage
+
+
+def _cache():
+    return caches[settings.AVATAR_CACHE]
+
+
+def url(user, size=100):
+    """URL of the avatar of the user for the given size
+
+    :param user: SamUser
+    :param size: int: displayed size in px
+    :return: str: variant URL, or the gravatar until the variants exist
+    """
+    name = user.avatar.name if user.avatar else None
+    if not name:
+        return user.gravatar(size)
+    variant = variant_name(name, closest_size(size))
+    cache = _cache()
+    key = CACHE_KEY.format(variant)
+    value = cache.get(key)
+    if value is None:
+        storage = _storage()
+        # the negative answers are not cached, the variant may come soon
+        if not storage.exists(variant):
+            return user.gravatar(size)
+        value = storage.url(variant)
+        cache.set(key, value, None)
+    return value
+
+
+def process(name):
+    """Writes the variants of a stored avatar. Decoding happens once, at the
+    smallest scale that still covers the biggest variant.
+
+    :param name: str: storage name of the uploaded avatar
+    :return: list of str: names of the written variants
+    """
+    storage = _storage()
+    format_, _ = output_format()
+    sizes = sorted(settings.AVATAR_SIZES, reverse=True)
+    written = []
+    with storage.open(name, 'rb') as stream:
+        image = Image.open(stream)
+        image.draft('RGB', (sizes[0], sizes[0]))
+        image = ImageOps.exif_transpose(image) \
+            if hasattr(ImageOps, 'exif_transpose') else image
+        image = image.convert('RGBA' if format_ == 'WEBP' else 'RGB')
+        for size in sizes:
+            image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            data = io.BytesIO()
+            image.save(data, format_, quality=settings.AVATAR_QUALITY)
+            variant = variant_name(name, size)
+            if storage.exists(variant):
+                storage.delete(variant)
+            storage.save(variant, ContentFile(data.getvalue()))
+            _cache().delete(CACHE_KEY.format(variant))
+            written.append(variant)
+    return written
+
+
+def discard(name):
+    """Deletes the variants of a replaced avatar"""
+    storage = _storage()
+    for size in settings.AVATAR_SIZES:
+        variant = variant_name(name, size)
+        storage.delete(variant)
+        _cache().delete(CACHE_KEY.format(variant))
+
+
+def has_variants(name):
+    """:return: bool: True if all the variants of the avatar exist"""
+    storage = _storage()
+    return all(storage.exists(variant_name(name, size))
+               for size in settings.AVATAR_SIZES)
+
+
+def _run(name, previous):
+    from samanta.models import SamUser
+    # the worker threads keep their own connections, e.g. with CONN_MAX_AGE
+    close_old_connections()
+    try:
+        # the stored files can be shared by several users, see
+        # samanta.storage
+        if previous and not SamUser.objects.filter(avatar=previous).exists():
+            discard(previous)
+        if name and not has_variants(name):
+            process(name)
+    except Exception:
+        logger.exception('the variants of the avatar %s failed', name)
+    finally:
+        close_old_connections()
+
+
+def schedule(name, previous=None):
+    """Generates the variants in the background worker once the current
+    transaction is committed
+
+    :param name: str or None: storage name of the new avatar
+    :param previous: str or None: storage name of the replaced avatar
+    :return: None
+    """
+    if not settings.AVATAR_WORKERS:
+        # processed by samanta_avatar_variants
+        return
+
+    def submit():
+        global _executor
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.AVATAR_WORKERS)
+        _executor.submit(_run, name, previous)
+    transaction.on_commit(submit)
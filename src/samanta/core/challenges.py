@@ -0,0 +1,174 @@
+"""
+Pool of captcha challenges kept in the shared cache CAPTCHA_CACHE, used by
+the register form when USE_CAPTCHA_POOL is True.
+
+The command samanta_captcha_pool renders the images ahead of time and fills
+CAPTCHA_POOL_SIZE slots. Rendering a form then costs one cache read: a slot
+is picked at random and the form carries a signed token naming the
+challenge. Nothing is rendered and nothing is written, neither in the
+database nor in the cache. A token can be answered once, within
+CAPTCHA_TIMEOUT seconds, and a challenge is retired by its first right
+answer: its slot is emptied, so the next form picking it gets a new one.
+The other forms already showing it have to be answered again.
+
+The challenges and fonts are the ones configured for django-simple-captcha.
+"""
+
+import io
+import uuid
+import random
+import logging
+
+from django.core import signing
+from django.core.cache import caches
+
+from samanta.conf import settings
+
+logger = logging.getLogger('samanta.captcha')
+
+SLOT_KEY = 'samanta:captcha:slot:{}'
+CHALLENGE_KEY = 'samanta:captcha:challenge:{}'
+USED_KEY = 'samanta:captcha:used:{}'
+SOLVED_KEY = 'samanta:captcha:solved:{}'
+SALT = 'samanta.captcha'
+
+
+def _cache():
+    return caches[settings.CAPTCHA_CACHE]
+
+
+def render(text):
+    """Renders the image of a challenge with the settings of
+    django-simple-captcha
+
+    :param text: str: challenge
+    :return: bytes: PNG image
+    """
+    from captcha.conf import settings as captcha_settings
+    from PIL import Image, ImageDraw, ImageFont
+
+    font_path = captcha_settings.CAPTCHA_FONT_PATH
+    if isinstance(font_path, (list, tuple)):
+        font_path = random.choice(font_path)
+    font = ImageFont.truetype(font_path, captcha_settings.CAPTCHA_FONT_SIZE)
+
+    glyphs = []
+    for char in text:
+        left, top, right, bottom = font.getbbox(' {} '.format(char))
+        glyph = Image.new('L', (right, bottom), 0)
+        ImageDraw.Draw(glyph).text((0, 0), ' {} '.format(char), font=font,
+                                   fill=255)
+        if captcha_settings.CAPTCHA_LETTER_ROTATION:
+            glyph = glyph.rotate(
+                random.randrange(*captcha_settings.CAPTCHA_LETTER_ROTATION),
+                resample=Image.BICUBIC)
+        glyphs.append(glyph.crop(glyph.getbbox()) if glyph.getbbox()
+                      else glyph)
+
+    width = sum(glyph.size[0] + 2 for glyph in glyphs) + 4
+    height = max(glyph.size[1] for glyph in glyphs) + 8
+    image = Image.new('RGB', (width, height),
+                      captcha_settings.CAPTCHA_BACKGROUND_COLOR
+                      if captcha_settings.CAPTCHA_BACKGROUND_COLOR !=
+                      'transparent' else '#ffffff')
+    x = 2
+    for glyph in glyphs:
+        image.paste(captcha_settings.CAPTCHA_FOREGROUND_COLOR,
+                    (x, 4, x + glyph.size[0], 4 + glyph.size[1]), glyph)
+        x += glyph.size[0] + 2
+
+    draw = ImageDraw.Draw(image)
+    for noise in captcha_settings.noise_functions():
+        draw = noise(draw, image)
+    for image_filter in captcha_settings.filter_functions():
+        image = image_filter(image)
+
+    data = io.BytesIO()
+    image.save(data, 'PNG')
+    return data.getvalue()
+
+
+def generate():
+    """Creates and stores a new challenge
+
+    :return: str: id of the challenge
+    """
+    from captcha.conf import settings as captcha_settings
+
+    text, response = captcha_settings.get_challenge()()
+    challenge_id = uuid.uuid4().hex
+    # outlives the slot, the forms already rendered can still be answered
+    _cache().set(CHALLENGE_KEY.format(challenge_id),
+                 {'response': response.lower(), 'image': render(text)},
+                 settings.CAPTCHA_POOL_TTL + settings.CAPTCHA_TIMEOUT)
+    return challenge_id
+
+
+def fill(size=None):
+    """Replaces every slot of the pool with a new challenge
+
+    :param size: int or None: slots. By default CAPTCHA_POOL_SIZE
+    :return: int: amount of generated challenges
+    """
+    size = settings.CAPTCHA_POOL_SIZE if size is None else size
+    cache = _cache()
+    for slot in range(size):
+        cache.set(SLOT_KEY.format(slot), generate(), settings.CAPTCHA_POOL_TTL)
+    return size
+
+
+def pick():
+    """Challenge for a new form, from a random slot of the pool. If the slot
+    is empty a challenge is generated right away, which is logged since the
+    pool should be kept full by samanta_captcha_pool.
+
+    :return: tuple: (challenge id, signed token)
+    """
+    slot = random.randrange(settings.CAPTCHA_POOL_SIZE)
+    challenge_id = _cache().get(SLOT_KEY.format(slot))
+    if challenge_id is None:
+        logger.warning('captcha pool slot %s is empty, generating', slot)
+        challenge_id = generate()
+        _cache().set(SLOT_KEY.format(slot), challenge_id,
+                     settings.CAPTCHA_POOL_TTL)
+    token = signing.dumps([challenge_id, uuid.uuid4().hex, slot], salt=SALT)
+    return challenge_id, token
+
+
+def image(challenge_id):
+    """:return: bytes or None: PNG of the challenge, None if it expired"""
+    data = _cache().get(CHALLENGE_KEY.format(challenge_id))
+    return data['image'] if data else None
+
+
+def check(token, answer):
+    """Validates the answer of a form. The token is consumed, also by a
+    wrong answer, and the challenge by a right one.
+
+    :param token: str: signed token sent with the form
+    :param answer: str: answer of the user
+    :return: bool: True if right
+    """
+    try:
+        challenge_id, nonce, slot = signing.loads(
+            token, salt=SALT, max_age=settings.CAPTCHA_TIMEOUT)
+    except (signing.BadSignature, ValueError, TypeError):
+        return False
+    cache = _cache()
+    data = cache.get(CHALLENGE_KEY.format(challenge_id))
+    if not data:
+        return False
+    if not cache.add(USED_KEY.format(nonce), True, settings.CAPTCHA_TIMEOUT):
+        # replayed
+        return False
+    if (answer or '').strip().lower() != data['response']:
+        return False
+    if not cache.add(SOLVED_KEY.format(challenge_id), True,
+                     settings.CAPTCHA_POOL_TTL + settings.CAPTCHA_TIMEOUT):
+        # answered by another form first
+        return False
+    cache.delete(CHALLENGE_KEY.format(challenge_id))
+    slot_key = SLOT_KEY.format(slot)
+    if cache.get(slot_key) == challenge_id:
+        cache.delete(slot_key)
+    return True
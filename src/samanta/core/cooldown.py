@@ -0,0 +1,87 @@
+"""
+Cooldown of the requests that send a token by email. Within the window of a
+purpose, a user gets at most ``limit`` tokens; any other request is coalesced
+with the previous ones: no token is generated, nothing is written and no
+email is sent. The counters live in the shared cache COOLDOWN_CACHE, so the
+limit holds across processes.
+
+The windows and limits are set per purpose in TOKEN_COOLDOWNS. A request
+sending the token to another address than the user email, e.g. an email
+change, is counted per target address, so a corrected address is not
+coalesced with the mistyped one. The tokens sent to any address are still
+limited per user, by the optional third item of the setting.
+"""
+
+import hashlib
+
+from django.core.cache import caches
+
+from samanta.conf import settings
+from samanta.core.metrics import TOKEN_REQUESTS
+
+KEY = 'samanta:cooldown:{purpose}:{user_id}'
+
+
+def _key(purpose, user_id, target=None):
+    key = KEY.format(purpose=purpose, user_id=user_id)
+    if target:
+        # any address is a valid cache key once hashed
+        key += ':' + hashlib.md5(
+            target.strip().lower().encode('utf-8')).hexdigest()
+    return key
+
+
+def _count(cache, key, window):
+    """Registers a request in the counter of the key
+
+    :return: int: requests within the window, including this one
+    """
+    # the window starts with the first request, incr does not extend it
+    if cache.add(key, 1, window):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # expired in between
+        cache.add(key, 1, window)
+        return 1
+
+
+def allow(purpose, user_id, target=None):
+    """Registers a request and tells if it must be processed
+
+    :param purpose: str: kind of token, e.g. 'password_recovery'
+    :param user_id: int: id of the user asking for the token
+    :param target: str or None: address the token is sent to, if it is not
+    the one of the user
+    :return: bool: False if the request is within the cooldown
+    """
+    config = settings.TOKEN_COOLDOWNS.get(purpose)
+    if not config:
+        return True
+    window, limit = config[:2]
+    cache = caches[settings.COOLDOWN_CACHE]
+
+    allowed = _count(cache, _key(purpose, user_id, target), window) <= limit
+    if allowed and target:
+        # a new address every time must not get around the cooldown
+        user_limit = config[2] if len(config) > 2 else limit
+        allowed = _count(cache, _key(purpose, user_id), window) <= user_limit
+    TOKEN_REQUESTS.inc(purpose, 'allowed' if allowed else 'suppressed')
+    return allowed
+
+
+def release(purpose, user_id, target=None):
+    """Forgets the requests of the user, e.g. if the email could not be sent
+    and the user has to be able to try again right away
+    """
+    if not settings.TOKEN_COOLDOWNS.get(purpose):
+        return
+    cache = caches[settings.COOLDOWN_CACHE]
+    cache.delete(_key(purpose, user_id, target))
+    if target:
+        # just this request, the others to any address still count
+        try:
+            cache.decr(_key(purpose, user_id))
+        except ValueError:
+            pass
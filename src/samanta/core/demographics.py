@@ -0,0 +1,321 @@
+"""
+Summary of the users by gender, location, language, activity and ban, kept
+in the DemographicCount table so the dashboards never group the users table.
+Enabled by DEMOGRAPHICS.
+
+Every saved or deleted user adds a delta (+1 to its current combination, -1
+to the previous one) to a buffer of the process once the transaction is
+committed. The buffer is added to the table, with one ``UPDATE ... SET count
+= count + delta`` per combination, every DEMOGRAPHICS_FLUSH_INTERVAL seconds
+by a thread of the process (or by the save that finds the interval over)
+and when the process exits. The flushes of several processes add up, so
+they do not need any coordination.
+
+The deltas of a killed process are lost, and a ban expires without any save,
+so the command samanta_demographics rebuilds the table from the users in
+chunks. Run it after enabling DEMOGRAPHICS, and e.g. daily.
+
+>>> from samanta.core import demographics
+>>> demographics.counts('location', is_active=True)
+{'CL': 120, 'AR': 42}
+"""
+
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db import close_old_connections, transaction
+from django.db.models import (BooleanField, Case, Count, F, Sum, Value,
+                              When)
+from django.db.models.signals import (post_init, pre_save, post_save,
+                                      pre_delete, post_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from samanta.conf import settings
+from samanta.models import SamUser, DemographicCount
+
+logger = logging.getLogger('samanta.demographics')
+
+DIMENSIONS = ('gender', 'location', 'language', 'is_active', 'is_banned')
+"""Columns of the summary, in the order of the keys"""
+
+SOURCE_FIELDS = ('gender', 'location', 'language', 'is_active', 'unban_time')
+"""Columns of the user the dimensions come from"""
+
+_UNKNOWN = object()
+
+
+def key(gender, location, language, is_active, unban_time, today=None):
+    """:return: tuple: combination of the dimensions of a user"""
+    today = today or timezone.now().date()
+    return (gender, str(location or ''), language or '', bool(is_active),
+            bool(unban_time and unban_time > today))
+
+
+def _instance_key(instance):
+    values = instance.__dict__
+    if any(name not in values for name in SOURCE_FIELDS):
+        # deferred
+        return _UNKNOWN
+    return key(*[values[name] for name in SOURCE_FIELDS])
+
+
+def _stored_key(pk):
+    row = SamUser._default_manager.filter(pk=pk).values_list(
+        *SOURCE_FIELDS).first()
+    return key(*row) if row else None
+
+
+class Buffer:
+    """Deltas of the process not yet added to the table"""
+
+    def __init__(self):
+        self.deltas = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.thread = None
+
+    def add(self, combination, delta):
+        with self.lock:
+            self.deltas[combination] = self.deltas.get(combination, 0) + delta
+            # also after a fork, the threads are not inherited
+            if settings.DEMOGRAPHICS_FLUSH_INTERVAL > 0 and (
+                    self.thread is None or not self.thread.is_alive()):
+                self.thread = threading.Thread(
+                    target=self.run, name='samanta-demographics')
+                self.thread.daemon = True
+                self.thread.start()
+        if time.monotonic() - self.last_flush >= \
+                settings.DEMOGRAPHICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def run(self):
+        """Flushes the deltas of an idle process too"""
+        while True:
+            # an interval of 0 is flushed by every add()
+            time.sleep(max(settings.DEMOGRAPHICS_FLUSH_INTERVAL, 1))
+            if not self.deltas or time.monotonic() - self.last_flush < \
+                    settings.DEMOGRAPHICS_FLUSH_INTERVAL:
+                continue
+            # the thread keeps its own connection
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Adds the pending deltas to the table
+
+        :return: int: amount of updated combinations
+        """
+        with self.lock:
+            deltas, self.deltas = self.deltas, {}
+            self.last_flush = time.monotonic()
+        deltas = {k: v for k, v in deltas.items() if v}
+        if not deltas:
+            return 0
+        try:
+            with transaction.atomic():
+                for combination, delta in sorted(deltas.items()):
+                    apply(combination, delta)
+        except Exception:
+            logger.exception('the demographics deltas could not be flushed')
+            # kept for the next flush
+            with self.lock:
+                for combination, delta in deltas.items():
+                    self.deltas[combination] = \
+                        self.deltas.get(combination, 0) + delta
+            return 0
+        return len(deltas)
+
+
+def apply(combination, delta):
+    """Adds a delta to the count of a combination, creating its row"""
+    filters = dict(zip(DIMENSIONS, combination))
+    if DemographicCount.objects.filter(**filters).update(
+            count=F('count') + delta):
+        return
+    _, created = DemographicCount.objects.get_or_create(
+        defaults={'count': delta}, **filters)
+    if not created:
+        # created by a concurrent flush
+        DemographicCount.objects.filter(**filters).update(
+            count=F('count') + delta)
+
+
+buffer = Buffer()
+atexit.register(buffer.flush)
+
+
+def flush():
+    """Adds the pending deltas of the process to the table"""
+    return buffer.flush()
+
+
+def _record(previous, current):
+    if previous == current:
+        return
+
+    def add():
+        if previous is not None:
+            buffer.add(previous, -1)
+        if current is not None:
+            buffer.add(current, 1)
+    transaction.on_commit(add)
+
+
+def _record_counts(before, after):
+    deltas = {combination: after.get(combination, 0) -
+              before.get(combination, 0)
+              for combination in set(before) | set(after)}
+
+    def add():
+        for combination, delta in deltas.items():
+            if delta:
+                buffer.add(combination, delta)
+    transaction.on_commit(add)
+
+
+def group(queryset):
+    """Counts the given users per combination in the database, like the
+    summary does
+
+    :param queryset: QuerySet: of SamUser
+    :return: dict: {combination: users}
+    """
+    today = timezone.now().date()
+    rows = queryset.annotate(is_banned=Case(
+        When(unban_time__gt=today, then=Value(True)), default=Value(False),
+        output_field=BooleanField())).values_list(
+        'gender', 'location', 'language', 'is_active', 'is_banned').annotate(
+        users=Count('pk')).order_by()
+    result = {}
+    for gender, location, language, is_active, is_banned, users in rows:
+        combination = (gender, str(location or ''), language or '',
+                       bool(is_active), bool(is_banned))
+        result[combination] = result.get(combination, 0) + users
+    return result
+
+
+@contextmanager
+def tracking(ids, fields=None):
+    """Records the changes of the given users done within the block by
+    queryset updates, which do not send post_save. Two grouped queries
+
+    :param ids: list of int: primary keys of the updated users
+    :param fields: iterable or None: updated columns, if known. Nothing is
+    tracked if none of them is a SOURCE_FIELDS
+    """
+    if not settings.DEMOGRAPHICS or (
+            fields is not None and not set(fields) & set(SOURCE_FIELDS)):
+        yield
+        return
+    users = SamUser._default_manager.filter(pk__in=ids)
+    before = group(users)
+    yield
+    _record_counts(before, group(users))
+
+
+def created(users):
+    """Records users inserted with ``bulk_create``, which does not send
+    post_save
+
+    :param users: list of SamUser
+    """
+    if settings.DEMOGRAPHICS:
+        after = {}
+        for user in users:
+            combination = _instance_key(user)
+            after[combination] = after.get(combination, 0) + 1
+        _record_counts({}, after)
+
+
+# ============================== queries ======================================
+def _check(names):
+    # the filters may use lookups, e.g. location__in
+    unknown = {name.split('__')[0] for name in names} - set(DIMENSIONS)
+    if unknown:
+        raise ValueError('Unknown dimensions {}, use {}'.format(
+            sorted(unknown), DIMENSIONS))
+
+
+def counts(*by, **filters):
+    """Amount of users per value of the given dimensions, read from the
+    summary only
+
+    :param by: str: dimensions to group by
+    :param filters: values of dimensions, e.g. is_active=True
+    :return: dict: {value: count} grouping by a dimension, {tuple of values:
+    count} grouping by several
+    """
+    if not by:
+        raise ValueError('Group by at least one of {}'.format(DIMENSIONS))
+    _check(by + tuple(filters))
+    rows = DemographicCount.objects.filter(**filters).values_list(
+        *by).annotate(total=Sum('count')).order_by()
+    result = {}
+    for row in rows:
+        if row[-1]:
+            result[row[0] if len(by) == 1 else row[:-1]] = row[-1]
+    return result
+
+
+def total(**filters):
+    """:return: int: amount of users with the given values of dimensions"""
+    _check(filters)
+    return DemographicCount.objects.filter(**filters).aggregate(
+        total=Sum('count'))['total'] or 0
+
+
+# ============================== signals ======================================
+@receiver(post_init, sender=SamUser, dispatch_uid='samanta_demographics_init')
+def _remember(sender, instance, **kwargs):
+    if settings.DEMOGRAPHICS:
+        instance._demographics = _instance_key(instance)
+
+
+@receiver(pre_save, sender=SamUser, dispatch_uid='samanta_demographics_pre')
+def _before_save(sender, instance, raw, update_fields=None, **kwargs):
+    if not settings.DEMOGRAPHICS or instance._state.adding:
+        return
+    if update_fields is not None and \
+            not set(update_fields).intersection(SOURCE_FIELDS):
+        # e.g. the last_login of every login
+        instance._demographics_skip = True
+        return
+    instance._demographics_skip = False
+    if getattr(instance, '_demographics', _UNKNOWN) is _UNKNOWN:
+        # loaded with deferred fields
+        instance._demographics = _stored_key(instance.pk)
+
+
+@receiver(post_save, sender=SamUser, dispatch_uid='samanta_demographics_save')
+def _saved(sender, instance, created, **kwargs):
+    if not settings.DEMOGRAPHICS or \
+            (not created and getattr(instance, '_demographics_skip', False)):
+        return
+    current = _instance_key(instance)
+    if current is _UNKNOWN:
+        current = _stored_key(instance.pk)
+    previous = None if created else getattr(instance, '_demographics', None)
+    _record(previous, current)
+    instance._demographics = current
+
+
+@receiver(pre_delete, sender=SamUser,
+          dispatch_uid='samanta_demographics_pre_delete')
+def _before_delete(sender, instance, **kwargs):
+    if settings.DEMOGRAPHICS and \
+            getattr(instance, '_demographics', _UNKNOWN) is _UNKNOWN:
+        instance._demographics = _stored_key(instance.pk)
+
+
+@receiver(post_delete, sender=SamUser,
+          dispatch_uid='samanta_demographics_delete')
+def _deleted(sender, instance, **kwargs):
+    if settings.DEMOGRAPHICS:
+        _record(getattr(instance, '_demographics', None), None)
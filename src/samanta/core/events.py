@@ -0,0 +1,255 @@
+"""
+Bus of the account events, so other services can react to them without
+hooking the views:
+
+>>> from samanta.core import events
+>>> events.emit(events.BANNED, user, until='2030-01-01')
+
+:func:`emit` just appends the event to an in process queue once the current
+transaction is committed (the events of a rollback are never sent). A
+background thread hands the queue in batches of EVENTS_BATCH_SIZE to every
+sink of EVENT_SINKS, at least every EVENTS_FLUSH_INTERVAL seconds, and once
+more when the process exits.
+
+Sinks are configured by dotted path, either a :class:`BaseSink` subclass or
+a plain callable receiving a list of events:
+
+* :class:`DatabaseSink`: the AccountEvent table.
+* :class:`SpoolSink`: appends JSON lines to EVENTS_SPOOL_FILE.
+
+The delivery is at least once: a batch stays pending for a sink until the
+sink accepts it, and is retried on the next flush. So the consumers must
+deduplicate by event id (DatabaseSink does). The events still queued when
+the process is killed are lost.
+"""
+
+import os
+import json
+import uuid
+import atexit
+import logging
+import threading
+from collections import deque
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from samanta.conf import settings
+
+logger = logging.getLogger('samanta.events')
+
+REGISTERED = 'registered'
+ACTIVATED = 'activated'
+EMAIL_CHANGED = 'email_changed'
+RECOVERY_REQUESTED = 'recovery_requested'
+PASSWORD_RECOVERED = 'password_recovered'
+BANNED = 'banned'
+UNBANNED = 'unbanned'
+
+TYPES = (REGISTERED, ACTIVATED, EMAIL_CHANGED, RECOVERY_REQUESTED,
+         PASSWORD_RECOVERED, BANNED, UNBANNED)
+"""Types of the account events"""
+
+
+class Event:
+    """Account event
+
+    :param type: str: one of TYPES
+    :param user_id: int: user the event is about
+    :param data: dict: JSON serializable details
+    """
+
+    __slots__ = ('id', 'type', 'user_id', 'data', 'date')
+
+    def __init__(self, type, user_id, data=None, id=None, date=None):
+        self.id = id or uuid.uuid4().hex
+        self.type = type
+        self.user_id = user_id
+        self.data = data or {}
+        self.date = date or timezone.now()
+
+    def as_dict(self):
+        return {'id': self.id, 'type': self.type, 'user_id': self.user_id,
+                'date': self.date.isoformat(), 'data': self.data}
+
+    def __repr__(self):
+        return '<Event {} {} user {}>'.format(self.type, self.id,
+                                             self.user_id)
+
+
+# ============================== sinks ========================================
+class BaseSink:
+    """Destination of the events"""
+
+    def deliver(self, events):
+        """Stores or forwards a batch. Raising keeps the batch pending.
+
+        :param events: list of Event
+        :return: None
+        """
+        raise NotImplementedError
+
+
+class CallableSink(BaseSink):
+    """Hands the batches to a function"""
+
+    def __init__(self, function):
+        self.function = function
+
+    def deliver(self, events):
+        self.function(events)
+
+
+class DatabaseSink(BaseSink):
+    """Stores the events in the AccountEvent table, skipping the ones of a
+    retried batch already stored"""
+
+    def deliver(self, events):
+        from samanta.models import AccountEvent
+
+        # the worker thread keeps its own connection
+        close_old_connections()
+        ids = [event.id for event in events]
+        with transaction.atomic():
+            stored = set(AccountEvent.objects.filter(
+                event_id__in=ids).values_list('event_id', flat=True))
+            AccountEvent.objects.bulk_create(
+                AccountEvent(event_id=event.id, type=event.type,
+                             user_id=event.user_id, date=event.date,
+                             data=json.dumps(event.data))
+                for event in events if event.id not in stored)
+
+
+class SpoolSink(BaseSink):
+    """Appends the events as JSON lines to EVENTS_SPOOL_FILE, synced to the
+    disk once per batch"""
+
+    def __init__(self, path=None):
+        self.path = path or settings.EVENTS_SPOOL_FILE
+
+    def deliver(self, events):
+        data = ''.join(json.dumps(event.as_dict()) + '\n'
+                       for event in events).encode('utf-8')
+        with open(self.path, 'ab') as stream:
+            stream.write(data)
+            stream.flush()
+            os.fsync(stream.fileno())
+
+
+_sinks = {}
+
+
+def get_sinks():
+    """:return: list of BaseSink: configured in EVENT_SINKS"""
+    paths = tuple(settings.EVENT_SINKS)
+    sinks = _sinks.get(paths)
+    if sinks is None:
+        sinks = []
+        for path in paths:
+            target = import_string(path)
+            if isinstance(target, type) and issubclass(target, BaseSink):
+                sinks.append(target())
+            else:
+                sinks.append(CallableSink(target))
+        _sinks[paths] = sinks
+    return sinks
+
+
+# ============================== bus ==========================================
+class Bus:
+    """Queue of the process and its delivery thread"""
+
+    def __init__(self):
+        self.queue = deque()
+        self.pending = {}
+        """Batches not yet accepted: {sink: list of events}"""
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+
+    def put(self, event):
+        self.queue.append(event)
+        if self.thread is None or not self.thread.is_alive():
+            # also after a fork, the threads are not inherited
+            self.start()
+        if len(self.queue) >= settings.EVENTS_BATCH_SIZE:
+            self.wakeup.set()
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run,
+                                           name='samanta-events')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(settings.EVENTS_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('the events could not be flushed')
+
+    def flush(self):
+        """Hands the queued and pending events to the sinks
+
+        :return: int: amount of events still pending for some sink
+        """
+        with self.flush_lock:
+            batch = []
+            while self.queue:
+                batch.append(self.queue.popleft())
+            sinks = get_sinks()
+            for sink in sinks:
+                pending = self.pending.setdefault(sink, [])
+                pending.extend(batch)
+                self.deliver(sink, pending)
+            return sum(len(self.pending[sink]) for sink in sinks)
+
+    def deliver(self, sink, pending):
+        size = settings.EVENTS_BATCH_SIZE
+        while pending:
+            try:
+                sink.deliver(pending[:size])
+            except Exception:
+                logger.exception('%s failed, %d events kept', sink,
+                                 len(pending))
+                break
+            del pending[:size]
+        excess = len(pending) - settings.EVENTS_MAX_PENDING
+        if excess > 0:
+            logger.error('%s is too far behind, %d events dropped', sink,
+                         excess)
+            del pending[:excess]
+
+
+bus = Bus()
+atexit.register(bus.flush)
+
+
+def emit(type, user, **data):
+    """Emits an account event once the current transaction is committed
+
+    :param type: str: one of TYPES
+    :param user: SamUser or int: user the event is about
+    :param data: JSON serializable details of the event
+    :return: Event or None if there are no EVENT_SINKS
+    """
+    if type not in TYPES:
+        raise ValueError('Unknown event type {}, use one of {}'.format(
+            type, TYPES))
+    if not settings.EVENT_SINKS:
+        return None
+    event = Event(type, getattr(user, 'pk', user), data)
+    transaction.on_commit(lambda: bus.put(event))
+    return event
+
+
+def flush():
+    """Delivers the queued events right away, see :meth:`Bus.flush`"""
+    return bus.flush()
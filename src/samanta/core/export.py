@@ -0,0 +1,403 @@
+"""
+Streaming export of everything samanta stores about a user. The records are
+produced lazily with ``.iterator()`` and ``.values()``, so the memory used does
+not depend on the amount of token rows of the user.
+
+The records are dictionaries with a ``type`` key: 'user', 'team', or the
+PURPOSE of the token model for the token logs.
+"""
+
+import json
+import zipfile
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.fields.files import FieldFile
+
+from samanta.conf import settings
+from samanta.models import (SamUser, UserCreationLog, PasswordRecoveryLog,
+                            EmailChangeLog, AccountToken)
+
+TOKEN_MODELS = (UserCreationLog, PasswordRecoveryLog, EmailChangeLog)
+
+USER_EXCLUDE = ('password',)
+"""Columns of the user never exported"""
+
+TOKEN_FIELDS = ('id', 'email', 'date', 'status')
+"""Columns of the token logs exported. The digest and salt stay private"""
+
+FORMATS = ('ndjson', 'zip')
+
+JSON_TYPES = (str, int, float, bool, type(None), datetime.date)
+
+
+def _dumps(record):
+    return json.dumps(record, cls=DjangoJSONEncoder, sort_keys=True)
+
+
+def user_record(user):
+    """:return: dict: exportable columns of the user"""
+    record = {'type': 'user'}
+    for field in SamUser._meta.concrete_fields:
+        if field.name in USER_EXCLUDE:
+            continue
+        value = field.value_from_object(user)
+        if isinstance(value, FieldFile):
+            value = value.name or None
+        elif not isinstance(value, JSON_TYPES):
+            # e.g. countries
+            value = str(value)
+        record[field.name] = value
+    return record
+
+
+def team_records(user):
+    teams = user.teams.order_by('pk').values('id', 'name')
+    for team in teams.iterator():
+        team['type'] = 'team'
+        yield team
+
+
+def token_records(user, model):
+    """Tokens of the kind of the model, from its own table and from the
+    unified AccountToken table"""
+    tables = (
+        model.objects.filter(user=user),
+        AccountToken.objects.filter(user=user, purpose=model.PURPOSE),
+    )
+    for queryset in tables:
+        rows = queryset.order_by('pk').values(*TOKEN_FIELDS)
+        for row in rows.iterator():
+            row['type'] = model.PURPOSE
+            yield row
+
+
+def sections(user):
+    """Groups of records of the user, in the order they are exported
+
+    :return: iterator of tuples (name, iterator of dict)
+    """
+    yield 'user', iter([user_record(user)])
+    yield 'teams', team_records(user)
+    for model in TOKEN_MODELS:
+        yield model.PURPOSE, token_records(user, model)
+
+
+def records(user):
+    """:return: iterator of dict: every record of the user"""
+    for _, items in sections(user):
+        for record in items:
+            yield record
+
+
+def ndjson(user):
+    """:return: iterator of str: one JSON document per line"""
+    for record in records(user):
+        yield _dumps(record) + '\n'
+
+
+class _Pipe:
+    """Write only file whose content is handed out while it is being
+    written. zipfile writes into it without seeking."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def zipped(user):
+    """Zip archive with a NDJSON member per section, produced on the fly
+
+    :return: iterator of bytes
+    """
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, items in sections(user):
+            with archive.open(name + '.ndjson', 'w') as member:
+                for record in items:
+                    member.write((_dumps(record) + '\n').encode('utf-8'))
+                    for chunk in pipe.drain():
+                        yield chunk
+            for chunk in pipe.drain():
+                yield chunk
+    for chunk in pipe.drain():
+        yield chunk
+
+
+def export(user, format='ndjson'):
+    """
+    :param user: SamUser: owner of the data
+    :param format: str: 'ndjson' or 'zip'
+    :return: iterator of str or bytes
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown format {}, use one of {}'.format(
+            format, FORMATS))
+    return ndjson(user) if format == 'ndjson' else zipped(user)
+
+
+# ============================== User table ===================================
+TABLE_EXCLUDE = ('password',)
+"""Columns of the user table never exported"""
+
+TABLE_FORMATS = ('csv', 'ndjson', 'columns', 'parquet')
+
+
+def table_columns():
+    """:return: list of str: exported columns of the user table"""
+    return [field.attname for field in SamUser._meta.concrete_fields
+            if field.name not in TABLE_EXCLUDE]
+
+
+def table_chunks(columns, batch_size=10000, since=None):
+    """Reads the user table in chunks with keyset pagination. No model
+    instance is built, the rows are plain tuples.
+
+    If ``since`` is given just the rows updated after it are read, ordered by
+    (updated_at, pk), otherwise the complete table ordered by pk.
+
+    :param columns: list of str: columns to read
+    :param batch_size: int: rows per query
+    :param since: tuple or None: (updated_at, pk) of the last exported row
+    :return: iterator of lists of tuples. The last two values of each tuple
+    are always updated_at and pk.
+    """
+    fields = list(columns) + ['updated_at', 'pk']
+    queryset = SamUser.objects.all()
+
+    if since is None:
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                        .values_list(*fields)[:batch_size])
+            if not rows:
+                return
+            last_pk = rows[-1][-1]
+            yield rows
+    else:
+        from django.db.models import Q
+
+        last_date, last_pk = since
+        queryset = queryset.filter(updated_at__isnull=False)
+        while True:
+            page = queryset.filter(
+                Q(updated_at__gt=last_date) |
+                Q(updated_at=last_date, pk__gt=last_pk))
+            rows = list(page.order_by('updated_at', 'pk')
+                        .values_list(*fields)[:batch_size])
+            if not rows:
+                return
+            last_date, last_pk = rows[-1][-2], rows[-1][-1]
+            yield rows
+
+
+class Watermark:
+    """Where an incremental export stopped: the last (updated_at, pk)
+    exported and the rows exported within EXPORT_OVERLAP before it. The next
+    export reads the overlap again and skips those rows, so the rows
+    committed late with an earlier updated_at are not lost.
+
+    :param last: tuple or None: (updated_at, pk) of the last exported row
+    :param recent: iterable: (pk, updated_at) of the rows exported within the
+    overlap
+    """
+
+    def __init__(self, last=None, recent=()):
+        self.last = last
+        self.previous = set(recent)
+        self.recent = set()
+        self.overlap = datetime.timedelta(seconds=settings.EXPORT_OVERLAP)
+
+    def since(self):
+        """:return: tuple or None: keyset where the next export starts"""
+        if self.last is None:
+            return None
+        return self.last[0] - self.overlap, 0
+
+    def exported(self, pk, updated_at):
+        """:return: bool: True if the previous export had the row"""
+        return (pk, updated_at) in self.previous
+
+    def add(self, rows):
+        """Moves the watermark after the given rows, whose last two values
+        are updated_at and pk"""
+        changed = [row[-2:] for row in rows if row[-2] is not None]
+        if not changed:
+            return
+        newest = max(changed)
+        if self.last is None or newest > self.last:
+            self.last = newest
+        limit = self.last[0] - self.overlap
+        self.recent.update((pk, updated_at) for updated_at, pk in changed
+                           if updated_at > limit)
+        self.recent = {key for key in self.recent if key[1] > limit}
+
+    def as_dict(self):
+        """:return: dict: JSON serializable state, see :meth:`from_dict`"""
+        return {'updated_at': self.last[0].isoformat(), 'pk': self.last[1],
+                'recent': sorted([pk, updated_at.isoformat()]
+                                 for pk, updated_at in self.recent)}
+
+    @classmethod
+    def from_dict(cls, data):
+        from django.utils.dateparse import parse_datetime
+
+        return cls((parse_datetime(data['updated_at']), data['pk']),
+                   ((pk, parse_datetime(updated_at))
+                    for pk, updated_at in data.get('recent', ())))
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+class CSVWriter:
+    """Writes the chunks as CSV with a header line"""
+
+    binary = False
+
+    def __init__(self, stream, columns):
+        import csv
+        self.writer = csv.writer(stream)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows([_text(v) for v in row] for row in rows)
+
+    def close(self):
+        pass
+
+
+class NDJSONWriter:
+    """Writes a JSON object per row"""
+
+    binary = False
+
+    def __init__(self, stream, columns):
+        self.stream = stream
+        self.columns = columns
+
+    def write(self, rows):
+        columns = self.columns
+        self.stream.write(''.join(
+            json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+            for row in rows))
+
+    def close(self):
+        pass
+
+
+class ColumnsWriter:
+    """Writes a JSON document per chunk, holding a list of values per column.
+    It is a dependency free columnar layout: every line can be loaded as a
+    data frame chunk."""
+
+    binary = False
+
+    def __init__(self, stream, columns):
+        self.stream = stream
+        self.columns = columns
+
+    def write(self, rows):
+        data = dict(zip(self.columns, (list(column) for column in zip(*rows))))
+        self.stream.write(json.dumps(
+            {'rows': len(rows), 'columns': data}, cls=DjangoJSONEncoder) + '\n')
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """Writes a row group per chunk. It requires pyarrow"""
+
+    binary = True
+
+    def __init__(self, stream, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('The parquet format requires pyarrow')
+        self.pa = pyarrow
+        self.stream = stream
+        self.columns = columns
+        self.writer = None
+
+    def write(self, rows):
+        pa = self.pa
+        arrays = [pa.array(list(column)) for column in zip(*rows)]
+        table = pa.Table.from_arrays(arrays, names=list(self.columns))
+        if self.writer is None:
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(self.stream,
+                                                        table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+TABLE_WRITERS = {
+    'csv': CSVWriter,
+    'ndjson': NDJSONWriter,
+    'columns': ColumnsWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def export_table(stream, format='csv', batch_size=10000, since=None,
+                 columns=None, watermark=None):
+    """Streams the user table into the given stream
+
+    :param stream: file: text stream, or binary for parquet
+    :param format: str: one of TABLE_FORMATS
+    :param batch_size: int: rows per query and per written chunk
+    :param since: tuple or None: see :func:`table_chunks`
+    :param columns: list or None: columns to export, by default all but the
+    password
+    :param watermark: Watermark or None: incremental export. Once it has a
+    position it replaces ``since``. It is moved after the exported rows
+    :return: tuple: (exported rows, (updated_at, pk) of the last updated row
+    or None). It is the ``since`` of the next incremental export.
+    """
+    columns = columns or table_columns()
+    writer = TABLE_WRITERS[format](stream, columns)
+    if watermark is not None:
+        since = watermark.since() or since
+    total, last = 0, None
+    for rows in table_chunks(columns, batch_size, since):
+        if watermark is not None:
+            # the skipped rows stay within the overlap of the next export
+            watermark.add(rows)
+            rows = [row for row in rows
+                    if not watermark.exported(row[-1], row[-2])]
+            if not rows:
+                continue
+        changed = [row[-2:] for row in rows if row[-2] is not None]
+        if changed:
+            last = max([last] + changed) if last else max(changed)
+        # drop the keyset values added by table_chunks
+        writer.write([row[:-2] for row in rows])
+        total += len(rows)
+    writer.close()
+    return total, last
@@ -2,10 +2,15 @@
 # -*- coding: utf-8 -*-
 
 import os
+import logging
 from django.template.loader import render_to_string
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 
 from ...conf import settings
+from ..timing import stage
+from ..metrics import MAILS_SENT, MAIL_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
 
 
 class SamantaMailer:
@@ -19,13 +24,25 @@ class SamantaMailer:
 
     """
 
-    TEAM_NAME = settings.TEAM_NAME
-    TEMPLATES_FOLDER = settings.MAIL_TEMPLATES_FOLDER
-
     def __init__(self, site_name, domain):
         self.site_name = site_name
         self.site_domain = domain
 
+    @property
+    def TEAM_NAME(self):
+        return settings.TEAM_NAME
+
+    @property
+    def TEMPLATES_FOLDER(self):
+        return settings.MAIL_TEMPLATES_FOLDER
+
+    def get_connection(self):
+        """:return: email backend of MAIL_BACKEND, None for django's
+        EMAIL_BACKEND"""
+        if not settings.MAIL_BACKEND:
+            return None
+        return get_connection(settings.MAIL_BACKEND)
+
     def build_context(self, context):
         full = {
             'help_mail': settings.EMAIL_HOST_USER,
@@ -46,34 +63,40 @@ class SamantaMailer:
         if type(to_) not in (list, tuple):
             to_ = [to_]
 
-        msg = EmailMultiAlternatives(subject, message_txt, from_email, to_)
+        msg = EmailMultiAlternatives(subject, message_txt, from_email, to_,
+                                     connection=self.get_connection())
 
         if message_html:
             msg.attach_alternative(message_html, "text/html")
 
         try:
-            msg.send()
-            return True
-        except Exception as e:
-            print(e)
-        return False
+            with stage('mail_send'), MAIL_SEND_SECONDS.time():
+                msg.send()
+        except Exception:
+            logger.exception('Could not send "%s" to %s', subject, to_)
+            MAILS_SENT.inc('failure')
+            return False
+        MAILS_SENT.inc('success')
+        return True
 
     def send_templated_mail(self, subject, from_email, to_, context_, lang,
                             template_txt_file=None, template_html_file=None):
 
         contex = self.build_context(context_)
+        lang = lang or settings.DEFAULT_MAIL_LANG
         if not template_html_file and not template_txt_file:
             raise ValueError("At least one of both templates must be given: "
                              "Plain text ot Html")
 
-        template_txt_file = os.path.join(self.TEMPLATES_FOLDER, lang, template_txt_file)
-        text_content = render_to_string(template_txt_file, context=contex)
+        with stage('mail_render'):
+            template_txt_file = os.path.join(self.TEMPLATES_FOLDER, lang, template_txt_file)
+            text_content = render_to_string(template_txt_file, context=contex)
 
-        if template_html_file:
-            template_html = os.path.join(self.TEMPLATES_FOLDER, lang, template_html_file)
-            html_content = render_to_string(template_html, context=contex)
-        else:
-            html_content = False
+            if template_html_file:
+                template_html = os.path.join(self.TEMPLATES_FOLDER, lang, template_html_file)
+                html_content = render_to_string(template_html, context=contex)
+            else:
+                html_content = False
 
         return self._send_mail(subject, from_email, to_, text_content,
                                html_content)
@@ -81,7 +104,7 @@ class SamantaMailer:
 
 class EmailSender(SamantaMailer):
 
-    def activation_email(self, to_, context, lang=settings.DEFAULT_MAIL_LANG):
+    def activation_email(self, to_, context, lang=None):
 
         subject = 'Account activation'
         from_email = settings.EMAIL_HOST_USER
@@ -91,7 +114,7 @@ class EmailSender(SamantaMailer):
         return self.send_templated_mail(subject, from_email, to_, context,
                                         lang, template_txt, template_html)
 
-    def recovery_email(self, to_, context, lang=settings.DEFAULT_MAIL_LANG):
+    def recovery_email(self, to_, context, lang=None):
 
         subject = 'Password recovery'
         from_email = settings.EMAIL_HOST_USER
@@ -101,7 +124,7 @@ class EmailSender(SamantaMailer):
         return self.send_templated_mail(subject, from_email, to_, context, lang,
                                         template_txt, template_html)
 
-    def change_email_email(self, to_, context, lang=settings.DEFAULT_MAIL_LANG):
+    def change_email_email(self, to_, context, lang=None):
 
         subject = 'Password recovery'
         from_email = settings.EMAIL_HOST_USER
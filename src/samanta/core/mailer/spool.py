@@ -0,0 +1,155 @@
+"""
+Maildir like spool of outgoing emails. Sending an email in a request is one
+local file write, and the command samanta_mail_spool hands the spooled
+messages to the SMTP server with a few long lived connections.
+
+Layout of MAIL_SPOOL_DIR:
+
+* ``tmp/``: messages being written.
+* ``new/``: complete messages, moved from tmp with an atomic rename.
+* ``cur/``: messages claimed by a drainer, also with a rename, so several
+  drainers never send the same message.
+* ``failed/``: messages rejected permanently by the SMTP server.
+
+Every file is the rendered MIME message preceded by the envelope headers
+``X-Spool-Sender`` and ``X-Spool-Recipient``, since the Bcc recipients are
+not part of the message headers. The drainer strips them.
+
+Use it for the samanta emails with MAIL_BACKEND, or for the whole project
+with EMAIL_BACKEND = 'samanta.core.mailer.spool.SpoolEmailBackend'.
+"""
+
+import os
+import time
+import socket
+import itertools
+from email.utils import parseaddr
+
+import django.conf
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.message import sanitize_address
+from django.core.exceptions import ImproperlyConfigured
+
+from samanta.conf import settings
+
+FOLDERS = ('tmp', 'new', 'cur', 'failed')
+
+SENDER_HEADER = b'X-Spool-Sender'
+RECIPIENT_HEADER = b'X-Spool-Recipient'
+
+_counter = itertools.count()
+_created = set()
+
+
+def folders(spool_dir):
+    """Creates the folders of the spool if needed, once per process
+
+    :return: dict: {name: path}
+    """
+    paths = {name: os.path.join(spool_dir, name) for name in FOLDERS}
+    if spool_dir not in _created:
+        for path in paths.values():
+            os.makedirs(path, exist_ok=True)
+        _created.add(spool_dir)
+    return paths
+
+
+def unique_name():
+    """Maildir file name: unique per host, process and message"""
+    now = time.time()
+    return '{:.0f}.M{}P{}Q{}.{}'.format(
+        now, int(now % 1 * 1e6), os.getpid(), next(_counter),
+        socket.gethostname().replace('/', '_').replace(':', '_'))
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _address(address, encoding):
+    # the envelope takes the bare address, without display name
+    return parseaddr(sanitize_address(address, encoding))[1].encode('utf-8')
+
+
+def serialize(message):
+    """:return: bytes: envelope and MIME message of an EmailMessage"""
+    encoding = message.encoding or django.conf.settings.DEFAULT_CHARSET
+    envelope = [SENDER_HEADER + b': ' +
+                _address(message.from_email, encoding)]
+    envelope.extend(RECIPIENT_HEADER + b': ' + _address(recipient, encoding)
+                    for recipient in message.recipients())
+    return b'\n'.join(envelope) + b'\n' + \
+        message.message().as_bytes(linesep='\n')
+
+
+def parse(data):
+    """Splits a spooled file
+
+    :param data: bytes: content of the file
+    :return: tuple: (sender, list of recipients, message bytes)
+    """
+    sender, recipients = None, []
+    lines = data.split(b'\n')
+    for index, line in enumerate(lines):
+        name, _, value = line.partition(b': ')
+        if name == SENDER_HEADER:
+            sender = value.decode('utf-8')
+        elif name == RECIPIENT_HEADER:
+            recipients.append(value.decode('utf-8'))
+        else:
+            return sender, recipients, b'\n'.join(lines[index:])
+    return sender, recipients, b''
+
+
+class SpoolEmailBackend(BaseEmailBackend):
+    """Writes the messages into the spool. The messages of a call are all
+    written before syncing them to the disk, and the folder is synced once.
+
+    :param spool_dir: str or None: by default MAIL_SPOOL_DIR
+    """
+
+    def __init__(self, spool_dir=None, fail_silently=False, **kwargs):
+        super(SpoolEmailBackend, self).__init__(fail_silently=fail_silently)
+        self.spool_dir = spool_dir or settings.MAIL_SPOOL_DIR
+        if not self.spool_dir:
+            raise ImproperlyConfigured('The spool needs MAIL_SPOOL_DIR')
+        self.paths = folders(self.spool_dir)
+
+    def send_messages(self, email_messages):
+        names, streams = [], []
+        try:
+            for message in email_messages:
+                if not message.recipients():
+                    continue
+                name = unique_name()
+                stream = open(os.path.join(self.paths['tmp'], name), 'wb')
+                names.append(name)
+                streams.append(stream)
+                stream.write(serialize(message))
+            # written first, so the disk syncs them together
+            for stream in streams:
+                stream.flush()
+                if settings.MAIL_SPOOL_FSYNC:
+                    os.fsync(stream.fileno())
+                stream.close()
+            for name in names:
+                os.rename(os.path.join(self.paths['tmp'], name),
+                          os.path.join(self.paths['new'], name))
+            if names and settings.MAIL_SPOOL_FSYNC:
+                _fsync_dir(self.paths['new'])
+        except Exception:
+            for stream in streams:
+                stream.close()
+            for name in names:
+                try:
+                    os.remove(os.path.join(self.paths['tmp'], name))
+                except OSError:
+                    pass
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(names)
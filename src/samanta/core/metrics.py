@@ -0,0 +1,337 @@
+"""
+In-process metrics registry with counters and histograms rendered in the
+Prometheus text format.
+
+Every process keeps its own values in memory. If METRICS_DIR is set, each
+process also writes a snapshot of them (at most every METRICS_FLUSH_INTERVAL
+seconds) to ``<METRICS_DIR>/<pid>.json`` and :meth:`Registry.collect` adds up
+the snapshots of all the workers. The snapshot of a worker no longer running
+is added into ``dead.json`` and deleted, so the totals never go down when
+the workers are restarted. The pids are checked on the collecting host, so
+METRICS_DIR must be local to it.
+
+>>> registry = Registry()
+>>> hits = registry.counter('hits_total', 'Hits', ['page'])
+>>> hits.inc('home')
+>>> print(registry.render(registry.collect(shared=False)).strip())
+# HELP hits_total Hits
+# TYPE hits_total counter
+hits_total{page="home"} 1.0
+"""
+
+import os
+import json
+import time
+import atexit
+import fcntl
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from samanta.conf import settings
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+DEAD_SNAPSHOT = 'dead.json'
+"""Values of the workers no longer running, in METRICS_DIR"""
+
+
+class Metric:
+    TYPE = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError('{} expects the labels {}'.format(
+                self.name, self.labelnames))
+        return json.dumps([str(label) for label in labels])
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.changed()
+
+    @staticmethod
+    def merge(current, other):
+        return current + other
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(registry, name, documentation,
+                                        labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = {
+                    'buckets': [0] * len(self.buckets), 'sum': 0., 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data['buckets'][i] += 1
+            data['sum'] += value
+            data['count'] += 1
+        self.registry.changed()
+
+    def time(self, *labels):
+        """Context manager observing the elapsed seconds"""
+        return _Timer(self, labels)
+
+    @staticmethod
+    def merge(current, other):
+        return {'buckets': [a + b for a, b in zip(current['buckets'],
+                                                  other['buckets'])],
+                'sum': current['sum'] + other['sum'],
+                'count': current['count'] + other['count']}
+
+
+class _Timer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started,
+                               *self.labels)
+        return False
+
+
+class Registry:
+    """Holds the metrics of the current process"""
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError('Duplicated metric ' + metric.name)
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation,
+                                        labelnames, buckets))
+
+    def snapshot(self):
+        """:return: dict: {metric name: {label key: value}} of this process"""
+        with self.lock:
+            return {name: json.loads(json.dumps(metric.values))
+                    for name, metric in self.metrics.items()}
+
+    def reset(self):
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.values.clear()
+
+    # ======================== shared store ===================================
+    def changed(self):
+        """Flushes the snapshot if the flush interval is over"""
+        if settings.METRICS_DIR and time.monotonic() - self.last_flush > \
+                settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Atomically writes the snapshot of this process into METRICS_DIR"""
+        folder = settings.METRICS_DIR
+        if not folder:
+            return
+        self.last_flush = time.monotonic()
+        _write(os.path.join(folder, '{}.json'.format(os.getpid())),
+               self.snapshot())
+
+    def collect(self, shared=True):
+        """Values of this process, added up with the other workers if
+        METRICS_DIR is set.
+
+        :param shared: bool: if False just this process is considered
+        :return: dict: same format as :meth:`snapshot`
+        """
+        folder = settings.METRICS_DIR
+        if not shared or not folder:
+            return self.snapshot()
+
+        self.flush()
+        merged = {}
+        # a snapshot must not be read while it is moved into dead.json
+        with _locked(folder):
+            self.bury(folder)
+            for name in os.listdir(folder):
+                if name.endswith('.json'):
+                    self.add(merged, _read(os.path.join(folder, name)))
+        return merged
+
+    def bury(self, folder):
+        """Adds the snapshots of the dead workers into DEAD_SNAPSHOT and
+        deletes them. Every metric is a counter or a histogram, whose values
+        must keep growing."""
+        dead = [name for name in os.listdir(folder)
+                if name.endswith('.json') and name != DEAD_SNAPSHOT and
+                not _alive(name[:-len('.json')])]
+        if not dead:
+            return
+        path = os.path.join(folder, DEAD_SNAPSHOT)
+        total = _read(path)
+        for name in dead:
+            self.add(total, _read(os.path.join(folder, name)))
+        _write(path, total)
+        for name in dead:
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
+
+    def add(self, merged, data):
+        """Adds up the values of a snapshot into ``merged``"""
+        for metric_name, values in data.items():
+            metric = self.metrics.get(metric_name)
+            if metric is None:
+                continue
+            target = merged.setdefault(metric_name, {})
+            for key, value in values.items():
+                target[key] = metric.merge(target[key], value) \
+                    if key in target else value
+
+    # ======================== exposition =====================================
+    def render(self, data):
+        """Renders the given values in the Prometheus text format
+
+        :param data: dict: values returned by :meth:`collect`
+        :return: str
+        """
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append('# HELP {} {}'.format(name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(name, metric.TYPE))
+            for key, value in sorted(data.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, json.loads(key)))
+                if metric.TYPE == 'counter':
+                    lines.append('{}{} {}'.format(name, _labels(labels),
+                                                  float(value)))
+                    continue
+                # the stored bucket counts are already cumulative
+                for bound, count in zip(metric.buckets, value['buckets']):
+                    lines.append('{}_bucket{} {}'.format(
+                        name, _labels(labels + [('le', repr(bound))]),
+                        float(count)))
+                lines.append('{}_bucket{} {}'.format(
+                    name, _labels(labels + [('le', '+Inf')]),
+                    float(value['count'])))
+                lines.append('{}_sum{} {}'.format(name, _labels(labels),
+                                                  float(value['sum'])))
+                lines.append('{}_count{} {}'.format(name, _labels(labels),
+                                                    float(value['count'])))
+        return '\n'.join(lines) + '\n'
+
+
+def _read(path):
+    """:return: dict: snapshot stored in the path, empty if unreadable"""
+    try:
+        with open(path) as stream:
+            return json.load(stream)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write(path, data):
+    """Atomically replaces the snapshot stored in the path"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as stream:
+        json.dump(data, stream)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _locked(folder):
+    """Exclusive lock of the collectors of METRICS_DIR"""
+    with open(os.path.join(folder, 'collect.lock'), 'a') as stream:
+        fcntl.flock(stream, fcntl.LOCK_EX)
+        yield
+
+
+def _alive(pid):
+    """:param pid: str: name of a snapshot without extension
+    :return: bool: False if there is not any process with the given pid"""
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        return True
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # it exists, owned by another user
+        pass
+    return True
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in pairs) + '}'
+
+
+REGISTRY = Registry()
+"""Registry used by samanta"""
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        REGISTRY.flush()
+    except Exception:
+        # settings not configured or the folder is gone, nothing to keep
+        pass
+
+
+TOKENS_ISSUED = REGISTRY.counter(
+    'samanta_tokens_issued_total', 'Tokens sent to the users', ['purpose'])
+
+TOKEN_CONFIRMATIONS = REGISTRY.counter(
+    'samanta_token_confirmations_total',
+    'Processed confirmation links by result: valid, expired, invalid or '
+    'missing', ['purpose', 'result'])
+
+MAILS_SENT = REGISTRY.counter(
+    'samanta_mails_total', 'Sent emails by result: success or failure',
+    ['result'])
+
+MAIL_SEND_SECONDS = REGISTRY.histogram(
+    'samanta_mail_send_seconds', 'Time spent handing an email to the backend')
+
+TOKEN_REQUESTS = REGISTRY.counter(
+    'samanta_token_requests_total', 'Requests of tokens by email: allowed or '
+    'suppressed by the cooldown', ['purpose', 'result'])
+
+LOGINS = REGISTRY.counter(
+    'samanta_logins_total', 'Login attempts by result: success or the code '
+    'of the rejection', ['result'])
@@ -0,0 +1,273 @@
+"""
+Bulk provisioning of users, e.g. imported from partner systems.
+
+The input rows are read lazily and processed in chunks. For every chunk:
+
+* the rows are validated and checked for uniqueness against the normalized
+  (upper case) username and email, with one query per column, served by the
+  indexes of migration 0003.
+* the passwords are hashed in parallel by a ``ProcessPoolExecutor``, since
+  the password hashers are CPU bound.
+* the users, and the activation tokens of the inactive ones, are inserted
+  with ``bulk_create`` in a single transaction.
+
+>>> from samanta.core.provision import provision, read_rows
+>>> with open('users.csv') as stream:
+...     stats = provision(read_rows(stream, 'csv'))
+"""
+
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+from samanta.conf import settings
+from samanta.core import demographics
+from samanta.core.tokens import DatabaseTokenStore, get_token_store
+from samanta.models import SamUser, UserCreationLog
+
+FORMATS = ('csv', 'ndjson')
+
+FIELDS = ('username', 'email', 'password', 'first_name', 'last_name',
+          'date_of_birth', 'location', 'language', 'gender')
+"""Columns accepted in the input. The others are ignored"""
+
+OPTIONAL_FIELDS = FIELDS[3:]
+
+
+def read_rows(stream, format='csv'):
+    """Reads the input rows lazily
+
+    :param stream: file: text stream
+    :param format: str: 'csv' with a header line, or 'ndjson'
+    :return: iterator of tuples (line number, dict)
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown format {}, use one of {}'.format(
+            format, FORMATS))
+    if format == 'csv':
+        # the header is line 1
+        for number, row in enumerate(csv.DictReader(stream), 2):
+            yield number, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else {'_raw': line}
+
+
+def _hash(password):
+    # the spawned (not forked) workers do not inherit the configured django
+    if not apps.ready:
+        django.setup()
+    return make_password(password or None)
+
+
+class Rejection(Exception):
+    pass
+
+
+class Provisioner:
+    """Creates users in chunks. Use it as a context manager, or call
+    :meth:`close`, to shut down the pool of hashing processes.
+
+    :param batch_size: int: rows per chunk
+    :param workers: int or None: hashing processes. 0 hashes in the calling
+    process, None uses as many as CPUs
+    :param on_reject: callable or None: called with (line number, row,
+    reason) for every rejected row
+    :param on_token: callable or None: called with (user, raw token) for
+    every issued activation token, e.g. to send the activation emails later
+    :param is_active: bool or None: status of the new users. By default
+    AUTO_ACTIVATE
+    """
+
+    def __init__(self, batch_size=1000, workers=None, on_reject=None,
+                 on_token=None, is_active=None):
+        self.batch_size = batch_size
+        self.on_reject = on_reject
+        self.on_token = on_token
+        self.is_active = settings.AUTO_ACTIVATE if is_active is None \
+            else is_active
+        self.executor = None if workers == 0 else ProcessPoolExecutor(workers)
+        self.store = get_token_store(UserCreationLog)
+        self.created = self.rejected = 0
+        self.seconds = 0.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    @property
+    def rate(self):
+        """:return: float: processed rows per second"""
+        total = self.created + self.rejected
+        return total / self.seconds if self.seconds else 0.
+
+    def run(self, rows):
+        """Provisions all the given rows
+
+        :param rows: iterable of tuples (line number, dict)
+        :return: Provisioner: self, with the counters updated
+        """
+        chunk = []
+        for item in rows:
+            chunk.append(item)
+            if len(chunk) >= self.batch_size:
+                self.process(chunk)
+                chunk = []
+        if chunk:
+            self.process(chunk)
+        return self
+
+    # ======================== chunks =========================================
+    def reject(self, number, row, reason):
+        self.rejected += 1
+        if self.on_reject:
+            self.on_reject(number, row, reason)
+
+    def clean(self, row):
+        """:return: dict: the accepted columns of the row, normalized"""
+        if '_raw' in row:
+            raise Rejection('invalid JSON')
+        data = {k: v for k, v in row.items()
+                if k in FIELDS and v not in (None, '')}
+        username = SamUser.normalize_username(data.get('username', ''))
+        if not username:
+            raise Rejection('missing username')
+        try:
+            SamUser.username_validator(username)
+        except ValidationError as e:
+            raise Rejection('username: ' + ' '.join(e.messages))
+        email = SamUser.objects.normalize_email(data.get('email', ''))
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise Rejection('invalid email')
+        data['username'], data['email'] = username, email
+        for name in OPTIONAL_FIELDS:
+            if name in data:
+                # clean runs the validators too, e.g. max_length and choices
+                try:
+                    data[name] = SamUser._meta.get_field(name).clean(
+                        data[name], None)
+                except ValidationError:
+                    raise Rejection('invalid ' + name)
+        return data
+
+    def existing(self, column, values):
+        """:return: set: the upper case values of the column already taken"""
+        if not values:
+            return set()
+        taken = SamUser.objects.annotate(key=Upper(column)).filter(
+            key__in=values)
+        return set(taken.values_list('key', flat=True))
+
+    def process(self, chunk):
+        started = time.perf_counter()
+        valid = []
+        for number, row in chunk:
+            try:
+                valid.append((number, row, self.clean(row)))
+            except Rejection as e:
+                self.reject(number, row, str(e))
+
+        usernames = {data['username'].upper() for _, _, data in valid}
+        emails = {data['email'].upper() for _, _, data in valid}
+        taken = {'username': self.existing('username', usernames),
+                 'email': self.existing('email', emails)}
+
+        accepted = []
+        for number, row, data in valid:
+            duplicated = [column for column in ('username', 'email')
+                          if data[column].upper() in taken[column]]
+            if duplicated:
+                self.reject(number, row, 'duplicated ' + ', '.join(duplicated))
+                continue
+            # later rows of the input can not reuse them either
+            taken['username'].add(data['username'].upper())
+            taken['email'].add(data['email'].upper())
+            accepted.append(data)
+
+        if accepted:
+            passwords = [data.pop('password', None) for data in accepted]
+            if self.executor is None:
+                hashed = [_hash(password) for password in passwords]
+            else:
+                hashed = list(self.executor.map(_hash, passwords))
+            self.insert(accepted, hashed)
+        self.seconds += time.perf_counter() - started
+
+    def insert(self, accepted, hashed):
+        now = timezone.now()
+        users = [SamUser(password=password, is_active=self.is_active,
+                         activated_at=now if self.is_active else None,
+                         date_joined=now, updated_at=now, **data)
+                 for data, password in zip(accepted, hashed)]
+
+        with transaction.atomic():
+            SamUser.objects.bulk_create(users)
+            demographics.created(users)
+            if not self.is_active:
+                # not every backend returns the primary keys of bulk_create
+                ids = dict(SamUser.objects.filter(
+                    username__in=[user.username for user in users]
+                ).values_list('username', 'pk'))
+                for user in users:
+                    user.pk = ids[user.username]
+                self.issue_tokens(users)
+        self.created += len(users)
+
+    def issue_tokens(self, users):
+        store = self.store
+        records = []
+        for user in users:
+            raw, digest, salt = store.hasher.secure_set()
+            if isinstance(store, DatabaseTokenStore):
+                # new users, there is no previous token to deactivate
+                record = store.new_record(user=user, email=user.email,
+                                          token=digest, salt=salt)
+            else:
+                record = store.build(user, user.email, digest, salt)
+            records.append(record)
+            if self.on_token:
+                self.on_token(user, raw)
+
+        if isinstance(store, DatabaseTokenStore):
+            type(records[0]).objects.bulk_create(records)
+        else:
+            for record in records:
+                record.save()
+
+
+def provision(rows, **options):
+    """Provisions the given rows, see :class:`Provisioner` for the options
+
+    :param rows: iterable of tuples (line number, dict), see
+    :func:`read_rows`
+    :return: dict: created, rejected, seconds and rate (rows per second)
+    """
+    with Provisioner(**options) as provisioner:
+        provisioner.run(rows)
+    return {'created': provisioner.created, 'rejected': provisioner.rejected,
+            'seconds': provisioner.seconds, 'rate': provisioner.rate}
@@ -0,0 +1,106 @@
+"""
+Per-request timing breakdown. The stages are measured only while a breakdown
+is active for the current thread (see :class:`samanta.middleware.TimingMiddleware`),
+otherwise :class:`stage` does nothing, so the instrumented code pays just an
+attribute lookup.
+
+>>> timings = start()
+>>> with stage('hash'):
+...     pass
+>>> 'hash' in stop().stages
+True
+>>> with stage('hash'):
+...     pass
+>>> current() is None
+True
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+_local = threading.local()
+
+
+class Timings:
+    """Accumulated time per stage of a single request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = OrderedDict()
+        self.total = None
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.) + seconds
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+        return self
+
+    def as_server_timing(self):
+        """Value for the ``Server-Timing`` header, durations in ms
+
+        :return: str
+        """
+        items = list(self.stages.items())
+        if self.total is not None:
+            items.append(('total', self.total))
+        return ', '.join('{};dur={:.2f}'.format(name, seconds * 1e3)
+                         for name, seconds in items)
+
+    def as_dict(self):
+        """Durations in ms, used for the structured logs
+
+        :return: dict
+        """
+        result = OrderedDict((name, round(seconds * 1e3, 2))
+                             for name, seconds in self.stages.items())
+        if self.total is not None:
+            result['total'] = round(self.total * 1e3, 2)
+        return result
+
+
+def start():
+    """Starts a breakdown for the current thread
+
+    :return: Timings
+    """
+    _local.timings = Timings()
+    return _local.timings
+
+
+def stop():
+    """Finishes the breakdown of the current thread
+
+    :return: Timings or None if there was not any active
+    """
+    timings = current()
+    _local.timings = None
+    return timings.finish() if timings else None
+
+
+def current():
+    """:return: Timings or None: the active breakdown of the current thread"""
+    return getattr(_local, 'timings', None)
+
+
+class stage:
+    """Context manager that adds the elapsed time to the given stage of the
+    active breakdown. Time spent within nested stages is counted by both.
+    """
+
+    __slots__ = ('name', 'timings', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = current()
+        if self.timings is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.name, time.perf_counter() - self.started)
+        return False
@@ -0,0 +1,223 @@
+"""
+Storage of the tokens sent by email. Every token kind (the PURPOSE of the
+token models) uses the store configured in TOKEN_STORES:
+
+* :class:`DatabaseTokenStore`: the token log tables, the default.
+* :class:`UnifiedTokenStore`: a single AccountToken table for all the
+  purposes, with one composite index.
+* :class:`CacheTokenStore`: django's cache framework. The tokens expire with
+  the native TTL of the cache and nothing is written to the database, which
+  suits short lived tokens like password recovery or email change.
+
+A store builds records that are persisted with ``record.save()`` once the
+email was sent, and consumes them with :meth:`BaseTokenStore.consume`. Both
+kinds of records expose ``user``, ``email``, ``token`` (digest), ``salt`` and
+``date``.
+"""
+
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from samanta.conf import settings
+from samanta.core.hasher import Hasher
+from samanta import constants
+
+VALID = 'valid'
+EXPIRED = 'expired'
+INVALID = 'invalid'
+MISSING = 'missing'
+"""Results of the consumption of a token"""
+
+
+class BaseTokenStore:
+    """Interface of the token stores"""
+
+    hasher = Hasher()
+
+    def __init__(self, log_model):
+        """
+        :param log_model: Model: token model of the kind of token. Its
+        PURPOSE names the kind
+        """
+        self.log_model = log_model
+        self.purpose = log_model.PURPOSE
+
+    def build(self, user, email, digest, salt):
+        """Builds a not yet saved record. Saving it invalidates the previous
+        tokens of the user for this purpose.
+
+        :return: record with a save() method
+        """
+        raise NotImplementedError
+
+    def consume(self, user_id, raw):
+        """Validates the given raw token and, if valid, consumes it. A token
+        can be consumed just once, also under concurrent requests.
+
+        :param user_id: int: id of the owner
+        :param raw: str: token sent to the user
+        :return: tuple: (result, record or None) where result is one of
+        VALID, EXPIRED, INVALID or MISSING
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def is_expired(date):
+        return (timezone.now() - date).days >= settings.TOKEN_SPAN_VALIDITY
+
+
+class DatabaseTokenStore(BaseTokenStore):
+    """Keeps the tokens in the table of the token model"""
+
+    def get_queryset(self):
+        """:return: QuerySet: tokens of the purpose of the store"""
+        return self.log_model.objects.all()
+
+    def new_record(self, **fields):
+        return self.log_model(**fields)
+
+    def build(self, user, email, digest, salt):
+        # deactivates any previous token. Just in case
+        self.get_queryset().filter(
+            user=user, status=constants.StatusActivity.ACTIVE.id).update(
+            status=constants.StatusActivity.INACTIVE.id)
+        return self.new_record(user=user, email=email, token=digest,
+                               salt=salt)
+
+    def consume(self, user_id, raw):
+        Token = self.get_queryset().select_related('user').filter(
+            user_id=user_id, status=constants.StatusActivity.ACTIVE.id).last()
+
+        if not Token:
+            return MISSING, None
+        elif not Token.is_old(autoclose=True):
+            return EXPIRED, None
+        elif not Token.is_valid(raw):
+            return INVALID, None
+
+        # conditional close, a concurrent request may have used it already
+        closed = self.get_queryset().filter(
+            pk=Token.pk, status=constants.StatusActivity.ACTIVE.id).update(
+            status=constants.StatusActivity.INACTIVE.id)
+        if not closed:
+            return MISSING, None
+        Token.status = constants.StatusActivity.INACTIVE.id
+        return VALID, Token
+
+
+class UnifiedTokenStore(DatabaseTokenStore):
+    """Keeps the tokens of every purpose in the single AccountToken table,
+    told apart by its purpose column. Use samanta_migrate_tokens to move the
+    rows of the per purpose tables into it.
+    """
+
+    def __init__(self, log_model):
+        super(UnifiedTokenStore, self).__init__(log_model)
+        from samanta.models import AccountToken
+        self.table = AccountToken
+
+    def get_queryset(self):
+        return self.table.objects.filter(purpose=self.purpose)
+
+    def new_record(self, **fields):
+        return self.table(purpose=self.purpose, **fields)
+
+
+class CachedToken:
+    """Token record kept in the cache"""
+
+    def __init__(self, store, user_id, email, token, salt, date=None,
+                 user=None):
+        self.store = store
+        self.user_id = user_id
+        self.email = email
+        self.token = token
+        self.salt = salt
+        self.date = date or timezone.now()
+        self._user = user
+
+    @property
+    def user(self):
+        if self._user is None:
+            from samanta.models import SamUser
+            self._user = SamUser.objects.get(pk=self.user_id)
+        return self._user
+
+    def is_valid(self, raw):
+        return self.store.hasher.check(self.token, self.salt, raw)
+
+    def save(self):
+        self.store.save(self)
+
+    def as_dict(self):
+        return {'email': self.email, 'token': self.token, 'salt': self.salt,
+                'date': self.date}
+
+
+class CacheTokenStore(BaseTokenStore):
+    """Keeps a single active token per user and purpose in the cache
+    TOKEN_CACHE, expiring after TOKEN_SPAN_VALIDITY days.
+
+    The consumption claims the digest with ``cache.add``, which is atomic in
+    the cache backends, so two concurrent requests can not both use a token.
+    """
+
+    KEY = 'samanta:token:{purpose}:{user_id}'
+    CLAIM_KEY = 'samanta:token-used:{digest}'
+
+    @property
+    def cache(self):
+        return caches[settings.TOKEN_CACHE]
+
+    @property
+    def timeout(self):
+        return settings.TOKEN_SPAN_VALIDITY * 24 * 3600
+
+    def key(self, user_id):
+        return self.KEY.format(purpose=self.purpose, user_id=user_id)
+
+    def build(self, user, email, digest, salt):
+        return CachedToken(self, user.pk, email, digest, salt, user=user)
+
+    def save(self, record):
+        # replacing the entry invalidates the previous token
+        self.cache.set(self.key(record.user_id), record.as_dict(),
+                       self.timeout)
+
+    def consume(self, user_id, raw):
+        key = self.key(user_id)
+        data = self.cache.get(key)
+        if data is None:
+            return MISSING, None
+
+        record = CachedToken(self, user_id, **data)
+        if self.is_expired(record.date):
+            self.cache.delete(key)
+            return EXPIRED, None
+        elif not record.is_valid(raw):
+            return INVALID, None
+
+        claim = self.CLAIM_KEY.format(digest=record.token)
+        if not self.cache.add(claim, True, self.timeout):
+            return MISSING, None
+        self.cache.delete(key)
+        return VALID, record
+
+
+_stores = {}
+
+
+def get_token_store(log_model):
+    """Store configured for the kind of token of the given model
+
+    :param log_model: Model: token model, e.g. PasswordRecoveryLog
+    :return: BaseTokenStore
+    """
+    path = settings.TOKEN_STORES.get(log_model.PURPOSE,
+                                     settings.DEFAULT_TOKEN_STORE)
+    key = (log_model, path)
+    store = _stores.get(key)
+    if store is None:
+        store = _stores[key] = import_string(path)(log_model)
+    return store
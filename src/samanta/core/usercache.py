@@ -0,0 +1,160 @@
+"""
+Shared cache of the SamUser rows used by the authentication, see
+samanta.backends.CachedModelBackend.
+
+The users are kept under their id, and their normalized username points to
+the id. Every user also has a version counter in the cache:
+
+* a cached row is only served if it was stored with the current version.
+* any change of the user (post_save, post_delete, teams m2m_changed, or
+  :func:`invalidate` for the bulk updates) increments the version.
+
+So a request that read the row from the database before a concurrent change
+can not store a stale row over it: it is stored with the old version and
+never served.
+"""
+
+import time
+import hashlib
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from samanta.conf import settings
+from samanta.models import SamUser
+
+KEY = 'samanta:user:{}'
+VERSION_KEY = 'samanta:user-version:{}'
+USERNAME_KEY = 'samanta:username:{}'
+
+
+def _cache():
+    return caches[settings.USER_CACHE]
+
+
+def _normalize(username):
+    # the usernames are matched case insensitively, see get_by_natural_key
+    return SamUser.normalize_username(username).upper()
+
+
+def _username_key(username):
+    # hashed, the keys of some backends are limited
+    normalized = _normalize(username)
+    return USERNAME_KEY.format(
+        hashlib.md5(normalized.encode('utf-8')).hexdigest())
+
+
+def _new_version():
+    # a counter lost by the cache must not come back with an old value
+    return int(time.time() * 1e6)
+
+
+def _current_version(cache, user_id):
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key)
+    return version
+
+
+def get(user_id):
+    """Cached user, loaded from the database on a miss
+
+    :param user_id: int: primary key
+    :return: SamUser or None if it does not exist
+    """
+    cache = _cache()
+    key = KEY.format(user_id)
+    version_key = VERSION_KEY.format(user_id)
+    found = cache.get_many([key, version_key])
+    entry, version = found.get(key), found.get(version_key)
+    if entry is not None and version is not None and entry[0] == version:
+        return entry[1]
+
+    # the version is read before the row
+    version = version if version is not None else \
+        _current_version(cache, user_id)
+    try:
+        user = SamUser._default_manager.for_auth().get(pk=user_id)
+    except SamUser.DoesNotExist:
+        return None
+    cache.set(key, (version, user), settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+def get_by_natural_key(username):
+    """
+    :param username: str: username as typed by the user
+    :return: SamUser or None if it does not exist
+    """
+    cache = _cache()
+    key = _username_key(username)
+    user_id = cache.get(key)
+    if user_id is not None:
+        user = get(user_id)
+        if user is not None and \
+                _normalize(user.get_username()) == _normalize(username):
+            return user
+
+    try:
+        user = SamUser._default_manager.get_by_natural_key(username)
+    except SamUser.DoesNotExist:
+        return None
+    # the version was not known before the read, the row is cached on the
+    # next get() only
+    cache.set(key, user.pk, settings.USER_CACHE_TIMEOUT)
+    return user
+
+
+def invalidate(user_ids):
+    """Forgets the given users, e.g. after a queryset ``update()`` that does
+    not send post_save. Within a transaction it is repeated after the commit,
+    since until then the other connections still read the previous rows.
+
+    :param user_ids: iterable of int
+    :return: None
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    _bump(user_ids)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(user_ids))
+
+
+def _bump(user_ids):
+    cache = _cache()
+    for user_id in user_ids:
+        try:
+            cache.incr(VERSION_KEY.format(user_id))
+        except ValueError:
+            cache.set(VERSION_KEY.format(user_id), _new_version(), None)
+    cache.delete_many([KEY.format(user_id) for user_id in user_ids])
+
+
+# ============================== signals ======================================
+@receiver(post_save, sender=SamUser, dispatch_uid='samanta_usercache_save')
+@receiver(post_delete, sender=SamUser, dispatch_uid='samanta_usercache_delete')
+def _user_changed(sender, instance, **kwargs):
+    invalidate([instance.pk])
+
+
+@receiver(m2m_changed, sender=SamUser.teams.through,
+          dispatch_uid='samanta_usercache_teams')
+def _teams_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate([instance.pk])
+        return
+    # changed from the team side, pk_set holds users
+    if action == 'pre_clear':
+        instance._samanta_cleared = list(
+            instance.samuser_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        invalidate(getattr(instance, '_samanta_cleared', []))
+    elif action.startswith('post_'):
+        invalidate(pk_set or [])
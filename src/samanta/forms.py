@@ -9,12 +9,61 @@ the Maite user model: SamUser. Therefore, the method get_user_model() is not use
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, SetPasswordForm
 from django.contrib.auth.forms import AuthenticationForm
-from django.utils.translation import gettext as _
-
-from captcha.fields import CaptchaField
+from django.utils.translation import gettext_lazy as _
 
 from .models import SamUser
 from . conf import settings
+from .core.metrics import LOGINS
+from .core import avatars, challenges
+from .widgets import CachedCountrySelect
+
+
+class PooledCaptchaWidget(forms.MultiWidget):
+    """Image of a challenge of the pool, its signed token and the answer
+    input. Rendering it reads the cache once"""
+
+    template_name = 'samanta/widgets/captcha.html'
+
+    def __init__(self, attrs=None):
+        widgets = (forms.HiddenInput(attrs), forms.TextInput(attrs))
+        super(PooledCaptchaWidget, self).__init__(widgets, attrs)
+
+    def decompress(self, value):
+        return [None, None]
+
+    def get_context(self, name, value, attrs):
+        from django.urls import reverse
+
+        challenge_id, token = challenges.pick()
+        # a new challenge every time, also when the form is rendered again
+        context = super(PooledCaptchaWidget, self).get_context(
+            name, [token, ''], attrs)
+        context['image'] = reverse('captcha_image', args=[challenge_id])
+        return context
+
+
+class PooledCaptchaField(forms.MultiValueField):
+    """Captcha answered against the pool of samanta.core.challenges"""
+
+    widget = PooledCaptchaWidget
+    default_error_messages = {
+        'invalid': _('Invalid CAPTCHA'),
+    }
+
+    def __init__(self, *args, **kwargs):
+        fields = (forms.CharField(), forms.CharField())
+        super(PooledCaptchaField, self).__init__(fields, *args, **kwargs)
+
+    def compress(self, data_list):
+        return data_list
+
+    def clean(self, value):
+        super(PooledCaptchaField, self).clean(value)
+        token, answer = (list(value) + [None, None])[:2]
+        if not challenges.check(token, answer):
+            raise forms.ValidationError(self.error_messages['invalid'],
+                                        code='invalid')
+        return value
 
 
 class SamAuthenticationForm(AuthenticationForm):
@@ -24,6 +73,16 @@ class SamAuthenticationForm(AuthenticationForm):
     error_messages = AuthenticationForm.error_messages.copy()
     error_messages['banned'] = 'Your account is banned until {until}'
 
+    def clean(self):
+        try:
+            cleaned_data = super(SamAuthenticationForm, self).clean()
+        except forms.ValidationError as e:
+            LOGINS.inc(getattr(e, 'code', None) or 'invalid')
+            raise
+        if self.user_cache is not None:
+            LOGINS.inc('success')
+        return cleaned_data
+
     def confirm_login_allowed(self, user):
         """
         extends the confirm_login_allowed from django AuthenticationForm in
@@ -60,10 +119,6 @@ class SamUserCreationForm(UserCreationForm):
         'username_in_use': _("This username is already taken."),
     })
 
-    # is use captcha is required, add the field to the form
-    if settings.USE_CAPTCHA:
-        captcha = CaptchaField()
-
     # used for confirmation
     email2 = forms.EmailField(label=_("Confirm your Email"), max_length=254)
 
@@ -76,13 +131,18 @@ class SamUserCreationForm(UserCreationForm):
 
     def __init__(self, *args, **kwargs):
         super(SamUserCreationForm, self).__init__(*args, **kwargs)
+        # if captcha is required, add the field to the form. The captcha app
+        # is imported just when it is actually used.
+        if settings.USE_CAPTCHA and settings.USE_CAPTCHA_POOL:
+            self.fields['captcha'] = PooledCaptchaField()
+        elif settings.USE_CAPTCHA:
+            from captcha.fields import CaptchaField
+            self.fields['captcha'] = CaptchaField()
 
     class Meta:
         model = SamUser
         fields = ['username', 'email', 'email2', 'password1', 'password2',
                   'terms_of_service']
-        if settings.USE_CAPTCHA:
-            fields += ['captcha']
 
     def clean_email2(self):
         """Makes sure that the second mail matches the first one, in order to
@@ -190,7 +250,7 @@ class ChangeEmailForm(forms.Form):
             )
         # uniqueness
         if SamUser.objects.filter(email__iexact=email_new).exclude(
-                id=self.user.id).count() > 0:
+                id=self.user.id).exists():
             raise forms.ValidationError(
                 self.error_messages['email_in_use'],
                 code='email_in_use',
@@ -207,15 +267,48 @@ class ChangeEmailForm(forms.Form):
         return self.cleaned_data.get('email_new', None)
 
 
+class AvatarField(forms.FileField):
+    """Image upload validated from its header only. Unlike the ImageField of
+    django, the pixels are not decoded in the request"""
+
+    default_error_messages = {
+        'invalid_image': _('Upload a valid image.'),
+        'invalid_format': _('Unsupported image format.'),
+        'file_size': _('The image is too big.'),
+        'dimensions': _('The image dimensions are too big.'),
+    }
+
+    def to_python(self, data):
+        upload = super(AvatarField, self).to_python(data)
+        if upload is None:
+            return None
+        try:
+            upload.image_format, upload.image_size = avatars.inspect(upload)
+        except avatars.InvalidAvatar as e:
+            raise forms.ValidationError(self.error_messages[e.args[1]],
+                                        code=e.args[1])
+        return upload
+
+
 class SamUserEditForm(forms.ModelForm):
     """Form used to edit the users profile information"""
 
     def __init__(self, *args, **kwargs):
         super(SamUserEditForm, self).__init__(*args, **kwargs)
+        self.previous_avatar = self.instance.avatar.name or None
 
     class Meta:
         model = SamUser
         fields = ['date_of_birth', 'location', 'language', 'gender', 'avatar']
+        field_classes = {'avatar': AvatarField}
+        # rendered on every GET and invalid POST of the profile edition
+        widgets = {'location': CachedCountrySelect}
+
+    def save(self, commit=True):
+        user = super(SamUserEditForm, self).save(commit)
+        if commit and 'avatar' in self.changed_data:
+            avatars.schedule(user.avatar.name or None, self.previous_avatar)
+        return user
 
 
 class PasswordRecoveryForm(forms.Form):
@@ -0,0 +1,109 @@
+"""
+Deletes the stored avatar files that no user references anymore, together
+with their size variants, see samanta.storage:
+
+    >>> python manage.py samanta_avatar_gc
+    >>> python manage.py samanta_avatar_gc --recount --dry-run
+
+Only the files neither uploaded nor dropped by a user for longer than
+AVATAR_GC_GRACE hours (AvatarBlob.last_used) are candidates, and the users
+are checked again before deleting, so a wrong count never deletes a file in
+use.
+"""
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from samanta.conf import settings
+from samanta.core import avatars
+from samanta.models import SamUser, AvatarBlob
+
+
+class Command(BaseCommand):
+    help = 'Deletes the avatar files no user references.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Files checked per query')
+        parser.add_argument('--grace', type=float, default=None,
+                            help='Hours. Default AVATAR_GC_GRACE')
+        parser.add_argument('--recount', action='store_true',
+                            help='Computes the reference counts again from '
+                                 'the users first')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Just counts what would be deleted')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['recount']:
+            self.recount(options['batch_size'], options['dry_run'])
+        grace = settings.AVATAR_GC_GRACE if options['grace'] is None \
+            else options['grace']
+        deleted, freed = self.collect(options['batch_size'], grace,
+                                      options['dry_run'])
+        self.stdout.write('{} files {}, {} bytes, in {:.2f}s'.format(
+            deleted, 'to delete' if options['dry_run'] else 'deleted', freed,
+            time.perf_counter() - started))
+
+    def batches(self, queryset, batch_size):
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                        .values_list('pk', 'name', 'size', 'refs')
+                        [:batch_size])
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            yield rows
+
+    def references(self, names):
+        """:return: dict: {name: amount of users using it}"""
+        counts = SamUser.objects.filter(avatar__in=names).values(
+            'avatar').annotate(users=Count('pk')).order_by()
+        return {row['avatar']: row['users'] for row in counts}
+
+    def recount(self, batch_size, dry_run=False):
+        fixed = 0
+        for rows in self.batches(AvatarBlob.objects.all(), batch_size):
+            references = self.references([row[1] for row in rows])
+            wrong = [(pk, references.get(name, 0))
+                     for pk, name, _, refs in rows
+                     if refs != references.get(name, 0)]
+            fixed += len(wrong)
+            if dry_run:
+                continue
+            with transaction.atomic():
+                for pk, refs in wrong:
+                    AvatarBlob.objects.filter(pk=pk).update(refs=refs)
+        self.stdout.write('{} reference counts fixed'.format(fixed))
+
+    def collect(self, batch_size, grace, dry_run=False):
+        """:return: tuple: (deleted files, freed bytes)"""
+        storage = avatars._storage()
+        limit = timezone.now() - timedelta(hours=grace)
+        candidates = AvatarBlob.objects.filter(refs__lte=0,
+                                               last_used__lt=limit)
+        deleted = freed = 0
+        for rows in self.batches(candidates, batch_size):
+            used = self.references([row[1] for row in rows])
+            for pk, name, size, _ in rows:
+                if name in used:
+                    continue
+                if not dry_run:
+                    # the row goes first, an upload in between recreates it.
+                    # An upload since the batch was read touched last_used
+                    if not AvatarBlob.objects.filter(
+                            pk=pk, refs__lte=0,
+                            last_used__lt=limit).delete()[0]:
+                        continue
+                    if not storage.delete_unreferenced(name):
+                        continue
+                    avatars.discard(name)
+                deleted += 1
+                freed += size
+        return deleted, freed
@@ -0,0 +1,54 @@
+"""
+Generates the missing variants of the uploaded avatars, see
+samanta.core.avatars. Use it when AVATAR_WORKERS is 0, after changing
+AVATAR_SIZES, or to backfill the existing avatars:
+
+    >>> python manage.py samanta_avatar_variants --batch-size 200
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from samanta.core import avatars
+from samanta.models import SamUser
+
+
+class Command(BaseCommand):
+    help = 'Generates the missing size variants of the avatars.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Users read per query')
+        parser.add_argument('--force', action='store_true',
+                            help='Generates again the existing variants')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        processed = failed = 0
+        # the users can share the stored avatar
+        done = set()
+        last_pk = 0
+        with_avatar = SamUser.objects.exclude(avatar='').exclude(
+            avatar__isnull=True)
+
+        while True:
+            rows = list(with_avatar.filter(pk__gt=last_pk).order_by('pk')
+                        .values_list('pk', 'avatar')[:options['batch_size']])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            for _, name in rows:
+                if name in done or (not options['force'] and
+                                    avatars.has_variants(name)):
+                    continue
+                done.add(name)
+                try:
+                    avatars.process(name)
+                    processed += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write('{}: {}'.format(name, e))
+
+        self.stdout.write('{} avatars processed, {} failed, in {:.2f}s'.format(
+            processed, failed, time.perf_counter() - started))
@@ -0,0 +1,34 @@
+"""
+Fills the pool of captcha challenges used when USE_CAPTCHA_POOL is True, see
+samanta.core.challenges. Run it with --loop in order to rotate the pool
+before it expires (CAPTCHA_POOL_TTL):
+
+    >>> python manage.py samanta_captcha_pool --loop 1800
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from samanta.core import challenges
+
+
+class Command(BaseCommand):
+    help = 'Renders the captcha challenges of the pool into the cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=None,
+                            help='Challenges. Default CAPTCHA_POOL_SIZE')
+        parser.add_argument(
+            '--loop', type=float, default=None, metavar='SECONDS',
+            help='Keeps running, refilling the pool every given seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            generated = challenges.fill(options['size'])
+            self.stdout.write('{} challenges generated in {:.2f}s'.format(
+                generated, time.perf_counter() - started))
+            if options['loop'] is None:
+                break
+            time.sleep(options['loop'])
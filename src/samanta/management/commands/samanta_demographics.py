@@ -0,0 +1,73 @@
+"""
+Rebuilds the summary of the demographics of the users (DemographicCount),
+see samanta.core.demographics:
+
+    >>> python manage.py samanta_demographics
+    >>> python manage.py samanta_demographics --dry-run
+
+The users are grouped in chunks of primary keys, so every query is a short
+range scan. The summary is then corrected with the differences, not
+overwritten, so the deltas flushed by the running processes meanwhile are
+kept. The deltas still buffered by a process while the users are grouped
+are counted twice: they are already part of the users table and are added
+again by their flush, up to DEMOGRAPHICS_FLUSH_INTERVAL seconds later. Run
+it again if the users changed a lot meanwhile.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+
+from samanta.core import demographics
+from samanta.models import SamUser, DemographicCount
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the summary of the users demographics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Range of user ids grouped per query')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Seconds to wait between chunks')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Just counts the wrong combinations')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        totals = self.group(options['batch_size'], options['sleep'])
+        stored = {tuple(row[:-1]): row[-1] for row in
+                  DemographicCount.objects.values_list(
+                      *demographics.DIMENSIONS + ('count',))}
+        wrong = {combination: totals.get(combination, 0) -
+                 stored.get(combination, 0)
+                 for combination in set(totals) | set(stored)}
+        wrong = {k: v for k, v in wrong.items() if v}
+
+        if not options['dry_run']:
+            with transaction.atomic():
+                for combination, delta in sorted(wrong.items()):
+                    demographics.apply(combination, delta)
+                DemographicCount.objects.filter(count=0).delete()
+        self.stdout.write(
+            '{} users, {} combinations {}, in {:.2f}s'.format(
+                sum(totals.values()), len(wrong),
+                'wrong' if options['dry_run'] else 'fixed',
+                time.perf_counter() - started))
+
+    def group(self, batch_size, sleep=0):
+        """:return: dict: {combination: users} of all the users"""
+        bounds = SamUser.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        totals = {}
+        if bounds['low'] is None:
+            return totals
+        for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+            chunk = SamUser.objects.filter(pk__gte=start,
+                                           pk__lt=start + batch_size)
+            for combination, users in demographics.group(chunk).items():
+                totals[combination] = totals.get(combination, 0) + users
+            if sleep:
+                time.sleep(sleep)
+        return totals
@@ -0,0 +1,52 @@
+"""
+Exports everything samanta stores about a user, e.g. for data-subject access
+requests:
+
+    >>> python manage.py samanta_export_user jane --format zip -o jane.zip
+"""
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from samanta.core import export
+from samanta.models import SamUser
+
+
+class Command(BaseCommand):
+    help = 'Streams the data of a user as NDJSON or zip.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='username or id of the user')
+        parser.add_argument('--format', choices=export.FORMATS,
+                            default='ndjson')
+        parser.add_argument('-o', '--output', default=None,
+                            help='Destination file. Default stdout')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        chunks = export.export(user, options['format'])
+
+        if options['output']:
+            with open(options['output'], 'wb') as stream:
+                self.write(stream, chunks)
+        elif options['format'] == 'ndjson':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+        else:
+            self.write(sys.stdout.buffer, chunks)
+
+    def get_user(self, value):
+        try:
+            if value.isdigit():
+                return SamUser.objects.get(pk=value)
+            return SamUser.objects.get_by_natural_key(value)
+        except SamUser.DoesNotExist:
+            raise CommandError('User "{}" does not exist'.format(value))
+
+    @staticmethod
+    def write(stream, chunks):
+        for chunk in chunks:
+            stream.write(chunk.encode('utf-8') if isinstance(chunk, str)
+                         else chunk)
+        stream.flush()
@@ -0,0 +1,92 @@
+"""
+Provisions users in bulk from a CSV (with header) or NDJSON file, see
+samanta.core.provision for the accepted columns:
+
+    >>> python manage.py samanta_import_users partner.csv --workers 4
+    >>> python manage.py samanta_import_users - --format ndjson < users.json
+
+The rejected rows are written, with the reason, to a NDJSON side file
+(<input>.rejected.ndjson by default). With --tokens the activation tokens of
+the new inactive users are written to a CSV file, in order to send the
+activation emails separately.
+"""
+
+import csv
+import io
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from samanta.core import provision
+
+
+class Command(BaseCommand):
+    help = 'Creates users in bulk from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Source file, - for stdin')
+        parser.add_argument('--format', choices=provision.FORMATS,
+                            default=None,
+                            help='Default from the extension of the input')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per chunk')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Hashing processes, 0 to hash in this '
+                                 'process. Default as many as CPUs')
+        parser.add_argument('--rejected', default=None,
+                            help='Side file of the rejected rows')
+        parser.add_argument('--tokens', default=None,
+                            help='CSV file receiving user id, email and raw '
+                                 'activation token')
+        parser.add_argument('--active', action='store_true',
+                            help='Creates the users already active')
+
+    def handle(self, *args, **options):
+        path = options['input']
+        format = options['format'] or ('csv' if path.endswith('.csv')
+                                       else 'ndjson')
+        if path == '-' and not options['format']:
+            raise CommandError('--format is required to read stdin')
+        rejected_path = options['rejected'] or (
+            'rejected.ndjson' if path == '-' else path + '.rejected.ndjson')
+
+        if path == '-':
+            source = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8',
+                                      newline='')
+        else:
+            source = open(path, encoding='utf-8', newline='')
+        rejected = open(rejected_path, 'w', encoding='utf-8')
+        tokens = open(options['tokens'], 'w', encoding='utf-8', newline='') \
+            if options['tokens'] else None
+
+        def on_reject(number, row, reason):
+            rejected.write(json.dumps({'line': number, 'reason': reason,
+                                       'row': row}) + '\n')
+
+        on_token = None
+        if tokens:
+            writer = csv.writer(tokens)
+            writer.writerow(['id', 'email', 'token'])
+
+            def on_token(user, raw):
+                writer.writerow([user.pk, user.email, raw])
+
+        try:
+            stats = provision.provision(
+                provision.read_rows(source, format),
+                batch_size=options['batch_size'], workers=options['workers'],
+                on_reject=on_reject, on_token=on_token,
+                is_active=True if options['active'] else None)
+        finally:
+            if path != '-':
+                source.close()
+            rejected.close()
+            if tokens:
+                tokens.close()
+
+        self.stdout.write(
+            '{created} users created, {rejected} rows rejected in '
+            '{seconds:.2f}s ({rate:.0f} rows/s)'.format(**stats))
+        if stats['rejected']:
+            self.stdout.write('Rejected rows written to ' + rejected_path)
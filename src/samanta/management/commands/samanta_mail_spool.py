@@ -0,0 +1,198 @@
+"""
+Hands the messages of the email spool (see samanta.core.mailer.spool) to the
+SMTP server of the EMAIL_HOST settings:
+
+    >>> python manage.py samanta_mail_spool --connections 4 --loop 5
+
+Every worker thread keeps one SMTP connection open for all its messages.
+A message is claimed by moving it from new/ to cur/, so several drainers can
+run at once. The claim time is appended to its name in cur/, and the
+messages claimed longer than MAIL_SPOOL_STALE ago, by a drainer that died,
+are moved back to new/. A message is deleted once the server accepted it,
+moved back to new/ on temporary errors and to failed/ when the server
+rejects it permanently.
+"""
+
+import os
+import re
+import time
+import smtplib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from samanta.conf import settings
+from samanta.core.mailer import spool
+
+logger = logging.getLogger('samanta.mail')
+
+SENT, RETRY, FAILED = 'sent', 'retry', 'failed'
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+CLAIM_SEPARATOR = ':'
+"""Separates the name of a message in cur/ from its claim time"""
+
+
+def claimed_name(name, now=None):
+    """:return: str: name in cur/ of a message claimed now"""
+    return '{}{}{:.0f}'.format(name, CLAIM_SEPARATOR,
+                               time.time() if now is None else now)
+
+
+def split_claimed(name):
+    """:return: tuple: (name of the message, claim time or None)"""
+    original, _, claimed = name.rpartition(CLAIM_SEPARATOR)
+    try:
+        return original, float(claimed)
+    except ValueError:
+        return name, None
+
+
+class Command(BaseCommand):
+    help = 'Sends the emails of the spool through SMTP.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spool', default=None,
+                            help='Spool folder. Default MAIL_SPOOL_DIR')
+        parser.add_argument('--connections', type=int, default=2,
+                            help='SMTP connections used in parallel')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Messages sent per connection before '
+                                 'reconnecting')
+        parser.add_argument(
+            '--smtp-backend', default=SMTP_BACKEND,
+            help='Dotted path of the SMTP email backend, e.g. a subclass '
+                 'with other credentials')
+        parser.add_argument(
+            '--loop', type=float, default=None, metavar='SECONDS',
+            help='Keeps running, checking the spool every given seconds')
+
+    def handle(self, *args, **options):
+        self.paths = spool.folders(options['spool'] or settings.MAIL_SPOOL_DIR)
+        self.backend = options['smtp_backend']
+        while True:
+            started = time.perf_counter()
+            results = self.drain(options['connections'], options['batch_size'])
+            if results[SENT] or results[RETRY] or results[FAILED] or \
+                    options['loop'] is None:
+                self.stdout.write(
+                    '{} sent, {} to retry, {} failed in {:.2f}s'.format(
+                        results[SENT], results[RETRY], results[FAILED],
+                        time.perf_counter() - started))
+            if options['loop'] is None:
+                break
+            time.sleep(options['loop'])
+
+    def recover(self):
+        """Moves back to new/ the messages claimed by a dead drainer"""
+        limit = time.time() - settings.MAIL_SPOOL_STALE
+        for name in os.listdir(self.paths['cur']):
+            path = os.path.join(self.paths['cur'], name)
+            original, claimed = split_claimed(name)
+            try:
+                if claimed is None:
+                    # claimed by an older version of this command
+                    claimed = os.path.getmtime(path)
+                if claimed < limit:
+                    os.rename(path, os.path.join(self.paths['new'], original))
+            except OSError:
+                # handled by another drainer
+                pass
+
+    def claim(self):
+        """:return: list of str: names in cur/ of the claimed messages"""
+        claimed = []
+        for name in sorted(os.listdir(self.paths['new'])):
+            # the name carries the claim time, for recover()
+            target = claimed_name(name)
+            try:
+                os.rename(os.path.join(self.paths['new'], name),
+                          os.path.join(self.paths['cur'], target))
+            except OSError:
+                # claimed by another drainer
+                continue
+            claimed.append(target)
+        return claimed
+
+    def drain(self, connections, batch_size):
+        """:return: dict: amount of messages per result"""
+        self.recover()
+        names = self.claim()
+        batches = [names[i:i + batch_size]
+                   for i in range(0, len(names), batch_size)]
+        results = {SENT: 0, RETRY: 0, FAILED: 0}
+        if not batches:
+            return results
+        with ThreadPoolExecutor(max(1, min(connections, len(batches)))) as \
+                executor:
+            for batch_results in executor.map(self.send_batch, batches):
+                for result in batch_results:
+                    results[result] += 1
+        return results
+
+    def send_batch(self, names):
+        """Sends the messages through a single SMTP connection
+
+        :return: list: result per message
+        """
+        backend = get_connection(self.backend)
+        results = []
+        try:
+            backend.open()
+            for name in names:
+                results.append(self.send(backend, name))
+        except Exception:
+            logger.exception('the SMTP connection failed')
+            for name in names[len(results):]:
+                self.finish(name, RETRY)
+                results.append(RETRY)
+        finally:
+            try:
+                backend.close()
+            except Exception:
+                pass
+        return results
+
+    def send(self, backend, name):
+        path = os.path.join(self.paths['cur'], name)
+        try:
+            with open(path, 'rb') as stream:
+                sender, recipients, message = spool.parse(stream.read())
+        except FileNotFoundError:
+            # taken as stale by another drainer, it is back in new/
+            logger.warning('%s was recovered before being sent', name)
+            return RETRY
+        if not sender or not recipients:
+            logger.error('%s has no envelope', name)
+            return self.finish(name, FAILED)
+        try:
+            backend.connection.sendmail(
+                sender, recipients, re.sub(b'\r?\n', b'\r\n', message))
+        except smtplib.SMTPRecipientsRefused as e:
+            # none accepted
+            permanent = all(code >= 500 for code, _ in e.recipients.values())
+            return self.finish(name, FAILED if permanent else RETRY)
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code >= 500:
+                logger.error('%s rejected: %s', name, e)
+                return self.finish(name, FAILED)
+            raise
+        return self.finish(name, SENT)
+
+    def finish(self, name, result):
+        path = os.path.join(self.paths['cur'], name)
+        try:
+            if result == SENT:
+                os.remove(path)
+            else:
+                os.rename(path, os.path.join(
+                    self.paths['new' if result == RETRY else 'failed'],
+                    split_claimed(name)[0]))
+        except FileNotFoundError:
+            # taken as stale by another drainer while it was being sent
+            logger.warning('%s was recovered while being sent, it may be '
+                           'sent again', name)
+        return result
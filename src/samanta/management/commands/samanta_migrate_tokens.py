@@ -0,0 +1,80 @@
+"""
+Moves the rows of the token tables (UserCreationLog, PasswordRecoveryLog and
+EmailChangeLog) into the unified AccountToken table, setting their purpose.
+
+The rows are copied in batches ordered by primary key. Every batch is
+inserted and removed from its source table in the same transaction, so the
+command can be stopped and run again at any time. Run it after setting
+DEFAULT_TOKEN_STORE to 'samanta.core.tokens.UnifiedTokenStore', e.g.:
+
+    >>> python manage.py samanta_migrate_tokens --batch-size 5000
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from samanta.models import (AccountToken, UserCreationLog, PasswordRecoveryLog,
+                            EmailChangeLog)
+
+TOKEN_MODELS = (UserCreationLog, PasswordRecoveryLog, EmailChangeLog)
+
+COPIED_FIELDS = ('user_id', 'email', 'token', 'salt', 'date', 'status')
+
+
+class Command(BaseCommand):
+    help = 'Moves the token logs into the unified AccountToken table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows moved per transaction')
+        parser.add_argument('--keep', action='store_true',
+                            help='Copies the rows without deleting them. '
+                                 'Running it twice duplicates them')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Just counts what would be moved')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        started = time.perf_counter()
+        total = 0
+        for model in TOKEN_MODELS:
+            moved = self.migrate(model, options['batch_size'],
+                                 options['keep'], options['dry_run'])
+            self.stdout.write('{}: {} rows'.format(model.PURPOSE, moved))
+            total += moved
+        self.stdout.write('{} rows {} in {:.2f}s'.format(
+            total, 'to move' if options['dry_run'] else 'moved',
+            time.perf_counter() - started))
+
+    def migrate(self, model, batch_size, keep=False, dry_run=False):
+        """Moves the rows of the given token model
+
+        :return: int: amount of moved (or movable) rows
+        """
+        if dry_run:
+            return model.objects.count()
+
+        last_pk = 0
+        moved = 0
+        while True:
+            rows = list(model.objects.filter(pk__gt=last_pk).order_by('pk')
+                        .values_list('pk', *COPIED_FIELDS)[:batch_size])
+            if not rows:
+                return moved
+            last_pk = rows[-1][0]
+
+            with transaction.atomic():
+                AccountToken.objects.bulk_create(
+                    AccountToken(purpose=model.PURPOSE,
+                                 **dict(zip(COPIED_FIELDS, row[1:])))
+                    for row in rows)
+                if not keep:
+                    model.objects.filter(
+                        pk__in=[row[0] for row in rows]).delete()
+            moved += len(rows)
+
+            if self.verbosity > 1:
+                self.stdout.write('  batch up to pk {}: {} rows'.format(
+                    last_pk, len(rows)))
@@ -0,0 +1,91 @@
+"""
+Deletes the accounts that were never activated, together with everything
+depending on them (token logs, team memberships...).
+
+The accounts are processed in batches ordered by primary key, every batch in
+its own transaction, so the locks are short and the command can be stopped at
+any time. With --loop it keeps running, e.g.:
+
+    >>> python manage.py samanta_purge_inactive --days 30 --loop 3600
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from samanta.conf import settings
+from samanta.models import SamUser
+
+
+class Command(BaseCommand):
+    help = 'Deletes the accounts never activated older than the given days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Minimum age of the accounts. Default PURGE_INACTIVE_AFTER')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Accounts deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Seconds to wait between batches')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Just counts what would be deleted')
+        parser.add_argument(
+            '--loop', type=float, default=None, metavar='SECONDS',
+            help='Keeps running, starting a new pass every given seconds')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        while True:
+            self.purge(options['days'], options['batch_size'],
+                       options['sleep'], options['dry_run'])
+            if options['loop'] is None:
+                break
+            time.sleep(options['loop'])
+
+    def purge(self, days, batch_size, sleep=0, dry_run=False):
+        """Runs a complete pass over the candidates
+
+        :return: int: amount of purged (or purgeable) accounts
+        """
+        days = settings.PURGE_INACTIVE_AFTER if days is None else days
+        started = time.perf_counter()
+        last_pk = 0
+        users = rows = 0
+
+        while True:
+            candidates = SamUser.objects.never_activated(days)
+            ids = list(candidates.filter(pk__gt=last_pk).order_by('pk')
+                       .values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_pk = ids[-1]
+
+            if dry_run:
+                users += len(ids)
+                continue
+
+            with transaction.atomic():
+                # the conditions are checked again, an account could have
+                # been activated since the ids were selected
+                total, per_model = candidates.filter(pk__in=ids).delete()
+            users += per_model.get(SamUser._meta.label, 0)
+            rows += total
+
+            if self.verbosity > 1:
+                self.stdout.write('  batch up to pk {}: {} rows'.format(
+                    last_pk, total))
+            if sleep:
+                time.sleep(sleep)
+
+        elapsed = time.perf_counter() - started
+        rate = users / elapsed if elapsed else 0.
+        if dry_run:
+            self.stdout.write('{} accounts would be purged ({:.2f}s)'.format(
+                users, elapsed))
+        else:
+            self.stdout.write(
+                '{} accounts purged, {} rows in total, in {:.2f}s '
+                '({:.0f} accounts/s)'.format(users, rows, elapsed, rate))
+        return users
@@ -0,0 +1,164 @@
+"""
+Opt-in instrumentation for the samanta views. Add it to the MIDDLEWARE setting
+(as outer as possible) to get, for every request:
+
+* a ``Server-Timing`` header with the time spent in the database, password
+  and token hashing, template rendering and email rendering and sending.
+* a structured log line in the logger ``samanta.timing``.
+* optionally, cProfile dumps of the slowest requests (see PROFILE_DIR).
+
+The ReplicaPinMiddleware keeps the clients that just wrote on the primary
+database, see samanta.routers.
+"""
+
+import os
+import cProfile
+import logging
+import random
+import time
+from collections import deque
+
+from django.db import connections
+
+from .conf import settings
+from .core import timing
+from . import routers
+
+logger = logging.getLogger('samanta.timing')
+
+
+class SlowestWindow:
+    """Keeps the latency of the recent requests in order to know if a request
+    is within the slowest given percent.
+
+    >>> window = SlowestWindow(size=100)
+    >>> for i in range(100):
+    ...     window.add(i)
+    >>> window.is_slowest(99, 5), window.is_slowest(10, 5)
+    (True, False)
+    """
+
+    def __init__(self, size=1000):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def is_slowest(self, seconds, percent):
+        """
+        :param seconds: float: latency of the request
+        :param percent: float: slowest percent to consider, e.g. 1 for the 1%
+        :return: bool: True if the latency is within the slowest percent
+        """
+        if not self.samples:
+            return True
+        ordered = sorted(self.samples)
+        index = int(len(ordered) * (100. - percent) / 100.)
+        return seconds >= ordered[min(index, len(ordered) - 1)]
+
+
+class TimingMiddleware:
+    """Measures the stages of every request and reports them"""
+
+    window = SlowestWindow()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profiler = self.start_profile()
+        timings = timing.start()
+        queries = self.start_queries()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop_queries(queries, timings)
+            timing.stop()
+            if profiler:
+                profiler.disable()
+
+        response['Server-Timing'] = timings.as_server_timing()
+        stages = timings.as_dict()
+        logger.info(
+            'method=%s path=%s status=%s %s', request.method, request.path,
+            response.status_code,
+            ' '.join('{}={}'.format(k, v) for k, v in stages.items()),
+            extra={'method': request.method, 'path': request.path,
+                   'status': response.status_code,
+                   'timings': stages})
+
+        self.window.add(timings.total)
+        if profiler and self.window.is_slowest(timings.total,
+                                               settings.PROFILE_SLOWEST_PERCENT):
+            self.dump_profile(profiler, request, timings)
+        return response
+
+    def start_profile(self):
+        """Starts cProfile for a sample of the requests
+
+        :return: cProfile.Profile or None if this request is not sampled
+        """
+        if not settings.PROFILE_DIR or \
+                random.random() >= settings.PROFILE_SAMPLE_RATE:
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def dump_profile(self, profiler, request, timings):
+        name = '{:.0f}ms-{}-{}-{}.prof'.format(
+            timings.total * 1e3, request.method,
+            request.path.strip('/').replace('/', '_') or 'root',
+            int(time.time() * 1e6))
+        path = os.path.join(settings.PROFILE_DIR, name)
+        profiler.dump_stats(path)
+        logger.info('profile dumped to %s', path)
+
+    def start_queries(self):
+        """Forces the debug cursor in order to collect the queries time
+
+        :return: list: (connection, previous flag, last query before) per db
+        """
+        state = []
+        for alias in connections:
+            connection = connections[alias]
+            log = connection.queries_log
+            state.append((connection, connection.force_debug_cursor,
+                          log[-1] if log else None))
+            connection.force_debug_cursor = True
+        return state
+
+    def stop_queries(self, state, timings):
+        seconds = 0.
+        for connection, force_debug_cursor, last in state:
+            connection.force_debug_cursor = force_debug_cursor
+            # keep just the queries run by this request. The log is bounded,
+            # so the older entries shift out and an index would not hold
+            for query in reversed(connection.queries_log):
+                if query is last:
+                    break
+                seconds += float(query['time'])
+        timings.add('db', seconds)
+
+
+class ReplicaPinMiddleware:
+    """Pins a client to the primary database during REPLICA_PIN_SECONDS
+    after a request of it wrote, with a short lived cookie. Without session
+    or database access, so it is cheap for the read only requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = settings.REPLICA_PIN_COOKIE
+        routers.reset(pinned=cookie in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if routers.has_written():
+                response.set_cookie(cookie, '1',
+                                    max_age=settings.REPLICA_PIN_SECONDS,
+                                    httponly=True)
+        finally:
+            routers.reset()
+        return response
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samanta', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='samuser',
+            name='updated_at',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+    ]
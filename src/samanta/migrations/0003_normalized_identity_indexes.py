@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Indexes over the normalized (upper case) username and email. They serve the
+case insensitive lookups done at login, by the registration forms and by the
+admin searches. Django does not manage expression indexes, so they are only
+created on PostgreSQL, where ``iexact`` and ``istartswith`` compare
+``UPPER(column::text)``.
+"""
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+INDEXES = (
+    ('samanta_samuser_username_upper', 'username'),
+    ('samanta_samuser_email_upper', 'email'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    quote = schema_editor.quote_name
+    table = apps.get_model('samanta', 'SamUser')._meta.db_table
+    for name, column in INDEXES:
+        schema_editor.execute(
+            'CREATE INDEX {} ON {} ((UPPER({}::text)) text_pattern_ops)'.format(
+                quote(name), quote(table), quote(column)))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(
+            schema_editor.quote_name(name)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samanta', '0002_samuser_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import samanta.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samanta', '0004_accounttoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvatarBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refs', models.IntegerField(default=0)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='samuser',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=samanta.storage.ContentAddressedStorage(), upload_to='avatars/'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samanta', '0005_avatarblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemographicCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gender', models.SmallIntegerField(choices=[(0, 'Not Telling'), (1, 'Feminine'), (2, 'Masculine'), (3, 'Other')])),
+                ('location', models.CharField(blank=True, max_length=2)),
+                ('language', models.CharField(blank=True, max_length=3)),
+                ('is_active', models.BooleanField()),
+                ('is_banned', models.BooleanField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='demographiccount',
+            unique_together=set([('gender', 'location', 'language', 'is_active', 'is_banned')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samanta', '0006_demographiccount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=32, unique=True)),
+                ('type', models.CharField(max_length=32)),
+                ('user_id', models.IntegerField(null=True)),
+                ('data', models.TextField(default='{}')),
+                ('date', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Sets the updated_at of the users saved before it was maintained to their
+date_joined, so the incremental exports (samanta_export_users --state) see
+them. The rows are updated in ranges of primary keys, to keep every
+statement short on large tables.
+"""
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import F, Max
+
+BATCH_SIZE = 10000
+
+
+def backfill(apps, schema_editor):
+    SamUser = apps.get_model('samanta', 'SamUser')
+    users = SamUser.objects.using(schema_editor.connection.alias)
+    last = users.aggregate(last=Max('pk'))['last'] or 0
+    for start in range(0, last, BATCH_SIZE):
+        users.filter(pk__gt=start, pk__lte=start + BATCH_SIZE,
+                     updated_at__isnull=True).update(
+            updated_at=F('date_joined'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samanta', '0007_accountevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
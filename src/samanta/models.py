@@ -4,14 +4,17 @@ from datetime import timedelta
 
 from django.utils import six
 from django.db import models
-from django.utils.translation import gettext as _
+from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from django.contrib.auth.models import (AbstractUser, UserManager, Permission,
                                         ASCIIUsernameValidator,
                                         UnicodeUsernameValidator)
 from django_countries.fields import CountryField
 
+from samanta.core import events
 from samanta.core.hasher import Hasher
+from samanta.core.timing import stage
+from samanta.storage import ContentAddressedStorage
 from . conf import settings
 from . import constants
 
@@ -62,6 +65,32 @@ class SamUserManager(UserManager):
         extra_fields.setdefault('is_active', settings.AUTO_ACTIVATE)
         return self._create_user(username, email, password, **extra_fields)
 
+    def never_activated(self, days=None):
+        """Accounts that were never activated and are older than the given
+        amount of days.
+
+        :param days: int: minimum age of the accounts. By default
+        PURGE_INACTIVE_AFTER
+        :return: QuerySet
+        """
+        if days is None:
+            days = settings.PURGE_INACTIVE_AFTER
+        threshold = timezone.now() - timedelta(days=days)
+        return self.filter(activated_at__isnull=True, is_active=False,
+                           is_staff=False, is_superuser=False,
+                           date_joined__lt=threshold)
+
+    def for_auth(self):
+        """Users as loaded by the authentication backends. With SLIM_USERS
+        just the SLIM_USER_FIELDS are read, the rest is loaded at once the
+        first time one of them is used.
+
+        :return: QuerySet
+        """
+        if settings.SLIM_USERS:
+            return self.only(*settings.SLIM_USER_FIELDS)
+        return self.all()
+
     def get_by_natural_key(self, username):
         case_insensitive_username_field = '{}__iexact'.format(self.model.USERNAME_FIELD)
         return self.get(**{case_insensitive_username_field: username})
@@ -91,11 +120,13 @@ class SamUser(AbstractUser):
     language = models.CharField(max_length=3, blank=True)
     gender = models.SmallIntegerField(choices=constants.Genders.tuples(),
                                       default=constants.Genders.NOTTELLING.id)
-    avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    avatar = models.ImageField(upload_to='avatars/', null=True, blank=True,
+                               storage=ContentAddressedStorage())
 
     # Creation and updates
     activated_at = models.DateTimeField(null=True)
-    updated_at = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(null=True, db_index=True)
+    """Last change of the row. Used by the incremental exports"""
 
     # Statuses
     is_active = models.BooleanField(default=False)
@@ -115,6 +146,32 @@ class SamUser(AbstractUser):
         verbose_name = _('user')
         verbose_name_plural = _('users')
 
+    def refresh_from_db(self, using=None, fields=None):
+        """Loads all the deferred fields at once when one of them is used,
+        instead of a query per field
+        """
+        if fields is not None:
+            deferred = self.get_deferred_fields()
+            if deferred and deferred.issuperset(fields):
+                fields = list(deferred)
+        super(SamUser, self).refresh_from_db(using, fields)
+
+    def set_password(self, raw_password):
+        with stage('hash'):
+            super(SamUser, self).set_password(raw_password)
+
+    def check_password(self, raw_password):
+        with stage('hash'):
+            return super(SamUser, self).check_password(raw_password)
+
+    def save(self, *args, **kwargs):
+        """Keeps updated_at in sync, also for the partial updates"""
+        self.updated_at = timezone.now()
+        update_fields = kwargs.get('update_fields')
+        if update_fields and 'updated_at' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['updated_at']
+        super(SamUser, self).save(*args, **kwargs)
+
     def get_full_name(self):
         """
         Returns the first_name plus the last_name, with a space in between.
@@ -139,6 +196,16 @@ class SamUser(AbstractUser):
 
         return str_.format(md5=md5, size=size)
 
+    def avatar_url(self, size=100):
+        """URL of the avatar for the given size, the gravatar until the
+        uploaded avatar is processed. See samanta.core.avatars
+
+        :param size: int: displayed size in px
+        :return: str
+        """
+        from samanta.core import avatars
+        return avatars.url(self, size)
+
     def ban_to(self, until):
         """ Sets the ban over the user until the given date
         :param until: date: date to release the user
@@ -146,6 +213,7 @@ class SamUser(AbstractUser):
         """
         self.unban_time = until
         self.save(update_fields=['unban_time'])
+        events.emit(events.BANNED, self, until=until.isoformat())
 
     @property
     def is_banned(self):
@@ -168,6 +236,68 @@ class SamUser(AbstractUser):
         """
         self.unban_time = None
         self.save(update_fields=['unban_time'])
+        events.emit(events.UNBANNED, self)
+
+
+class AvatarBlob(models.Model):
+    """Avatar file stored once under the digest of its content, see
+    samanta.storage.ContentAddressedStorage"""
+
+    name = models.CharField(max_length=255, unique=True)
+    """Storage name of the file"""
+    size = models.BigIntegerField(default=0)
+    refs = models.IntegerField(default=0)
+    """Amount of users using it as avatar"""
+    created = models.DateTimeField(default=timezone.now)
+    last_used = models.DateTimeField(default=timezone.now)
+    """Last upload of the content or dropped reference. The grace of
+    samanta_avatar_gc counts from it"""
+
+    class Meta:
+        app_label = 'samanta'
+
+    def __str__(self):
+        return self.name
+
+
+class DemographicCount(models.Model):
+    """Amount of users with a combination of demographics, kept up to date
+    by samanta.core.demographics"""
+
+    gender = models.SmallIntegerField(choices=constants.Genders.tuples())
+    location = models.CharField(max_length=2, blank=True)
+    language = models.CharField(max_length=3, blank=True)
+    is_active = models.BooleanField()
+    is_banned = models.BooleanField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        app_label = 'samanta'
+        unique_together = ('gender', 'location', 'language', 'is_active',
+                           'is_banned')
+
+    def __str__(self):
+        return '{} {} {} {} {}: {}'.format(
+            self.gender, self.location, self.language, self.is_active,
+            self.is_banned, self.count)
+
+
+class AccountEvent(models.Model):
+    """Account event stored by samanta.core.events.DatabaseSink"""
+
+    event_id = models.CharField(max_length=32, unique=True)
+    type = models.CharField(max_length=32)
+    user_id = models.IntegerField(null=True)
+    """Not a foreign key, the events outlive the users"""
+    data = models.TextField(default='{}')
+    """JSON details"""
+    date = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = 'samanta'
+
+    def __str__(self):
+        return '{} {}'.format(self.type, self.event_id)
 
 
 # ============================== Tokens =======================================
@@ -208,6 +338,9 @@ class TokenBasedActivation(models.Model):
 
     objects = TokenModelManeger()
 
+    PURPOSE = None
+    """Name of the token kind, used in logs and metrics"""
+
     class Meta:
         abstract = True
         app_label = 'samanta'
@@ -239,14 +372,37 @@ class TokenBasedActivation(models.Model):
 
 class UserCreationLog(TokenBasedActivation):
     """Used to validate the generation of new user and log of their creation"""
-    pass
+    PURPOSE = 'register'
 
 
 class PasswordRecoveryLog(TokenBasedActivation):
     """Used to validate the password recovery of the users """
-    pass
+    PURPOSE = 'password_recovery'
 
 
 class EmailChangeLog(TokenBasedActivation):
     """Used to validate the email change of the users"""
-    pass
+    PURPOSE = 'email_change'
+
+
+class AccountToken(TokenBasedActivation):
+    """Single table for the tokens of every purpose, used by
+    samanta.core.tokens.UnifiedTokenStore. The lookups by user, purpose and
+    status, as well as the cascade of the user deletion, are served by one
+    composite index.
+    """
+
+    user = models.ForeignKey(SamUser, on_delete=models.CASCADE, null=False,
+                             db_index=False)
+    """Token owner. Indexed as the prefix of the composite index"""
+    purpose = models.CharField(max_length=32, null=False)
+    """PURPOSE of the token kind, e.g. 'password_recovery'"""
+    date = models.DateTimeField(default=timezone.now, null=False)
+    """Creation date. Not auto_now_add so the copied rows keep their date"""
+
+    class Meta:
+        app_label = 'samanta'
+        indexes = [
+            models.Index(fields=['user', 'purpose', 'status'],
+                         name='samanta_acctoken_lookup_idx'),
+        ]
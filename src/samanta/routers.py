@@ -0,0 +1,106 @@
+"""
+Database router sending the reads of the samanta models to read replicas and
+the writes to the primary database. Add it to the project settings:
+
+    DATABASE_ROUTERS = ['samanta.routers.ReplicaRouter']
+
+    DATABASE_REPLICAS = ['replica']
+
+To keep the read-your-writes consistency (e.g. confirming the account right
+after registering), the reads go to the primary:
+
+* during the rest of the request after a write. The pin is dropped at the
+  start and end of every request, with or without the middleware. Out of
+  the requests, it lasts until :func:`reset` is called.
+* during REPLICA_PIN_SECONDS after a write for the same client, if the
+  ReplicaPinMiddleware is enabled.
+
+It can be tried locally with two SQLite databases, the replica mirroring the
+primary in the tests:
+
+    DATABASES = {
+        'default': {'ENGINE': 'django.db.backends.sqlite3',
+                    'NAME': 'db.sqlite3'},
+        'replica': {'ENGINE': 'django.db.backends.sqlite3',
+                    'NAME': 'db.sqlite3', 'TEST': {'MIRROR': 'default'}},
+    }
+"""
+
+import random
+import threading
+
+from django.core.signals import request_started, request_finished
+from django.dispatch import receiver
+
+from .conf import settings
+
+_state = threading.local()
+
+
+def is_pinned():
+    """:return: bool: True if the reads of this thread go to the primary"""
+    return getattr(_state, 'pinned', False)
+
+
+def pin():
+    """Sends the next reads of this thread to the primary"""
+    _state.pinned = True
+    _state.written = True
+
+
+def reset(pinned=False):
+    """Starts a new unit of work, e.g. a request
+
+    :param pinned: bool: if the reads go to the primary from the start
+    """
+    _state.pinned = pinned
+    _state.written = False
+
+
+@receiver(request_started)
+@receiver(request_finished)
+def _reset_request(**kwargs):
+    # the worker threads serve many requests, a write must not pin them for
+    # good
+    reset()
+
+
+def has_written():
+    """:return: bool: True if this unit of work wrote in the primary"""
+    return getattr(_state, 'written', False)
+
+
+class ReplicaRouter:
+    """Routes the samanta models between the primary and the replicas"""
+
+    primary = 'default'
+    app_label = 'samanta'
+
+    def _applies(self, model):
+        return model._meta.app_label == self.app_label
+
+    def db_for_read(self, model, **hints):
+        if not self._applies(model):
+            return None
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or is_pinned():
+            return self.primary
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if not self._applies(model):
+            return None
+        pin()
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {self.primary}.union(settings.DATABASE_REPLICAS)
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == self.app_label and db in settings.DATABASE_REPLICAS:
+            # the replicas receive the schema from the primary
+            return False
+        return None
@@ -0,0 +1,170 @@
+"""
+Content addressed storage of the avatars. Every upload is hashed while it is
+streamed in chunks and stored once, as ``<folder>/<ab>/<sha256><ext>``:
+uploading an image already stored writes nothing.
+
+The AvatarBlob rows keep how many users reference every stored file. The
+counts follow the changes of SamUser.avatar (post_save and post_delete), and
+the command samanta_avatar_gc deletes the files no user references anymore.
+"""
+
+import os
+import hashlib
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+from .conf import settings
+
+_UNKNOWN = object()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage storing the files under the digest of their content.
+    The files within ``plain_folders`` (e.g. the size variants of the
+    avatars) keep their names. With AVATAR_DEDUPE False it behaves as the
+    FileSystemStorage.
+    """
+
+    chunk_size = 64 * 1024
+    plain_folders = ('sizes',)
+
+    def is_addressed(self, name):
+        if not settings.AVATAR_DEDUPE:
+            return False
+        folders = os.path.dirname(name).replace('\\', '/').split('/')
+        return not set(folders).intersection(self.plain_folders)
+
+    def digest(self, content):
+        """:return: str: sha256 of the content, read in chunks"""
+        sha = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks(self.chunk_size):
+            sha.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return sha.hexdigest()
+
+    def blob_name(self, name, digest):
+        folder = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return '/'.join(part for part in (folder, digest[:2],
+                                          digest + extension) if part)
+
+    def get_available_name(self, name, max_length=None):
+        if self.is_addressed(name):
+            # the final name is the digest, chosen by _save
+            return name
+        return super(ContentAddressedStorage, self).get_available_name(
+            name, max_length)
+
+    def _save(self, name, content):
+        if not self.is_addressed(name):
+            return super(ContentAddressedStorage, self)._save(name, content)
+
+        from .models import AvatarBlob
+        name = self.blob_name(name, self.digest(content))
+        # an unreferenced blob uploaded again restarts its grace, so the gc
+        # does not delete it before the user is saved
+        if not AvatarBlob.objects.filter(name=name).update(
+                last_used=timezone.now()):
+            AvatarBlob.objects.get_or_create(name=name,
+                                             defaults={'size': content.size})
+        if self.exists(name):
+            return name
+
+        # written aside and renamed: a concurrent upload of the same content
+        # just replaces the file with the same bytes
+        path = self.path(name)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                for chunk in content.chunks(self.chunk_size):
+                    stream.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp, self.file_permissions_mode)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return name
+
+    def delete_unreferenced(self, name):
+        """Deletes a file whose AvatarBlob row was deleted. An upload of the
+        same content in between recreates the row and, finding the file,
+        writes nothing. So the file is moved aside before checking the row
+        again, and moved back if the row exists: an upload after the move
+        writes the file again.
+
+        :param name: str: stored name
+        :return: bool: False if the file is in use again
+        """
+        from .models import AvatarBlob
+        path = self.path(name)
+        aside = path + '.gc'
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return True
+        if AvatarBlob.objects.filter(name=name).exists():
+            # same bytes as a file written after the move, if any
+            os.replace(aside, path)
+            return False
+        os.remove(aside)
+        return True
+
+
+def _avatar_name(instance):
+    if 'avatar' not in instance.__dict__:
+        # deferred
+        return _UNKNOWN
+    value = instance.__dict__['avatar']
+    return getattr(value, 'name', value) or ''
+
+
+def _count(name, delta):
+    from .models import AvatarBlob
+    if name and name is not _UNKNOWN:
+        values = {'refs': F('refs') + delta}
+        if delta < 0:
+            # the grace of an unreferenced file starts now
+            values['last_used'] = timezone.now()
+        AvatarBlob.objects.filter(name=name).update(**values)
+
+
+@receiver(post_init, sender='samanta.SamUser',
+          dispatch_uid='samanta_avatar_init')
+def _remember_avatar(sender, instance, **kwargs):
+    instance._stored_avatar = _avatar_name(instance)
+
+
+@receiver(post_save, sender='samanta.SamUser',
+          dispatch_uid='samanta_avatar_save')
+def _avatar_saved(sender, instance, created, **kwargs):
+    current = _avatar_name(instance)
+    stored = '' if created else getattr(instance, '_stored_avatar', _UNKNOWN)
+    if current is _UNKNOWN or current == stored:
+        return
+    if stored is _UNKNOWN:
+        # loaded after the instance, the previous value is not known.
+        # samanta_avatar_gc --recount fixes the counts
+        stored = None
+    _count(current, 1)
+    _count(stored, -1)
+    instance._stored_avatar = current
+
+
+@receiver(post_delete, sender='samanta.SamUser',
+          dispatch_uid='samanta_avatar_delete')
+def _avatar_deleted(sender, instance, **kwargs):
+    _count(_avatar_name(instance), -1)
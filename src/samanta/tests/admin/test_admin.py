@@ -0,0 +1,70 @@
+from django.contrib.admin.sites import AdminSite
+from django.test import TestCase, RequestFactory, override_settings
+from django.contrib.messages.storage.fallback import FallbackStorage
+
+from samanta import models
+from samanta.admin import SamUserAdmin, EstimatedCountPaginator
+User = models.SamUser
+
+
+class TestSamUserAdmin(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        self.admin = SamUserAdmin(User, AdminSite())
+        self.team = models.Teams.objects.create(name='blue')
+
+    def request(self, **data):
+        request = RequestFactory().post('/', data)
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return request
+
+    @override_settings(ADMIN_BATCH_SIZE=2)
+    def test_ban_unban(self):
+        queryset = User.objects.all()
+        self.admin.ban(self.request(days=3), queryset)
+        self.assertFalse(User.objects.filter(unban_time=None).exists())
+        self.admin.unban(self.request(), queryset)
+        self.assertFalse(User.objects.exclude(unban_time=None).exists())
+
+    def test_ban_days(self):
+        queryset = User.objects.all()
+        for days in ('abc', '-3', '0'):
+            self.admin.ban(self.request(days=days), queryset)
+        self.assertFalse(User.objects.exclude(unban_time=None).exists())
+        self.admin.ban(self.request(), queryset)
+        self.assertFalse(User.objects.filter(unban_time=None).exists())
+
+    def test_activate(self):
+        self.admin.activate(self.request(), User.objects.filter(pk__in=[1, 2]))
+        self.assertEqual(
+            list(User.objects.filter(is_active=True).values_list('pk', flat=True)
+                 .order_by('pk')), [1, 2])
+        self.assertFalse(User.objects.filter(is_active=True,
+                                             activated_at=None).exists())
+
+    def test_assign_team(self):
+        User.objects.get(pk=1).teams.add(self.team)
+        self.admin.assign_team(self.request(team=self.team.pk),
+                               User.objects.all())
+        self.assertEqual(self.team.samuser_set.count(), 3)
+
+    def test_assign_team_invalid(self):
+        for team in ('abc', self.team.pk + 1, ''):
+            self.admin.assign_team(self.request(team=team), User.objects.all())
+        self.assertFalse(User.teams.through.objects.exists())
+
+    @override_settings(ADMIN_COUNT_LIMIT=2)
+    def test_paginator_capped(self):
+        paginator = EstimatedCountPaginator(User.objects.all(), 1)
+        self.assertEqual(paginator.count, 2)
+
+    def test_changelist(self):
+        superuser = User.objects.get(pk=1)
+        superuser.is_active = True
+        superuser.save()
+        self.client.force_login(superuser)
+        response = self.client.get('/admin/samanta/samuser/?q=us')
+        self.assertEqual(response.status_code, 200)
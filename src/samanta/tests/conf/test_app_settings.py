@@ -0,0 +1,31 @@
+from django.test import SimpleTestCase, override_settings
+from samanta.conf import settings, Settings
+
+
+class TestAppSettings(SimpleTestCase):
+
+    def setUp(self):
+        settings.clear_cache()
+
+    def test_fallback(self):
+        """The app default is used if the project does not define it"""
+        self.assertEqual(settings.TEAM_NAME, Settings.TEAM_NAME)
+
+    def test_memoized(self):
+        """Once resolved, the value is served from the memo"""
+        value = settings.TOKEN_SPAN_VALIDITY
+        self.assertEqual(settings._cache['TOKEN_SPAN_VALIDITY'], value)
+
+    def test_override(self):
+        """override_settings invalidates the memoized value in and out"""
+        default = settings.TOKEN_SPAN_VALIDITY
+        with override_settings(TOKEN_SPAN_VALIDITY=default + 10):
+            self.assertEqual(settings.TOKEN_SPAN_VALIDITY, default + 10)
+        self.assertEqual(settings.TOKEN_SPAN_VALIDITY, default)
+
+    def test_clear_single(self):
+        settings.APP_NAME
+        settings.TEAM_NAME
+        settings.clear_cache('APP_NAME')
+        self.assertNotIn('APP_NAME', settings._cache)
+        self.assertIn('TEAM_NAME', settings._cache)
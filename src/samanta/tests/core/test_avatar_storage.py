@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from samanta import models
+User = models.SamUser
+
+
+@override_settings(AVATAR_WORKERS=0)
+class TestContentAddressedStorage(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        media = override_settings(MEDIA_ROOT=self.folder)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.users = list(User.objects.order_by('pk'))
+
+    def upload(self, user, content=b'same bytes', name='pic.PNG'):
+        user.avatar.save(name, ContentFile(content))
+        return user.avatar.name
+
+    def files(self):
+        return sorted(os.path.relpath(os.path.join(root, name), self.folder)
+                      for root, _, names in os.walk(self.folder)
+                      for name in names)
+
+    def test_dedupe(self):
+        names = [self.upload(user, name='u{}.png'.format(user.pk))
+                 for user in self.users]
+        self.assertEqual(len(set(names)), 1)
+        self.assertTrue(names[0].startswith('avatars/'))
+        self.assertTrue(names[0].endswith('.png'))
+        self.assertEqual(len(self.files()), 1)
+        blob = models.AvatarBlob.objects.get()
+        self.assertEqual(blob.refs, 3)
+        self.assertEqual(blob.size, len(b'same bytes'))
+
+    def test_refs(self):
+        first = self.upload(self.users[0])
+        self.upload(self.users[0], b'other bytes')
+        self.assertEqual(models.AvatarBlob.objects.get(name=first).refs, 0)
+        self.users[0].delete()
+        self.assertFalse(models.AvatarBlob.objects.filter(refs__gt=0).exists())
+
+    def test_gc(self):
+        kept = self.upload(self.users[0])
+        dropped = self.upload(self.users[1], b'dropped')
+        self.users[1].avatar = None
+        self.users[1].save()
+        models.AvatarBlob.objects.update(
+            last_used=timezone.now() - timedelta(days=2))
+
+        out = StringIO()
+        call_command('samanta_avatar_gc', stdout=out)
+        self.assertIn('1 files deleted', out.getvalue())
+        self.assertEqual(self.files(), [kept])
+        self.assertFalse(models.AvatarBlob.objects.filter(
+            name=dropped).exists())
+
+    def test_gc_checks_users(self):
+        name = self.upload(self.users[0])
+        models.AvatarBlob.objects.update(
+            refs=0, last_used=timezone.now() - timedelta(days=2))
+        call_command('samanta_avatar_gc', stdout=StringIO())
+        self.assertEqual(self.files(), [name])
+
+        out = StringIO()
+        call_command('samanta_avatar_gc', '--recount', stdout=out)
+        self.assertIn('1 reference counts fixed', out.getvalue())
+        self.assertEqual(models.AvatarBlob.objects.get().refs, 1)
+
+    def test_gc_upload_race(self):
+        name = self.upload(self.users[0])
+        self.users[0].avatar = None
+        self.users[0].save()
+        models.AvatarBlob.objects.update(
+            last_used=timezone.now() - timedelta(days=2))
+        storage = User._meta.get_field('avatar').storage
+        delete = storage.delete_unreferenced
+
+        def upload_in_between(name):
+            # the row is gone but the file is still there
+            self.upload(self.users[1])
+            return delete(name)
+
+        with mock.patch.object(storage, 'delete_unreferenced',
+                               upload_in_between):
+            out = StringIO()
+            call_command('samanta_avatar_gc', stdout=out)
+        self.assertIn('0 files deleted', out.getvalue())
+        self.assertEqual(self.files(), [name])
+        self.assertEqual(models.AvatarBlob.objects.get(name=name).refs, 1)
+
+    def test_gc_upload_before_save(self):
+        name = self.upload(self.users[0])
+        self.users[0].avatar = None
+        self.users[0].save()
+        models.AvatarBlob.objects.update(
+            created=timezone.now() - timedelta(days=30),
+            last_used=timezone.now() - timedelta(days=2))
+        # stored again, the user is not saved yet
+        storage = User._meta.get_field('avatar').storage
+        self.assertEqual(storage.save('avatars/pic.png',
+                                      ContentFile(b'same bytes')), name)
+
+        out = StringIO()
+        call_command('samanta_avatar_gc', stdout=out)
+        self.assertIn('0 files deleted', out.getvalue())
+        self.assertEqual(self.files(), [name])
+
+    def test_grace(self):
+        self.upload(self.users[0])
+        self.users[0].avatar = None
+        self.users[0].save()
+        out = StringIO()
+        call_command('samanta_avatar_gc', stdout=out)
+        self.assertIn('0 files deleted', out.getvalue())
+
+    def test_disabled(self):
+        with self.settings(AVATAR_DEDUPE=False):
+            name = self.upload(self.users[0], name='pic.png')
+        self.assertEqual(name, 'avatars/pic.png')
+        self.assertFalse(models.AvatarBlob.objects.exists())
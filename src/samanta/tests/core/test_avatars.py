@@ -0,0 +1,113 @@
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+from PIL import Image
+
+from samanta import models
+from samanta.core import avatars
+User = models.SamUser
+
+
+def image(size=(300, 200), format='PNG'):
+    data = io.BytesIO()
+    Image.new('RGB', size, 'red').save(data, format)
+    return data.getvalue()
+
+
+@override_settings(AVATAR_WORKERS=0, AVATAR_SIZES=(40, 100))
+class TestAvatars(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        caches['default'].clear()
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        media = override_settings(MEDIA_ROOT=folder)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.get(id=3)
+
+    def upload(self):
+        self.user.avatar.save('me.png', ContentFile(image()))
+        return self.user.avatar.name
+
+    def test_inspect(self):
+        upload = SimpleUploadedFile('me.jpg', image(format='JPEG'))
+        self.assertEqual(avatars.inspect(upload), ('JPEG', (300, 200)))
+        self.assertEqual(upload.tell(), 0)
+
+    def test_invalid(self):
+        cases = [(SimpleUploadedFile('me.png', b'not an image'),
+                  'invalid_image'),
+                 (SimpleUploadedFile('me.bmp', image(format='BMP')),
+                  'invalid_format')]
+        for upload, code in cases:
+            with self.assertRaises(avatars.InvalidAvatar) as e:
+                avatars.inspect(upload)
+            self.assertEqual(e.exception.args[1], code)
+        with self.settings(AVATAR_MAX_PIXELS=100):
+            with self.assertRaises(avatars.InvalidAvatar):
+                avatars.inspect(SimpleUploadedFile('me.png', image()))
+
+    def test_gravatar_until_processed(self):
+        name = self.upload()
+        self.assertEqual(self.user.avatar_url(40), self.user.gravatar(40))
+
+        written = avatars.process(name)
+        self.assertEqual(len(written), 2)
+        url = self.user.avatar_url(30)
+        self.assertTrue(url.endswith(avatars.variant_name(name, 40)))
+        storage = avatars._storage()
+        with storage.open(avatars.variant_name(name, 100)) as stream:
+            self.assertEqual(Image.open(stream).size, (100, 100))
+
+    def test_no_avatar(self):
+        self.assertEqual(self.user.avatar_url(), self.user.gravatar(100))
+
+    def test_discard(self):
+        name = self.upload()
+        avatars.process(name)
+        avatars.discard(name)
+        self.assertEqual(self.user.avatar_url(100), self.user.gravatar(100))
+
+    def test_worker_connections(self):
+        name = self.upload()
+        with mock.patch.object(avatars, 'close_old_connections') as close, \
+                mock.patch.object(avatars, 'process', side_effect=IOError):
+            avatars._run(name, None)
+        # before and after the job, also when it fails
+        self.assertEqual(close.call_count, 2)
+
+    def test_profile_edit(self):
+        User.objects.filter(pk=3).update(is_active=True)
+        self.client.force_login(User.objects.get(pk=3))
+        response = self.client.post('/account/edit/', {
+            'gender': self.user.gender,
+            'avatar': SimpleUploadedFile('me.png', image())})
+        self.assertEqual(response.status_code, 302)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar.name.startswith('avatars/'))
+        # replacing it also updates the count of the previous one
+        response = self.client.post('/account/edit/', {
+            'gender': self.user.gender,
+            'avatar': SimpleUploadedFile('me.png', image((10, 10)))})
+        self.assertEqual(response.status_code, 302)
+
+    def test_command(self):
+        name = self.upload()
+        out = StringIO()
+        call_command('samanta_avatar_variants', stdout=out)
+        self.assertIn('1 avatars processed', out.getvalue())
+        self.assertTrue(avatars._storage().exists(
+            avatars.variant_name(name, 100)))
+        call_command('samanta_avatar_variants', stdout=out)
+        self.assertIn('0 avatars processed', out.getvalue())
@@ -0,0 +1,85 @@
+import re
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from samanta import models
+from samanta.core import challenges
+
+PASSWORD = 'Secret-pass-123'
+
+
+@override_settings(USE_CAPTCHA=True, USE_CAPTCHA_POOL=True,
+                   CAPTCHA_POOL_SIZE=3)
+class TestChallengePool(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        challenges.fill()
+
+    def answer(self, challenge_id):
+        return caches['default'].get(
+            challenges.CHALLENGE_KEY.format(challenge_id))['response']
+
+    def test_check(self):
+        challenge_id, token = challenges.pick()
+        self.assertFalse(challenges.check(token, 'wrong'))
+        # consumed by the wrong answer
+        self.assertFalse(challenges.check(token, self.answer(challenge_id)))
+
+        challenge_id, token = challenges.pick()
+        answer = self.answer(challenge_id)
+        self.assertTrue(challenges.check(token, answer))
+        self.assertFalse(challenges.check(token, answer))
+
+    @override_settings(CAPTCHA_POOL_SIZE=1)
+    def test_retired(self):
+        challenge_id, token = challenges.pick()
+        answer = self.answer(challenge_id)
+        same_id, other = challenges.pick()
+        self.assertEqual(same_id, challenge_id)
+        self.assertTrue(challenges.check(token, answer))
+        # a solved challenge does not pass with a fresh token
+        self.assertFalse(challenges.check(other, answer))
+        self.assertIsNone(challenges.image(challenge_id))
+
+        new_id, token = challenges.pick()
+        self.assertNotEqual(new_id, challenge_id)
+        self.assertTrue(challenges.check(token, self.answer(new_id)))
+
+    def test_forged_token(self):
+        self.assertFalse(challenges.check('forged', 'x'))
+
+    def test_image(self):
+        challenge_id, _ = challenges.pick()
+        response = self.client.get('/captcha/pool/{}.png'.format(challenge_id))
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertEqual(self.client.get('/captcha/pool/00.png').status_code,
+                         410)
+
+    def test_register_get(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/register/')
+        html = response.content.decode()
+        self.assertIn('/captcha/pool/', html)
+        self.assertNotIn('/captcha/image/', html)
+
+    def test_register_post(self):
+        html = self.client.get('/register/').content.decode()
+        challenge_id = re.search(r'/captcha/pool/(\w+)\.png', html).group(1)
+        token = re.search(r'name="captcha_0" value="([^"]+)"', html).group(1)
+        data = {'username': 'new', 'email': 'new@mail.com',
+                'email2': 'new@mail.com', 'password1': PASSWORD,
+                'password2': PASSWORD, 'terms_of_service': 'on',
+                'captcha_0': token, 'captcha_1': 'wrong'}
+        self.client.post('/register/', data)
+        self.assertFalse(models.SamUser.objects.filter(username='new').exists())
+
+        html = self.client.get('/register/').content.decode()
+        challenge_id = re.search(r'/captcha/pool/(\w+)\.png', html).group(1)
+        data['captcha_0'] = re.search(r'name="captcha_0" value="([^"]+)"',
+                                      html).group(1)
+        data['captcha_1'] = self.answer(challenge_id)
+        self.client.post('/register/', data)
+        self.assertTrue(models.SamUser.objects.filter(username='new').exists())
@@ -0,0 +1,75 @@
+from django.core import mail
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from samanta import models
+from samanta.core import cooldown, metrics
+User = models.SamUser
+
+
+class TestCooldown(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        caches['default'].clear()
+        metrics.REGISTRY.reset()
+        self.user = User.objects.get(id=3)
+
+    def recover(self, times):
+        for _ in range(times):
+            response = self.client.post('/password/recover/',
+                                        {'email': self.user.email})
+            self.assertRedirects(response, '/', fetch_redirect_response=False)
+
+    def test_coalesced(self):
+        self.recover(3)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(models.PasswordRecoveryLog.objects.count(), 1)
+        data = metrics.REGISTRY.collect(shared=False)
+        self.assertEqual(data['samanta_token_requests_total']
+                         ['["password_recovery", "suppressed"]'], 2)
+
+    @override_settings(TOKEN_COOLDOWNS={'password_recovery': (300, 2)})
+    def test_limit(self):
+        self.recover(3)
+        self.assertEqual(len(mail.outbox), 2)
+
+    @override_settings(TOKEN_COOLDOWNS={})
+    def test_disabled(self):
+        self.recover(2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_release(self):
+        self.assertTrue(cooldown.allow('password_recovery', self.user.pk))
+        self.assertFalse(cooldown.allow('password_recovery', self.user.pk))
+        cooldown.release('password_recovery', self.user.pk)
+        self.assertTrue(cooldown.allow('password_recovery', self.user.pk))
+
+    def test_email_change_target(self):
+        self.user.is_active = True
+        self.user.set_password('Secret-pass-123')
+        self.user.save()
+        self.client.force_login(self.user)
+        for email in ('typo@mail.com', 'typo@mail.com', 'fixed@mail.com'):
+            self.client.post('/email/change/', {
+                'password': 'Secret-pass-123', 'email_new': email,
+                'email_new2': email})
+        self.assertEqual([message.to for message in mail.outbox],
+                         [['typo@mail.com'], ['fixed@mail.com']])
+        self.assertTrue(models.EmailChangeLog.objects.filter(
+            email='fixed@mail.com').exists())
+
+    @override_settings(TOKEN_COOLDOWNS={'email_change': (300, 1, 3)})
+    def test_email_change_user_limit(self):
+        self.user.is_active = True
+        self.user.set_password('Secret-pass-123')
+        self.user.save()
+        self.client.force_login(self.user)
+        for i in range(4):
+            email = 'new{}@mail.com'.format(i)
+            self.client.post('/email/change/', {
+                'password': 'Secret-pass-123', 'email_new': email,
+                'email_new2': email})
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(models.EmailChangeLog.objects.count(), 3)
@@ -0,0 +1,124 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from samanta.admin import bulk_update
+from samanta.core import demographics
+from samanta.models import SamUser, DemographicCount
+from samanta.views.mixins import TRANSACTION_STATEMENTS
+
+
+@override_settings(DEMOGRAPHICS=True, DEMOGRAPHICS_FLUSH_INTERVAL=0)
+class TestDemographics(TransactionTestCase):
+    # on_commit is needed, the deltas are recorded after the commit
+    fixtures = ['users.json']
+
+    def test_fixtures(self):
+        self.assertEqual(demographics.total(), 3)
+        self.assertEqual(demographics.counts('is_active'), {False: 3})
+
+    def test_changes(self):
+        user = SamUser.objects.get(pk=3)
+        user.location = 'CL'
+        user.save()
+        self.assertEqual(demographics.counts('location'), {'': 2, 'CL': 1})
+
+        user.is_active = True
+        user.save()
+        self.assertEqual(demographics.counts('location', 'is_active'),
+                         {('', False): 2, ('CL', True): 1})
+
+        user.ban_to(timezone.now().date() + timedelta(days=2))
+        self.assertEqual(demographics.total(is_banned=True), 1)
+
+        SamUser.objects.create_user('new', 'new@mail.com', 'pass',
+                                    language='es')
+        self.assertEqual(demographics.counts('language'), {'': 3, 'es': 1})
+
+        user.delete()
+        self.assertEqual(demographics.total(), 3)
+        self.assertEqual(demographics.total(location='CL'), 0)
+
+    def test_deferred(self):
+        user = SamUser.objects.only('username').get(pk=3)
+        with CaptureQueriesContext(connection) as captured:
+            # like update_last_login. Saving a field never loaded would
+            # read the deferred ones first, demographics or not
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+        # autocommit adds its BEGIN
+        self.assertEqual([query['sql'].split()[0]
+                          for query in captured.captured_queries
+                          if not query['sql'].startswith(
+                              TRANSACTION_STATEMENTS)], ['UPDATE'])
+
+        user.language = 'es'
+        user.save(update_fields=['language'])
+        self.assertEqual(demographics.counts('language'), {'': 2, 'es': 1})
+
+    def test_bulk_update(self):
+        bulk_update(SamUser.objects.filter(pk__in=[1, 2]), is_active=True)
+        self.assertEqual(demographics.counts('is_active'),
+                         {True: 2, False: 1})
+
+    def test_rolled_back(self):
+        from django.db import transaction
+
+        try:
+            with transaction.atomic():
+                SamUser.objects.get(pk=3).delete()
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(demographics.total(), 3)
+
+    @override_settings(DEMOGRAPHICS_FLUSH_INTERVAL=3600)
+    def test_buffered(self):
+        demographics.buffer.last_flush = time.monotonic()
+        SamUser.objects.create_user('new', 'new@mail.com', 'pass')
+        self.assertEqual(demographics.total(), 3)
+        self.assertEqual(demographics.flush(), 1)
+        self.assertEqual(demographics.total(), 4)
+
+    @override_settings(DEMOGRAPHICS_FLUSH_INTERVAL=0.5)
+    def test_idle_flush(self):
+        # the thread of the shared buffer sleeps the interval of other tests
+        with mock.patch.object(demographics, 'buffer', demographics.Buffer()):
+            SamUser.objects.create_user('new', 'new@mail.com', 'pass')
+        self.assertEqual(demographics.total(), 3)
+        # no other save comes, the thread of the buffer flushes
+        deadline = time.monotonic() + 5
+        while demographics.total() == 3 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self.assertEqual(demographics.total(), 4)
+
+    def test_unknown_dimension(self):
+        with self.assertRaises(ValueError):
+            demographics.counts('email')
+        with self.assertRaises(ValueError):
+            demographics.total(email__in=['r@r.com'])
+
+    def test_rebuild(self):
+        DemographicCount.objects.all().delete()
+        SamUser.objects.filter(pk=1).update(
+            location='AR', unban_time=timezone.now().date() + timedelta(1))
+
+        out = StringIO()
+        call_command('samanta_demographics', '--dry-run', stdout=out)
+        self.assertIn('3 users, 2 combinations wrong', out.getvalue())
+        self.assertEqual(demographics.total(), 0)
+
+        call_command('samanta_demographics', '--batch-size', '2',
+                     stdout=out)
+        self.assertEqual(demographics.counts('location', 'is_banned'),
+                         {('', False): 2, ('AR', True): 1})
+        out = StringIO()
+        call_command('samanta_demographics', stdout=out)
+        self.assertIn('0 combinations fixed', out.getvalue())
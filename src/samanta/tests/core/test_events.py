@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+from datetime import date
+
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+
+from samanta.admin import bulk_update
+from samanta.core import events
+from samanta.models import SamUser, AccountEvent
+
+DELIVERED = []
+
+
+def collect(batch):
+    DELIVERED.extend(batch)
+
+
+class Flaky:
+    fail = True
+
+    def __call__(self, batch):
+        if self.fail:
+            raise IOError('down')
+        DELIVERED.extend(batch)
+
+
+flaky = Flaky()
+
+
+@override_settings(EVENT_SINKS=['samanta.tests.core.test_events.collect'],
+                   EVENTS_FLUSH_INTERVAL=3600)
+class TestEvents(TransactionTestCase):
+    # the events are queued after the commit
+    fixtures = ['users.json']
+
+    def setUp(self):
+        events.flush()
+        del DELIVERED[:]
+
+    def delivered(self):
+        events.flush()
+        return [(event.type, event.user_id, event.data)
+                for event in DELIVERED]
+
+    def test_ban(self):
+        user = SamUser.objects.get(pk=3)
+        user.ban_to(date(2100, 1, 1))
+        user.unban()
+        self.assertEqual(self.delivered(), [
+            (events.BANNED, 3, {'until': '2100-01-01'}),
+            (events.UNBANNED, 3, {})])
+
+    def test_admin(self):
+        bulk_update(SamUser.objects.filter(pk__in=[1, 2]),
+                    event=events.UNBANNED, unban_time=None)
+        self.assertEqual(self.delivered(), [(events.UNBANNED, 1, {}),
+                                            (events.UNBANNED, 2, {})])
+
+    @override_settings(USE_CAPTCHA=False)
+    def test_register(self):
+        password = 'Secret-pass-123'
+        self.client.post('/register/', {
+            'username': 'new', 'email': 'new@mail.com',
+            'email2': 'new@mail.com', 'password1': password,
+            'password2': password, 'terms_of_service': 'on'})
+        user = SamUser.objects.get(username='new')
+        self.assertEqual(self.delivered(), [(events.REGISTERED, user.pk, {})])
+
+    def test_rollback(self):
+        try:
+            with transaction.atomic():
+                events.emit(events.BANNED, 3)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(self.delivered(), [])
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            events.emit('deleted', 3)
+
+    @override_settings(EVENT_SINKS=[])
+    def test_disabled(self):
+        self.assertIsNone(events.emit(events.BANNED, 3))
+        self.assertEqual(len(events.bus.queue), 0)
+
+    @override_settings(EVENT_SINKS=['samanta.tests.core.test_events.flaky',
+                                    'samanta.tests.core.test_events.collect'])
+    def test_retried(self):
+        flaky.fail = True
+        events.emit(events.BANNED, 3)
+        self.assertEqual(events.flush(), 1)
+        # the working sink got it once
+        self.assertEqual(len(DELIVERED), 1)
+
+        flaky.fail = False
+        self.assertEqual(events.flush(), 0)
+        self.assertEqual(len(DELIVERED), 2)
+        self.assertEqual(DELIVERED[0].id, DELIVERED[1].id)
+
+    def test_database_sink(self):
+        batch = [events.Event(events.BANNED, 3, {'until': '2100-01-01'}),
+                 events.Event(events.UNBANNED, 3)]
+        sink = events.DatabaseSink()
+        sink.deliver(batch)
+        # a retried batch
+        sink.deliver(batch)
+        self.assertEqual(AccountEvent.objects.count(), 2)
+        stored = AccountEvent.objects.get(event_id=batch[0].id)
+        self.assertEqual(json.loads(stored.data), {'until': '2100-01-01'})
+
+    def test_spool_sink(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        sink = events.SpoolSink(path)
+        sink.deliver([events.Event(events.ACTIVATED, 3)])
+        sink.deliver([events.Event(events.BANNED, 2)])
+        with open(path) as stream:
+            lines = [json.loads(line) for line in stream]
+        self.assertEqual([(line['type'], line['user_id']) for line in lines],
+                         [(events.ACTIVATED, 3), (events.BANNED, 2)])
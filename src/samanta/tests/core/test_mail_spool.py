@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase, override_settings
+
+from samanta.core.mailer import spool
+from samanta.core.mailer.mailer import EmailSender
+
+
+class TestSpoolEmailBackend(SimpleTestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def spooled(self, folder='new'):
+        return os.listdir(os.path.join(self.folder, folder))
+
+    def test_backend(self):
+        backend = spool.SpoolEmailBackend(self.folder)
+        message = EmailMessage('Hi', 'Body', 'Team <app@app.com>',
+                               ['u@u.com'], bcc=['hidden@u.com'])
+        self.assertEqual(backend.send_messages([message, message]), 2)
+        self.assertEqual(len(self.spooled()), 2)
+        self.assertEqual(self.spooled('tmp'), [])
+
+        with open(os.path.join(self.folder, 'new', self.spooled()[0]),
+                  'rb') as stream:
+            sender, recipients, data = spool.parse(stream.read())
+        self.assertEqual(sender, 'app@app.com')
+        self.assertEqual(recipients, ['u@u.com', 'hidden@u.com'])
+        self.assertIn(b'Subject: Hi', data)
+        self.assertNotIn(b'hidden@u.com', data)
+
+    def test_mailer(self):
+        with override_settings(
+                MAIL_BACKEND='samanta.core.mailer.spool.SpoolEmailBackend',
+                MAIL_SPOOL_DIR=self.folder):
+            sent = EmailSender('Samanta', 'example.com').send_templated_mail(
+                'Hi', 'app@app.com', 'u@u.com',
+                {'uidb64': 'MQ', 'token': 'abc'}, 'en', 'account_new.txt')
+        self.assertTrue(sent)
+        self.assertEqual(len(self.spooled()), 1)
@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+
+from samanta.core import metrics
+from samanta.views.metrics import Metrics
+
+
+class TestRegistry(SimpleTestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.counter = self.registry.counter('c_total', 'C', ['kind'])
+        self.histogram = self.registry.histogram('h_seconds', 'H',
+                                                 buckets=(1, 2))
+
+    def test_counter(self):
+        self.counter.inc('a')
+        self.counter.inc('a', amount=2)
+        text = self.registry.render(self.registry.collect(shared=False))
+        self.assertIn('c_total{kind="a"} 3.0', text)
+
+    def test_labels_required(self):
+        with self.assertRaises(ValueError):
+            self.counter.inc()
+
+    def test_histogram(self):
+        for value in (0.5, 1.5, 3):
+            self.histogram.observe(value)
+        text = self.registry.render(self.registry.collect(shared=False))
+        self.assertIn('h_seconds_bucket{le="1"} 1.0', text)
+        self.assertIn('h_seconds_bucket{le="2"} 2.0', text)
+        self.assertIn('h_seconds_bucket{le="+Inf"} 3.0', text)
+        self.assertIn('h_seconds_count 3.0', text)
+        self.assertIn('h_seconds_sum 5.0', text)
+
+    def test_shared_store(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        # another worker already flushed its values
+        with open(os.path.join(folder, '1.json'), 'w') as stream:
+            json.dump({'c_total': {'["a"]': 4}}, stream)
+
+        self.counter.inc('a')
+        with override_settings(METRICS_DIR=folder):
+            data = self.registry.collect()
+        self.assertEqual(data['c_total']['["a"]'], 5)
+        self.assertIn('{}.json'.format(os.getpid()), os.listdir(folder))
+
+    def test_dead_workers(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        dead = os.path.join(folder, '{}.json'.format(process.pid))
+        with open(dead, 'w') as stream:
+            json.dump({'c_total': {'["a"]': 4}}, stream)
+
+        with open(os.path.join(folder, metrics.DEAD_SNAPSHOT), 'w') as stream:
+            json.dump({'c_total': {'["a"]': 2}}, stream)
+
+        self.counter.inc('a')
+        with override_settings(METRICS_DIR=folder):
+            data = self.registry.collect()
+            # the restarted workers do not make the counters go down
+            self.assertEqual(data['c_total']['["a"]'], 7)
+            self.assertFalse(os.path.exists(dead))
+            self.assertEqual(self.registry.collect()['c_total']['["a"]'], 7)
+
+
+class TestHooks(TestCase):
+
+    def setUp(self):
+        metrics.REGISTRY.reset()
+
+    def test_token_confirmation(self):
+        self.client.get('/account/confirm/MTA/abc/')
+        data = metrics.REGISTRY.collect(shared=False)
+        self.assertEqual(
+            data['samanta_token_confirmations_total']['["register", "missing"]'],
+            1)
+
+    def test_login(self):
+        self.client.post('/login/', {'username': 'nobody', 'password': 'x'})
+        data = metrics.REGISTRY.collect(shared=False)
+        self.assertEqual(
+            data['samanta_logins_total']['["invalid_login"]'], 1)
+
+    def test_endpoint(self):
+        response = Metrics.as_view()(RequestFactory().get('/metrics/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE samanta_mails_total counter', response.content)
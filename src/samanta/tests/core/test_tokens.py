@@ -0,0 +1,110 @@
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import urlsafe_base64_encode
+
+from samanta import models
+from samanta.core import tokens
+from samanta.views.helpers import _build_log
+User = models.SamUser
+
+CACHE_STORES = {
+    'password_recovery': 'samanta.core.tokens.CacheTokenStore',
+    'email_change': 'samanta.core.tokens.CacheTokenStore',
+}
+
+
+class StoreMixin:
+
+    fixtures = ['users.json']
+    model = models.PasswordRecoveryLog
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.get(id=3)
+        self.store = tokens.get_token_store(self.model)
+
+    def issue(self):
+        log, token = _build_log(self.user, self.model)
+        log.save()
+        return token
+
+    def test_consume_once(self):
+        token = self.issue()
+        result, record = self.store.consume(self.user.id, token)
+        self.assertEqual(result, tokens.VALID)
+        self.assertEqual(record.user, self.user)
+        self.assertEqual(record.email, self.user.email)
+        self.assertEqual(self.store.consume(self.user.id, token)[0],
+                         tokens.MISSING)
+
+    def test_invalid(self):
+        self.issue()
+        self.assertEqual(self.store.consume(self.user.id, 'nope')[0],
+                         tokens.INVALID)
+
+    def test_replaced(self):
+        old = self.issue()
+        new = self.issue()
+        self.assertNotEqual(self.store.consume(self.user.id, old)[0],
+                            tokens.VALID)
+        self.assertEqual(self.store.consume(self.user.id, new)[0],
+                         tokens.VALID)
+
+
+class TestDatabaseTokenStore(StoreMixin, TestCase):
+
+    def test_type(self):
+        self.assertIsInstance(self.store, tokens.DatabaseTokenStore)
+
+    @override_settings(TOKEN_SPAN_VALIDITY=1)
+    def test_expired(self):
+        token = self.issue()
+        self.model.objects.update(date=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.store.consume(self.user.id, token)[0],
+                         tokens.EXPIRED)
+
+
+@override_settings(DEFAULT_TOKEN_STORE='samanta.core.tokens.UnifiedTokenStore')
+class TestUnifiedTokenStore(StoreMixin, TestCase):
+
+    def test_type(self):
+        self.assertIsInstance(self.store, tokens.UnifiedTokenStore)
+
+    def test_single_table(self):
+        self.issue()
+        self.assertFalse(self.model.objects.exists())
+        row = models.AccountToken.objects.get()
+        self.assertEqual(row.purpose, self.model.PURPOSE)
+        # other purposes do not see the token
+        other = tokens.get_token_store(models.EmailChangeLog)
+        self.assertFalse(other.get_queryset().exists())
+
+    def test_user_delete(self):
+        self.issue()
+        self.user.delete()
+        self.assertFalse(models.AccountToken.objects.exists())
+
+
+@override_settings(TOKEN_STORES=CACHE_STORES)
+class TestCacheTokenStore(StoreMixin, TestCase):
+
+    def test_type(self):
+        self.assertIsInstance(self.store, tokens.CacheTokenStore)
+
+    def test_no_rows(self):
+        self.issue()
+        self.assertFalse(self.model.objects.exists())
+
+    def test_recovery_view(self):
+        token = self.issue()
+        uid = force_text(urlsafe_base64_encode(force_bytes(self.user.id)))
+        self.client.post('/password/recover/set/{}/{}/'.format(uid, token),
+                         {'hashid': uid, 'token': token,
+                          'new_password1': 'Other-pass-123',
+                          'new_password2': 'Other-pass-123'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Other-pass-123'))
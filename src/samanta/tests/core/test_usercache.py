@@ -0,0 +1,98 @@
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from samanta import models
+from samanta.backends import CachedModelBackend
+from samanta.core import usercache
+User = models.SamUser
+
+BACKENDS = ['samanta.backends.CachedModelBackend']
+
+
+class TestUserCache(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.get(id=3)
+
+    def test_cached(self):
+        usercache.get(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(usercache.get(self.user.id), self.user)
+
+    def test_natural_key(self):
+        usercache.get_by_natural_key('user')
+        usercache.get(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(usercache.get_by_natural_key('user'), self.user)
+        self.assertIsNone(usercache.get_by_natural_key('nobody'))
+
+    def test_save(self):
+        usercache.get(self.user.id)
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertEqual(usercache.get(self.user.id).first_name, 'Changed')
+
+    def test_delete(self):
+        usercache.get(self.user.id)
+        self.user.delete()
+        self.assertIsNone(usercache.get(3))
+
+    def test_teams(self):
+        team = models.Teams.objects.create(name='team')
+        usercache.get(self.user.id)
+        self.user.teams.add(team)
+        with self.assertNumQueries(1):
+            usercache.get(self.user.id)
+        team.samuser_set.clear()
+        with self.assertNumQueries(1):
+            usercache.get(self.user.id)
+
+    def test_stale_write(self):
+        # a reader loads the row before a concurrent change is invalidated
+        stale = User.objects.get(id=3)
+        version = usercache._current_version(caches['default'], 3)
+        usercache.invalidate([3])
+        caches['default'].set(usercache.KEY.format(3), (version, stale))
+        with self.assertNumQueries(1):
+            usercache.get(3)
+
+    def test_renamed(self):
+        usercache.get_by_natural_key('user')
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertIsNone(usercache.get_by_natural_key('user'))
+        self.assertEqual(usercache.get_by_natural_key('renamed'), self.user)
+
+
+@override_settings(AUTHENTICATION_BACKENDS=BACKENDS)
+class TestCachedModelBackend(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.get(id=3)
+        self.user.is_active = True
+        self.user.set_password('Secret-123')
+        self.user.save()
+
+    def test_authenticate(self):
+        backend = CachedModelBackend()
+        self.assertEqual(backend.authenticate(None, 'user', 'Secret-123'),
+                         self.user)
+        self.assertIsNone(backend.authenticate(None, 'user', 'wrong'))
+        self.assertIsNone(backend.authenticate(None, 'nobody', 'Secret-123'))
+
+    def test_inactive(self):
+        User.objects.filter(pk=3).update(is_active=False)
+        usercache.invalidate([3])
+        self.assertIsNone(CachedModelBackend().get_user(3))
+
+    def test_request_user(self):
+        self.client.force_login(self.user)
+        self.client.get('/account/profile/')
+        response = self.client.get('/account/profile/')
+        self.assertEqual(response.context['user'], self.user)
@@ -0,0 +1,62 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from samanta import models
+from samanta.views.helpers import _build_log
+User = models.SamUser
+
+
+class TestExportUser(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        self.user = User.objects.get(id=3)
+        self.user.teams.create(name='blue')
+        for model in (models.UserCreationLog, models.PasswordRecoveryLog,
+                      models.EmailChangeLog):
+            log, _ = _build_log(self.user, model)
+            log.save()
+
+    def test_ndjson(self):
+        out = StringIO()
+        call_command('samanta_export_user', self.user.username, stdout=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        types = [record['type'] for record in records]
+        self.assertEqual(types, ['user', 'team', 'register',
+                                 'password_recovery', 'email_change'])
+        self.assertNotIn('password', records[0])
+        self.assertNotIn('salt', records[2])
+
+    def test_zip(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        path = os.path.join(folder, 'user.zip')
+        call_command('samanta_export_user', str(self.user.id),
+                     '--format', 'zip', '--output', path)
+        with zipfile.ZipFile(path) as archive:
+            self.assertEqual(archive.namelist(),
+                             ['user.ndjson', 'teams.ndjson', 'register.ndjson',
+                              'password_recovery.ndjson',
+                              'email_change.ndjson'])
+            for name in ('password_recovery.ndjson', 'email_change.ndjson'):
+                lines = archive.read(name).splitlines()
+                self.assertEqual(len(lines), 1)
+
+    def test_view(self):
+        self.user.is_active = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get('/account/export/?format=zip')
+        content = b''.join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            user = json.loads(archive.read('user.ndjson').decode('utf-8'))
+        self.assertEqual(user['username'], self.user.username)
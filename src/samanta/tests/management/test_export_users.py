@@ -0,0 +1,92 @@
+import csv
+import importlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from samanta import models
+User = models.SamUser
+
+
+class TestExportUsers(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.path = os.path.join(self.folder, 'out')
+
+    def export(self, *args):
+        call_command('samanta_export_users', '--batch-size', '2',
+                     '--output', self.path, *args, stderr=StringIO())
+        with open(self.path, encoding='utf-8') as stream:
+            return stream.read()
+
+    def test_csv(self):
+        rows = list(csv.reader(self.export('--format', 'csv').splitlines()))
+        self.assertNotIn('password', rows[0])
+        username = rows[0].index('username')
+        self.assertEqual([row[username] for row in rows[1:]],
+                         ['root', 'staff', 'user'])
+
+    def test_columns(self):
+        chunks = [json.loads(line) for line in
+                  self.export('--format', 'columns').splitlines()]
+        self.assertEqual([chunk['rows'] for chunk in chunks], [2, 1])
+        self.assertEqual(chunks[1]['columns']['username'], ['user'])
+
+    def test_incremental(self):
+        state = os.path.join(self.folder, 'state.json')
+
+        def usernames():
+            lines = self.export('--format', 'ndjson', '--state', state)
+            return [json.loads(line)['username'] for line in lines.splitlines()]
+
+        # without state everything is exported
+        self.assertEqual(len(usernames()), 3)
+        User.objects.get(username='staff').save()
+        self.assertEqual(len(usernames()), 3)
+        # from now on just the updated ones
+        User.objects.get(username='user').save()
+        self.assertEqual(usernames(), ['user'])
+        self.assertEqual(usernames(), [])
+
+    def test_late_commit(self):
+        state = os.path.join(self.folder, 'state.json')
+
+        def usernames():
+            lines = self.export('--format', 'ndjson', '--state', state)
+            return [json.loads(line)['username'] for line in lines.splitlines()]
+
+        for user in User.objects.all():
+            user.save()
+        self.assertEqual(len(usernames()), 3)
+        # committed after the export, with a date before its watermark
+        with open(state) as stream:
+            last = json.load(stream)
+        staff = User.objects.get(username='staff')
+        User.objects.filter(pk=staff.pk).update(
+            updated_at=staff.updated_at - timedelta(seconds=1),
+            first_name='late')
+        self.assertLess(User.objects.get(pk=staff.pk).updated_at.isoformat(),
+                        last['updated_at'])
+        self.assertEqual(usernames(), ['staff'])
+        self.assertEqual(usernames(), [])
+
+    def test_backfill(self):
+        migration = importlib.import_module(
+            'samanta.migrations.0008_backfill_updated_at')
+        editor = type('Editor', (), {'connection': connection})()
+        migration.backfill(apps, editor)
+        self.assertFalse(User.objects.filter(updated_at__isnull=True).exists())
+        user = User.objects.get(username='user')
+        self.assertEqual(user.updated_at, user.date_joined)
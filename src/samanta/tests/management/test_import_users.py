@@ -0,0 +1,115 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from samanta import models
+from samanta.core import tokens
+User = models.SamUser
+
+CSV = '''username,email,password,first_name,unknown
+alice,alice@Mail.com,Secret-123,Alice,x
+bob,bob@mail.com,,,
+ALICE,other@mail.com,Secret-123,,
+carol,BOB@mail.com,Secret-123,,
+,nobody@mail.com,Secret-123,,
+dave,not-an-email,Secret-123,,
+user,new@mail.com,Secret-123,,
+'''
+
+
+class TestImportUsers(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def write(self, name, content):
+        path = os.path.join(self.folder, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def load(self, path, *args, workers='0'):
+        out = StringIO()
+        call_command('samanta_import_users', path, '--workers', workers,
+                     '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def rejected(self, path):
+        with open(path + '.rejected.ndjson', encoding='utf-8') as stream:
+            return {row['line']: row['reason']
+                    for row in map(json.loads, stream)}
+
+    def test_csv(self):
+        path = self.write('users.csv', CSV)
+        output = self.load(path)
+        self.assertIn('2 users created, 5 rows rejected', output)
+
+        alice = User.objects.get(username='alice')
+        self.assertEqual(alice.email, 'alice@mail.com')
+        self.assertEqual(alice.first_name, 'Alice')
+        self.assertTrue(alice.check_password('Secret-123'))
+        self.assertFalse(alice.is_active)
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+        self.assertEqual(models.UserCreationLog.objects.filter(
+            user__username__in=['alice', 'bob']).count(), 2)
+
+        self.assertEqual(self.rejected(path), {
+            4: 'duplicated username', 5: 'duplicated email',
+            6: 'missing username', 7: 'invalid email',
+            8: 'duplicated username'})
+
+    def test_ndjson_tokens(self):
+        rows = [{'username': 'n{}'.format(i), 'email': 'n{}@mail.com'.format(i),
+                 'password': 'Secret-123'} for i in range(3)]
+        path = self.write('users.ndjson', '\n'.join(
+            [json.dumps(row) for row in rows] + ['{broken']))
+        tokens_path = os.path.join(self.folder, 'tokens.csv')
+        self.load(path, '--tokens', tokens_path)
+        self.assertEqual(User.objects.filter(username__startswith='n').count(),
+                         3)
+        self.assertEqual(self.rejected(path), {4: 'invalid JSON'})
+
+        with open(tokens_path, encoding='utf-8') as stream:
+            lines = stream.read().splitlines()[1:]
+        self.assertEqual(len(lines), 3)
+        user_id, _, raw = lines[0].split(',')
+        store = tokens.get_token_store(models.UserCreationLog)
+        self.assertEqual(store.consume(int(user_id), raw)[0], tokens.VALID)
+
+    def test_active(self):
+        path = self.write('users.csv', CSV)
+        self.load(path, '--active')
+        self.assertTrue(User.objects.get(username='alice').is_active)
+        self.assertFalse(models.UserCreationLog.objects.exists())
+
+    def test_field_validators(self):
+        path = self.write('users.ndjson', '\n'.join(json.dumps(row) for row in [
+            {'username': 'long', 'email': 'long@mail.com',
+             'first_name': 'x' * 80},
+            {'username': 'lang', 'email': 'lang@mail.com',
+             'language': 'toolong'},
+            {'username': 'place', 'email': 'place@mail.com',
+             'location': 'ZZZ'},
+            {'username': 'gender', 'email': 'gender@mail.com', 'gender': 42},
+            {'username': 'fine', 'email': 'fine@mail.com',
+             'location': 'CL', 'gender': 1}]))
+        self.assertIn('1 users created, 4 rows rejected', self.load(path))
+        self.assertEqual(self.rejected(path), {
+            1: 'invalid first_name', 2: 'invalid language',
+            3: 'invalid location', 4: 'invalid gender'})
+        self.assertEqual(User.objects.get(username='fine').location, 'CL')
+
+    def test_workers(self):
+        path = self.write('users.csv', CSV)
+        output = self.load(path, workers='2')
+        self.assertIn('2 users created, 5 rows rejected', output)
+        self.assertTrue(User.objects.get(
+            username='alice').check_password('Secret-123'))
@@ -0,0 +1,111 @@
+import os
+import shutil
+import smtplib
+import tempfile
+
+from django.core.mail import EmailMessage
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.utils.six import StringIO
+
+from samanta.core.mailer import spool
+from samanta.management.commands import samanta_mail_spool
+
+SENT = []
+
+
+class FakeSMTP:
+
+    def sendmail(self, sender, recipients, message):
+        if 'bounce@mail.com' in recipients:
+            raise smtplib.SMTPRecipientsRefused(
+                {'bounce@mail.com': (550, b'unknown user')})
+        SENT.append((sender, recipients, message))
+
+
+class FakeSMTPBackend(BaseEmailBackend):
+    """Exposes the smtplib interface used by the drainer"""
+
+    def open(self):
+        self.connection = FakeSMTP()
+
+
+class TestMailSpool(SimpleTestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        del SENT[:]
+
+    def spooled(self, folder='new'):
+        return os.listdir(os.path.join(self.folder, folder))
+
+    def drain(self):
+        out = StringIO()
+        call_command('samanta_mail_spool', '--spool', self.folder,
+                     '--smtp-backend', __name__ + '.FakeSMTPBackend',
+                     stdout=out)
+        return out.getvalue()
+
+    def test_drain(self):
+        backend = spool.SpoolEmailBackend(self.folder)
+        backend.send_messages([
+            EmailMessage('Hi', 'Body', 'app@app.com', ['u@u.com']),
+            EmailMessage('Hi', 'Body', 'app@app.com', ['bounce@mail.com'])])
+
+        self.assertIn('1 sent, 0 to retry, 1 failed', self.drain())
+        self.assertEqual(SENT[0][:2], ('app@app.com', ['u@u.com']))
+        self.assertIn(b'\r\nSubject: Hi\r\n', SENT[0][2])
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(self.spooled('cur'), [])
+        self.assertEqual(len(self.spooled('failed')), 1)
+
+        self.assertIn('0 sent', self.drain())
+
+    def command(self):
+        command = samanta_mail_spool.Command()
+        command.paths = spool.folders(self.folder)
+        command.backend = __name__ + '.FakeSMTPBackend'
+        return command
+
+    def test_recover(self):
+        spool.SpoolEmailBackend(self.folder).send_messages([
+            EmailMessage('Hi', 'Body', 'app@app.com', ['u@u.com'])])
+        name = self.spooled()[0]
+        # claimed long ago by a drainer that died
+        os.rename(os.path.join(self.folder, 'new', name),
+                  os.path.join(self.folder, 'cur',
+                               samanta_mail_spool.claimed_name(name, 0)))
+        self.assertIn('1 sent', self.drain())
+        self.assertEqual(self.spooled('cur'), [])
+
+    def test_recover_fresh_claim(self):
+        spool.SpoolEmailBackend(self.folder).send_messages([
+            EmailMessage('Hi', 'Body', 'app@app.com', ['u@u.com'])])
+        # a retried message is older than MAIL_SPOOL_STALE
+        os.utime(os.path.join(self.folder, 'new', self.spooled()[0]), (0, 0))
+        command = self.command()
+        names = command.claim()
+        command.recover()
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(self.spooled('cur'), names)
+
+    @override_settings(MAIL_SPOOL_STALE=-1)
+    def test_recovered_while_sending(self):
+        spool.SpoolEmailBackend(self.folder).send_messages([
+            EmailMessage('Hi', 'Body', 'app@app.com', ['u@u.com'])])
+        command = self.command()
+        names = command.claim()
+        # another drainer takes the claim as stale
+        self.command().recover()
+        self.assertEqual(command.send_batch(names),
+                         [samanta_mail_spool.RETRY])
+        self.assertEqual(len(self.spooled()), 1)
+
+        # recovered after the message was handed to the server
+        names = command.claim()
+        self.command().recover()
+        self.assertEqual(command.finish(names[0], samanta_mail_spool.SENT),
+                         samanta_mail_spool.SENT)
+        self.assertEqual(len(self.spooled()), 1)
@@ -0,0 +1,63 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from samanta import models
+from samanta.core import tokens
+from samanta.views.helpers import _build_log
+User = models.SamUser
+
+TOKEN_MODELS = (models.UserCreationLog, models.PasswordRecoveryLog,
+                models.EmailChangeLog)
+
+
+class TestMigrateTokens(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        self.user = User.objects.get(id=3)
+        self.raw = {}
+        for model in TOKEN_MODELS:
+            for _ in range(3):
+                log, token = _build_log(self.user, model)
+                log.save()
+            self.raw[model] = token
+
+    def migrate(self, *args):
+        out = StringIO()
+        call_command('samanta_migrate_tokens', '--batch-size', '2', *args,
+                     stdout=out)
+        return out.getvalue()
+
+    def test_migrate(self):
+        dates = list(models.PasswordRecoveryLog.objects.order_by('pk')
+                     .values_list('date', flat=True))
+        output = self.migrate()
+        self.assertIn('9 rows moved', output)
+        for model in TOKEN_MODELS:
+            self.assertFalse(model.objects.exists())
+            self.assertEqual(models.AccountToken.objects.filter(
+                purpose=model.PURPOSE).count(), 3)
+        self.assertEqual(list(models.AccountToken.objects.filter(
+            purpose='password_recovery').order_by('pk').values_list(
+            'date', flat=True)), dates)
+
+    def test_migrated_tokens_are_valid(self):
+        self.migrate()
+        with self.settings(
+                DEFAULT_TOKEN_STORE='samanta.core.tokens.UnifiedTokenStore'):
+            for model in TOKEN_MODELS:
+                store = tokens.get_token_store(model)
+                self.assertEqual(
+                    store.consume(self.user.id, self.raw[model])[0],
+                    tokens.VALID)
+
+    def test_dry_run(self):
+        self.assertIn('9 rows to move', self.migrate('--dry-run'))
+        self.assertFalse(models.AccountToken.objects.exists())
+
+    def test_keep(self):
+        self.migrate('--keep')
+        self.assertEqual(models.AccountToken.objects.count(), 9)
+        self.assertEqual(models.EmailChangeLog.objects.count(), 3)
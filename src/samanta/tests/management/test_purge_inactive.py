@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from samanta import models
+from samanta.views.helpers import _build_log
+User = models.SamUser
+
+
+class TestPurgeInactive(TestCase):
+
+    def create(self, name, days, **extra):
+        user = User.objects.create_user(name, name + '@mail.com', 'pswd',
+                                        **extra)
+        User.objects.filter(pk=user.pk).update(
+            date_joined=timezone.now() - timedelta(days=days))
+        log, _ = _build_log(user, models.UserCreationLog)
+        log.save()
+        return user
+
+    def setUp(self):
+        self.old = [self.create('old{}'.format(i), 40) for i in range(5)]
+        self.recent = self.create('recent', 5)
+        self.active = self.create('active', 40, is_active=True)
+        self.staff = self.create('staff', 40, is_staff=True)
+
+    def purge(self, *args):
+        out = StringIO()
+        call_command('samanta_purge_inactive', '--days', '30',
+                     '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_purge(self):
+        output = self.purge()
+        self.assertIn('5 accounts purged', output)
+        self.assertFalse(User.objects.filter(
+            pk__in=[u.pk for u in self.old]).exists())
+        self.assertEqual(models.UserCreationLog.objects.count(), 3)
+        for user in (self.recent, self.active, self.staff):
+            self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+    def test_dry_run(self):
+        output = self.purge('--dry-run')
+        self.assertIn('5 accounts would be purged', output)
+        self.assertEqual(User.objects.count(), 8)
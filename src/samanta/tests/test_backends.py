@@ -0,0 +1,54 @@
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from samanta import models
+from samanta.backends import SamModelBackend, CachedModelBackend
+User = models.SamUser
+
+
+@override_settings(SLIM_USERS=True)
+class TestSlimUsers(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        caches['default'].clear()
+        User.objects.filter(pk=3).update(is_active=True, first_name='First',
+                                         language='es')
+
+    def test_projection(self):
+        user = SamModelBackend().get_user(3)
+        self.assertIn('date_of_birth', user.get_deferred_fields())
+        with self.assertNumQueries(0):
+            self.assertEqual(user.username, 'user')
+            self.assertTrue(user.is_active)
+        # the rest is loaded with a single query
+        with self.assertNumQueries(1):
+            self.assertEqual(user.first_name, 'First')
+            self.assertEqual(user.language, 'es')
+            self.assertIsNone(user.date_of_birth)
+
+    def test_save(self):
+        user = SamModelBackend().get_user(3)
+        user.is_staff = True
+        user.save()
+        user = User.objects.get(pk=3)
+        self.assertTrue(user.is_staff)
+        self.assertEqual(user.first_name, 'First')
+
+    def test_cached(self):
+        CachedModelBackend().get_user(3)
+        user = CachedModelBackend().get_user(3)
+        self.assertIn('avatar', user.get_deferred_fields())
+        self.assertEqual(user.first_name, 'First')
+
+    def test_disabled(self):
+        with self.settings(SLIM_USERS=False):
+            user = SamModelBackend().get_user(3)
+        self.assertFalse(user.get_deferred_fields())
+
+    @override_settings(AUTHENTICATION_BACKENDS=['samanta.backends.SamModelBackend'])
+    def test_request(self):
+        self.client.force_login(User.objects.get(pk=3))
+        response = self.client.get('/account/profile/')
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,33 @@
+import os
+import sys
+import subprocess
+
+from django.test import SimpleTestCase
+
+import samanta
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(samanta.__file__)))
+
+
+class TestLazyImports(SimpleTestCase):
+    """Optional features must not be paid at import time"""
+
+    def imported_by(self, module):
+        code = ('import django, sys; django.setup(); before = set(sys.modules); '
+                'import {}; print("\\n".join(set(sys.modules) - before))')
+        env = dict(os.environ,
+                   DJANGO_SETTINGS_MODULE='samanta.tests.test_settings',
+                   PYTHONPATH=SRC)
+        output = subprocess.check_output(
+            [sys.executable, '-c', code.format(module)], env=env,
+            universal_newlines=True)
+        return set(output.split())
+
+    def test_forms(self):
+        modules = self.imported_by('samanta.forms')
+        self.assertNotIn('captcha.fields', modules)
+
+    def test_views(self):
+        modules = self.imported_by('samanta.views.account')
+        self.assertNotIn('captcha.fields', modules)
+        self.assertNotIn('samanta.core.mailer.mailer', modules)
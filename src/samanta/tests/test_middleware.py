@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings as django_settings
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from samanta.core import timing
+from samanta.middleware import TimingMiddleware, SlowestWindow
+
+MIDDLEWARE = ['samanta.middleware.TimingMiddleware'] + \
+    django_settings.MIDDLEWARE
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE)
+class TestTimingMiddleware(TestCase):
+
+    def setUp(self):
+        TimingMiddleware.window = SlowestWindow()
+
+    def test_server_timing(self):
+        response = self.client.get('/password/recover/')
+        header = response['Server-Timing']
+        for name in ('render', 'db', 'total'):
+            self.assertIn(name + ';dur=', header)
+        self.assertIsNone(timing.current())
+
+    def test_log(self):
+        with self.assertLogs('samanta.timing', 'INFO') as logs:
+            self.client.get('/password/recover/')
+        self.assertIn('path=/password/recover/', logs.output[0])
+        self.assertIn('total', logs.records[0].timings)
+
+    def test_profile(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        with override_settings(PROFILE_DIR=folder, PROFILE_SAMPLE_RATE=1,
+                               PROFILE_SLOWEST_PERCENT=100):
+            self.client.get('/password/recover/')
+        self.assertEqual(len(os.listdir(folder)), 1)
+
+    def test_full_queries_log(self):
+        log = connection.queries_log
+        self.addCleanup(log.clear)
+        log.extend({'sql': 'old', 'time': '1.000'}
+                   for _ in range(log.maxlen))
+        middleware = TimingMiddleware(None)
+        timings = timing.Timings()
+        state = middleware.start_queries()
+        # a query of this request shifts out the oldest entry
+        log.append({'sql': 'new', 'time': '0.250'})
+        middleware.stop_queries(state, timings)
+        self.assertEqual(timings.stages['db'], 0.25)
+
+
+class TestStage(TestCase):
+
+    def test_inactive(self):
+        with timing.stage('hash'):
+            pass
+        self.assertIsNone(timing.current())
+
+    def test_accumulates(self):
+        timing.start()
+        for _ in range(2):
+            with timing.stage('hash'):
+                pass
+        timings = timing.stop()
+        self.assertEqual(list(timings.stages), ['hash'])
+        self.assertIsNotNone(timings.total)
@@ -0,0 +1,85 @@
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from django.core.signals import request_started, request_finished
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from samanta import models, routers
+from samanta.middleware import ReplicaPinMiddleware
+
+MIDDLEWARE = ['samanta.middleware.ReplicaPinMiddleware'] + \
+    django_settings.MIDDLEWARE
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class TestReplicaRouter(TestCase):
+
+    def setUp(self):
+        routers.reset()
+        self.addCleanup(routers.reset)
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(models.SamUser), 'replica')
+        self.assertEqual(self.router.db_for_write(models.SamUser), 'default')
+
+    def test_read_your_writes(self):
+        self.router.db_for_write(models.PasswordRecoveryLog)
+        self.assertTrue(routers.has_written())
+        self.assertEqual(self.router.db_for_read(models.SamUser), 'default')
+
+    def test_requests_reset(self):
+        for signal in (request_started, request_finished):
+            self.router.db_for_write(models.SamUser)
+            signal.send(sender=self.__class__)
+            self.assertFalse(routers.has_written())
+            self.assertEqual(self.router.db_for_read(models.SamUser),
+                             'replica')
+
+    def test_other_apps(self):
+        from django.contrib.sessions.models import Session
+        self.assertIsNone(self.router.db_for_read(Session))
+        self.assertIsNone(self.router.db_for_write(Session))
+        self.assertFalse(routers.has_written())
+
+    def test_no_replicas(self):
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.router.db_for_read(models.SamUser),
+                             'default')
+
+    def test_migrate(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'samanta'))
+        self.assertIsNone(self.router.allow_migrate('default', 'samanta'))
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE, REPLICA_PIN_SECONDS=3,
+                   DATABASE_ROUTERS=['samanta.routers.ReplicaRouter'])
+class TestReplicaPinMiddleware(TestCase):
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_read_only(self):
+        response = self.client.get('/password/recover/')
+        self.assertNotIn('samanta_pin', response.cookies)
+
+    def test_pin_after_write(self):
+        response = self.client.post('/password/recover/',
+                                    {'email': 'u@u.com'})
+        self.assertEqual(response.cookies['samanta_pin']['max-age'], 3)
+        self.assertFalse(routers.is_pinned())
+
+    def test_pinned_request(self):
+        seen = []
+
+        def view(request):
+            seen.append(routers.is_pinned())
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.COOKIES['samanta_pin'] = '1'
+        ReplicaPinMiddleware(view)(request)
+        self.assertEqual(seen, [True])
+        self.assertFalse(routers.is_pinned())
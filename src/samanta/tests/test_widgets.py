@@ -0,0 +1,66 @@
+from django.test import SimpleTestCase, override_settings
+from django.utils import translation
+from django_countries.widgets import LazySelect
+
+from samanta import widgets
+from samanta.forms import SamUserEditForm
+from samanta.models import SamUser
+
+
+class TestCachedCountrySelect(SimpleTestCase):
+
+    def setUp(self):
+        widgets._options.clear()
+
+    def field(self, widget):
+        return SamUser._meta.get_field('location').formfield(widget=widget)
+
+    def test_same_html(self):
+        cached = self.field(widgets.CachedCountrySelect).widget
+        stock = self.field(LazySelect).widget
+        for value in (None, '', 'CL', 'XX'):
+            self.assertHTMLEqual(
+                cached.render('location', value, {'id': 'id_location'}),
+                stock.render('location', value, {'id': 'id_location'}))
+
+    def test_selected(self):
+        widget = self.field(widgets.CachedCountrySelect).widget
+        html = widget.render('location', 'CL')
+        self.assertIn('<option value="CL" selected>', html)
+        self.assertEqual(html.count('selected'), 1)
+        self.assertNotIn('selected', widget.render('location', 'AR').split(
+            'value="CL"')[1].split('</option>')[0])
+
+    def test_languages(self):
+        # a widget per form, LazySelect memoizes the evaluated choices
+        with translation.override('en'):
+            widget = self.field(widgets.CachedCountrySelect).widget
+            self.assertIn('>Germany<', widget.render('location', None))
+        with translation.override('es'):
+            widget = self.field(widgets.CachedCountrySelect).widget
+            self.assertIn('>Alemania<', widget.render('location', None))
+        self.assertEqual(len(widgets._options), 2)
+
+    def test_rendered_once(self):
+        widget = self.field(widgets.CachedCountrySelect).widget
+        widget.render('location', 'CL')
+        options = widget.get_options()
+        # a new form does not evaluate the choices again
+        other = SamUserEditForm(instance=SamUser(location='AR'))
+        other.fields['location'].widget._choices = None
+        self.assertIn('value="AR" selected', str(other['location']))
+        self.assertIs(widget.get_options(), options)
+
+    def test_catalog_reload(self):
+        from django.utils.translation import trans_real
+
+        widget = self.field(widgets.CachedCountrySelect).widget
+        options = widget.get_options()
+        trans_real._translations = {}
+        self.assertIsNot(widget.get_options(), options)
+
+    def test_countries_settings(self):
+        widget = self.field(widgets.CachedCountrySelect).widget
+        widget.render('location', None)
+        with override_settings(COUNTRIES_FIRST=['CL']):
+            self.assertEqual(widgets._options, {})
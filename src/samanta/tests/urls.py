@@ -0,0 +1,15 @@
+"""URL configuration used by the tests and the benchmarks. It provides the
+pages that samanta expects from the project: 'home' and 'tos'.
+"""
+
+from django.conf.urls import url, include
+from django.contrib import admin
+from django.views.generic import TemplateView
+
+urlpatterns = [
+    url(r'^$', TemplateView.as_view(template_name='index.html'), name='home'),
+    url(r'^tos/$', TemplateView.as_view(template_name='index.html'),
+        name='tos'),
+    url(r'^admin/', admin.site.urls),
+    url(r'^', include('samanta.urls')),
+]
@@ -0,0 +1,214 @@
+from django.core.cache import caches
+from django.db import transaction
+from django.test import (TestCase, TransactionTestCase, RequestFactory,
+                         override_settings)
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.utils.encoding import force_bytes, force_text
+from django.utils.http import urlsafe_base64_encode
+
+from samanta import models
+from samanta.views.helpers import _build_log
+from samanta.views.mixins import ViewMixin, QueryBudgetExceeded
+User = models.SamUser
+
+PASSWORD = 'Secret-pass-123'
+
+
+class Mixin(TestCase):
+    """All the requests of these tests run with ENFORCE_QUERY_BUDGETS on, so
+    any view going over its MAX_QUERIES fails with QueryBudgetExceeded"""
+
+    fixtures = ['users.json']
+
+    def setUp(self):
+        # no cooldowns left by other tests
+        caches['default'].clear()
+        self.user = User.objects.get(id=3)
+        self.user.set_password(PASSWORD)
+        self.user.is_active = True
+        self.user.save()
+
+    def uid(self):
+        return force_text(urlsafe_base64_encode(force_bytes(self.user.id)))
+
+    def token(self, log_model, email=None):
+        log, token = _build_log(self.user, log_model)
+        if email:
+            log.email = email
+        log.save()
+        return token
+
+    def login(self):
+        self.client.force_login(self.user)
+
+
+class TestBudgetCheck(TestCase):
+
+    class Greedy(ViewMixin):
+        MAX_QUERIES = 0
+
+        def get(self, request):
+            User.objects.count()
+            return HttpResponse()
+
+    def request(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        return request
+
+    def test_exceeded(self):
+        with self.assertRaises(QueryBudgetExceeded) as error:
+            self.Greedy.as_view()(self.request())
+        self.assertIn('SELECT COUNT', str(error.exception))
+
+    @override_settings(ENFORCE_QUERY_BUDGETS=False)
+    def test_disabled(self):
+        self.Greedy.as_view()(self.request())
+
+    def test_transaction_statements(self):
+        class Atomic(ViewMixin):
+            MAX_QUERIES = 1
+
+            def get(self, request):
+                with transaction.atomic():
+                    User.objects.count()
+                return HttpResponse()
+
+        Atomic.as_view()(self.request())
+
+    def test_per_method(self):
+        view = self.Greedy(MAX_QUERIES={'get': 1})
+        self.assertEqual(view.get_query_budget(self.request()), 1)
+
+
+@override_settings(USE_CAPTCHA=False)
+class TestRegister(Mixin):
+
+    def test_get(self):
+        self.assertEqual(self.client.get('/register/').status_code, 200)
+
+    def test_post(self):
+        data = {'username': 'newone', 'email': 'new@one.com',
+                'email2': 'new@one.com', 'password1': PASSWORD,
+                'password2': PASSWORD, 'terms_of_service': 'on'}
+        response = self.client.post('/register/', data)
+        self.assertRedirects(response, '/login/', fetch_redirect_response=False)
+        self.assertTrue(User.objects.filter(username='newone').exists())
+
+
+@override_settings(USE_CAPTCHA=False)
+class TestAutocommit(TransactionTestCase):
+    """Out of the transaction of TestCase every write opens its own one"""
+
+    fixtures = ['users.json']
+
+    def test_register(self):
+        data = {'username': 'newone', 'email': 'new@one.com',
+                'email2': 'new@one.com', 'password1': PASSWORD,
+                'password2': PASSWORD, 'terms_of_service': 'on'}
+        response = self.client.post('/register/', data)
+        self.assertRedirects(response, '/login/', fetch_redirect_response=False)
+
+
+class TestAccountConfirm(Mixin):
+
+    def test_get(self):
+        self.user.is_active = False
+        self.user.save()
+        token = self.token(models.UserCreationLog)
+        response = self.client.get(
+            '/account/confirm/{}/{}/'.format(self.uid(), token))
+        self.assertRedirects(response, '/login/', fetch_redirect_response=False)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+
+class TestUserProfile(Mixin):
+
+    def test_get(self):
+        self.login()
+        self.assertEqual(self.client.get('/account/profile/').status_code, 200)
+
+
+class TestProfileEdit(Mixin):
+
+    def test_get(self):
+        self.login()
+        self.assertEqual(self.client.get('/account/edit/').status_code, 200)
+
+    def test_post(self):
+        self.login()
+        response = self.client.post('/account/edit/', {'language': 'es',
+                                                       'gender': 1})
+        self.assertRedirects(response, '/account/profile/',
+                             fetch_redirect_response=False)
+
+
+class TestEmailChange(Mixin):
+
+    def test_get(self):
+        self.login()
+        self.assertEqual(self.client.get('/email/change/').status_code, 200)
+
+    def test_post(self):
+        self.login()
+        data = {'password': PASSWORD, 'email_new': 'other@mail.com',
+                'email_new2': 'other@mail.com'}
+        self.assertEqual(self.client.post('/email/change/', data).status_code,
+                         200)
+        self.assertTrue(models.EmailChangeLog.objects.filter(
+            user=self.user, email='other@mail.com', status=1).exists())
+
+
+class TestEmailChangeConfirm(Mixin):
+
+    def test_get(self):
+        self.login()
+        token = self.token(models.EmailChangeLog, 'other@mail.com')
+        self.client.get('/email/confirm/{}/{}/'.format(self.uid(), token))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'other@mail.com')
+
+
+class TestPasswordChange(Mixin):
+
+    def test_get(self):
+        self.login()
+        self.assertEqual(self.client.get('/password_change/').status_code,
+                         200)
+
+    def test_post(self):
+        self.login()
+        data = {'old_password': PASSWORD, 'new_password1': 'New-' + PASSWORD,
+                'new_password2': 'New-' + PASSWORD}
+        response = self.client.post('/password_change/', data)
+        self.assertRedirects(response, '/account/profile/',
+                             fetch_redirect_response=False)
+
+
+class TestPasswordRecovery(Mixin):
+
+    def test_start_get(self):
+        self.assertEqual(self.client.get('/password/recover/').status_code,
+                         200)
+
+    def test_start_post(self):
+        self.client.post('/password/recover/', {'email': self.user.email})
+        self.assertTrue(models.PasswordRecoveryLog.objects.filter(
+            user=self.user, status=1).exists())
+
+    def test_change_get(self):
+        token = self.token(models.PasswordRecoveryLog)
+        url = '/password/recover/set/{}/{}/'.format(self.uid(), token)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_change_post(self):
+        token = self.token(models.PasswordRecoveryLog)
+        url = '/password/recover/set/{}/{}/'.format(self.uid(), token)
+        data = {'hashid': self.uid(), 'token': token,
+                'new_password1': 'New-' + PASSWORD,
+                'new_password2': 'New-' + PASSWORD}
+        self.client.post(url, data)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('New-' + PASSWORD))
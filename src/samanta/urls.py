@@ -14,11 +14,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
 
-from django.utils.translation import gettext as _
+from django.utils.translation import gettext_lazy as _
 from django.conf.urls import url, include
 from django.contrib.auth.views import logout, login
 from .forms import SamAuthenticationForm
-from .views import account
+from .conf import settings
+from .views import account, captcha, metrics
 
 urlpatterns = [
 
@@ -46,6 +47,8 @@ urlpatterns = [
         r'0-9A-Za-z]+)/$', account.EmailChangeConfirm.as_view(),
         name='email_confirm'),
     url(r'^password_change/', account.PasswordChange.as_view(), name='password_change'),
+    url(r'^account/export/$', account.UserDataExport.as_view(),
+        name='user_export'),
 
     # Password
     url(r'^password/recover/$', account.PasswordRecoveryStart.as_view(),
@@ -53,7 +56,18 @@ urlpatterns = [
     url(r'^password/recover/set/(?P<uidb64>[0-9A-Za-z_\-]+)/(?P<token>[0-9A-Za-z]+)/$',
         account.PasswordRecoveryChange.as_view(),
         name='pwd_recover_change'),
-
-    # 3rd party
-    url(r'^captcha/', include('captcha.urls')),
 ]
+
+# 3rd party
+if settings.USE_CAPTCHA:
+    urlpatterns += [
+        # pool of samanta, used if USE_CAPTCHA_POOL
+        url(r'^captcha/pool/(?P<challenge_id>[0-9a-f]+)\.png$',
+            captcha.CaptchaImage.as_view(), name='captcha_image'),
+        url(r'^captcha/', include('captcha.urls')),
+    ]
+
+if settings.EXPOSE_METRICS:
+    urlpatterns += [
+        url(r'^metrics/$', metrics.Metrics.as_view(), name='metrics'),
+    ]
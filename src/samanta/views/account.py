@@ -1,27 +1,39 @@
 
-from django.utils.translation import gettext as _
+from django.utils.translation import gettext as _, gettext_lazy
 from django.shortcuts import redirect
+from django.http import StreamingHttpResponse, Http404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 
 from django.utils import timezone
-from django.utils.encoding import force_text
-from django.utils.http import urlsafe_base64_decode
 from django.utils.decorators import method_decorator
 from django.contrib.auth.forms import PasswordChangeForm
 
-from . mixins import ViewMixin, TokenBasedView
+from . mixins import ViewMixin, TokenBasedView, decode_uid
 from ..forms import SamUserCreationForm, ChangeEmailForm, SamUserEditForm
 from ..forms import PasswordRecoveryForm, PasswordRecoveryChangeForm, TokenConfirmationForm
+from ..conf import settings
 from .helpers import send_register_email, send_changemail_email, send_recover_email
 from .. models import UserCreationLog, SamUser, EmailChangeLog, PasswordRecoveryLog
+from ..core import events, export
 
 
 class Register(ViewMixin):
     """Genereal view for the user registration"""
 
     TEMPLATE = 'samanta/account/register.html'
-    TITLE = _('Register')
+    TITLE = gettext_lazy('Register')
+    MAX_QUERIES = {'get': 0, 'post': 7}
+    CAPTCHA_QUERIES = {'get': 1, 'post': 3}
+    """Extra queries run by the captcha app when USE_CAPTCHA is on. The pool
+    (USE_CAPTCHA_POOL) runs none"""
+
+    def get_query_budget(self, request):
+        budget = super(Register, self).get_query_budget(request)
+        if budget is not None and settings.USE_CAPTCHA and \
+                not settings.USE_CAPTCHA_POOL:
+            budget += self.CAPTCHA_QUERIES.get(request.method.lower(), 0)
+        return budget
 
     def get(self, request):
         """Process the get requests"""
@@ -47,6 +59,7 @@ class Register(ViewMixin):
 
         user = form.save()
         send_register_email(request, user)
+        events.emit(events.REGISTERED, user)
         messages.success(request, _('Your Account has being created. We will '
                                     'send you an e-mail with the instructions '
                                     'to activate it.'))
@@ -58,6 +71,7 @@ class AccountConfirm(TokenBasedView):
 
     TEMPLATE = 'samanta/account/activate.html'
     TITLE = 'Activate account'
+    MAX_QUERIES = 3
 
     def get(self, request, uidb64='', token=''):
 
@@ -65,22 +79,23 @@ class AccountConfirm(TokenBasedView):
             messages.warning(request, _("You are already authenticated"))
             return redirect('home')
 
-        try:
-            uid = force_text(urlsafe_base64_decode(uidb64))
-            user = SamUser.objects.get(id=uid)
-        except:
+        uid = decode_uid(uidb64)
+        if uid is None:
             messages.warning(request, _("We could not find the account you "
                                         "are trying to activate."))
             return redirect('home')
 
-        result = self.process_token(request, user, token, UserCreationLog)
+        # the token carries its owner, so the user is not queried on its own
+        Token = self.process_token(request, uid, token, UserCreationLog)
 
-        if not result:
-            redirect('home')
+        if not Token:
+            return redirect('home')
 
+        user = Token.user
         user.is_active = True
         user.activated_at = timezone.now()
-        user.save()
+        user.save(update_fields=['is_active', 'activated_at'])
+        events.emit(events.ACTIVATED, user)
         messages.success(request, _('Congratulations your account has is now '
                                     'active and you can  log in.'))
 
@@ -92,6 +107,7 @@ class UserProfile(ViewMixin):
 
     TEMPLATE = 'samanta/account/profile.html'
     TITLE = "User profile"
+    MAX_QUERIES = 2
 
     def get(self, request):
         return self.render(request)
@@ -101,6 +117,7 @@ class UserProfile(ViewMixin):
 class EmailChange(ViewMixin):
     TEMPLATE = 'samanta/account/email_change.html'
     TITLE = 'Email change'
+    MAX_QUERIES = {'get': 0, 'post': 3}
 
     def get(self, request):
         form = ChangeEmailForm(request.user)
@@ -127,6 +144,7 @@ class EmailChange(ViewMixin):
 
 
 class EmailChangeConfirm(TokenBasedView):
+    MAX_QUERIES = 5
 
     def get(self, request, uidb64, token):
 
@@ -139,21 +157,21 @@ class EmailChangeConfirm(TokenBasedView):
             messages.warning(request, "Invalid link")
             return redirect('home')
 
-        try:
-            uid = force_text(urlsafe_base64_decode(uidb64))
-            user = SamUser.objects.get(id=uid)
-        except:
+        uid = decode_uid(uidb64)
+        if uid is None:
             messages.warning(request, "Invalid link")
             return redirect('home')
 
-        Token = self.process_token(request, user, token, EmailChangeLog)
+        Token = self.process_token(request, uid, token, EmailChangeLog)
 
         if not Token:
             return redirect('home')
 
-        user.email = Token.email
-        user.save()
-        Token.save()
+        user = Token.user
+        previous, user.email = user.email, Token.email
+        user.save(update_fields=['email'])
+        events.emit(events.EMAIL_CHANGED, user, previous=previous,
+                    email=user.email)
 
         messages.success(request, "Your email has been successfully changed.")
 
@@ -164,6 +182,7 @@ class EmailChangeConfirm(TokenBasedView):
 class PasswordChange(ViewMixin):
     TEMPLATE = 'samanta/account/password_change.html'
     TITLE = 'Password change'
+    MAX_QUERIES = {'get': 0, 'post': 1}
     PASSWORD_CHANGE_FORM = PasswordChangeForm
 
     def get(self, request):
@@ -193,8 +212,20 @@ class ProfileEdit(ViewMixin):
 
     TEMPLATE = 'samanta/account/user_edit.html'
     TITLE = "Edit profile"
+    MAX_QUERIES = {'get': 0, 'post': 1}
+    AVATAR_QUERIES = 5
+    """Extra queries of a POST changing the avatar: the AvatarBlob touch,
+    lookup and insert, and the reference counts of the new and the previous
+    file"""
     USER_EDIT_FORM = SamUserEditForm
 
+    def get_query_budget(self, request):
+        budget = super(ProfileEdit, self).get_query_budget(request)
+        if budget is not None and request.method == 'POST' and (
+                request.FILES or 'avatar-clear' in request.POST):
+            budget += self.AVATAR_QUERIES
+        return budget
+
     def get(self, request):
         form = self.USER_EDIT_FORM(instance=request.user)
         self.beautify_form(form)
@@ -203,7 +234,8 @@ class ProfileEdit(ViewMixin):
 
     def post(self, request):
 
-        form = self.USER_EDIT_FORM(request.POST, instance=request.user)
+        form = self.USER_EDIT_FORM(request.POST, request.FILES,
+                                   instance=request.user)
         self.beautify_form(form)
 
         if form.is_valid():
@@ -213,10 +245,33 @@ class ProfileEdit(ViewMixin):
         return self.render(request, {'form': form})
 
 
+@method_decorator(login_required, name='dispatch')
+class UserDataExport(ViewMixin):
+    """Streams all the data stored about the user as NDJSON or as a zip of
+    NDJSON files. The rows are read while the response is sent, so the
+    queries are not part of the budget of the view.
+    """
+    MAX_QUERIES = 0
+    CONTENT_TYPES = {'ndjson': 'application/x-ndjson',
+                     'zip': 'application/zip'}
+
+    def get(self, request):
+        format_ = request.GET.get('format', 'ndjson')
+        if format_ not in export.FORMATS:
+            raise Http404('Unknown export format')
+
+        response = StreamingHttpResponse(export.export(request.user, format_),
+                                         content_type=self.CONTENT_TYPES[format_])
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(
+            request.user.username, format_)
+        return response
+
+
 class PasswordRecoveryStart(ViewMixin):
     TEMPLATE = 'samanta/account/password_recover.html'
     TITLE = "Password recovery"
     PASWORD_RECOVERY_FORM = PasswordRecoveryForm
+    MAX_QUERIES = {'get': 0, 'post': 3}
 
     def get(self, request):
         if request.user.is_authenticated:
@@ -247,6 +302,7 @@ class PasswordRecoveryStart(ViewMixin):
         # just if the user was found actually send the email
         if user:
             send_recover_email(request, user)
+            events.emit(events.RECOVERY_REQUESTED, user)
         # the message is always shown in otder to not say if the account
         # exists or not
         messages.success(request, "An email was sent to your account in "
@@ -259,6 +315,7 @@ class PasswordRecoveryChange(TokenBasedView):
     TEMPLATE = 'samanta/account/password_set_new.html'
     TITLE = "Password recovery"
     PASSWORD_RECOVERY_FORM = PasswordRecoveryChangeForm
+    MAX_QUERIES = {'get': 2, 'post': 3}
 
     def get(self, request, uidb64, token):
 
@@ -270,19 +327,17 @@ class PasswordRecoveryChange(TokenBasedView):
             messages.warning(request, "Invalid link")
             return redirect('home')
 
-        try:
-            uid = force_text(urlsafe_base64_decode(uidb64))
-            user = SamUser.objects.get(id=uid)
-        except:
+        uid = decode_uid(uidb64)
+        if uid is None:
             messages.warning(request, "Invalid link")
             return redirect('home')
 
-        is_valid = self.process_token(request, user, token, PasswordRecoveryLog)
+        Token = self.process_token(request, uid, token, PasswordRecoveryLog)
 
-        if not is_valid:
+        if not Token:
             return redirect('home')
 
-        form = self.PASSWORD_RECOVERY_FORM(user, initial={'hashid': uidb64,
+        form = self.PASSWORD_RECOVERY_FORM(Token.user, initial={'hashid': uidb64,
                                                           'token': token
                                                           })
         self.beautify_form(form)
@@ -294,7 +349,7 @@ class PasswordRecoveryChange(TokenBasedView):
 
         return self.render(request, context)
 
-    def post(self, request):
+    def post(self, request, uidb64=None, token=None):
 
         if request.user.is_authenticated:
             messages.warning(request, "You are already authenticated")
@@ -308,18 +363,18 @@ class PasswordRecoveryChange(TokenBasedView):
         hashid = form_token.hashid_
 
         # if the link is valid, get the user with the given id
-        try:
-            uid = force_text(urlsafe_base64_decode(hashid))
-            user = SamUser.objects.get(id=uid)
-        except:
+        uid = decode_uid(hashid)
+        if uid is None:
             messages.warning(request, "Invalid link")
             return redirect('home')
 
         # open the token related to that user
-        Token = self.process_token(request, user, token, PasswordRecoveryLog)
+        Token = self.process_token(request, uid, token, PasswordRecoveryLog)
 
         if not Token:
             messages.warning(request, "Password problems")
+            return redirect('home')
+        user = Token.user
 
         # form to change the password. This form provides extra fields for
         # the token and the id. It is an extension of
@@ -331,9 +386,9 @@ class PasswordRecoveryChange(TokenBasedView):
                                       "Please chech it.")
             return self.render(request, {'form': form})
 
-        # if everithing ok, deactivate the token and update the user
+        # if everithing ok, update the user. The token was already closed
         form.save()
-        Token.save()
+        events.emit(events.PASSWORD_RECOVERED, user)
 
         messages.success(request, "Your password has been changed. Please "
                                   "try to login..")
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.http import HttpResponse
+from django.views import View
+
+from samanta.conf import settings
+from samanta.core import challenges
+
+
+class CaptchaImage(View):
+    """Serves the pre rendered image of a challenge of the pool from the
+    cache. The image of a challenge never changes, so it can be cached by the
+    browsers while the challenge lives."""
+
+    def get(self, request, challenge_id):
+        data = challenges.image(challenge_id)
+        if data is None:
+            # gone, so the crawlers do not index the expired urls
+            return HttpResponse(status=410)
+        response = HttpResponse(data, content_type='image/png')
+        response['Cache-Control'] = 'private, max-age={}'.format(
+            settings.CAPTCHA_TIMEOUT)
+        return response
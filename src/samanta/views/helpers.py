@@ -2,8 +2,11 @@ from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from django.contrib.sites.shortcuts import get_current_site
 
-from samanta.core.mailer.mailer import EmailSender
 from samanta.core.hasher import Hasher
+from samanta.core.timing import stage
+from samanta.core.metrics import TOKENS_ISSUED
+from samanta.core.tokens import get_token_store
+from samanta.core import cooldown
 from samanta.models import UserCreationLog, EmailChangeLog, PasswordRecoveryLog
 
 
@@ -12,23 +15,31 @@ class TokenMailBuilder:
 
     def __init__(self, log_model):
         self.log_model = log_model
+        self.store = get_token_store(log_model)
 
     def create_log(self, user, digest, salt):
-        # deactivates any previous token. Just in case
-        self.log_model.objects.filter(user=user).update(status=0)
-        log = self.log_model(user=user, email=user.email, token=digest,
-                             salt=salt)
-        return log
+        """Builds the record of the token in the configured token store. It
+        is persisted with ``log.save()`` once the email was sent.
+        """
+        return self.store.build(user, user.email, digest, salt)
 
 
 def _build_log(user, log_model):
     builder = TokenMailBuilder(log_model)
-    token, digest, salt = builder.hasher.secure_set()
+    with stage('hash'):
+        token, digest, salt = builder.hasher.secure_set()
     log = builder.create_log(user, digest, salt)
+    TOKENS_ISSUED.inc(log_model.PURPOSE)
 
     return log, token
 
 
+def _mailer(site_name, site_domain):
+    # the mail machinery is imported just when an email is actually sent
+    from samanta.core.mailer.mailer import EmailSender
+    return EmailSender(site_name, site_domain)
+
+
 def _site_information(request):
     current_site = get_current_site(request)
     name = current_site.name
@@ -54,7 +65,7 @@ def send_register_email(request, user, use_https=False):
 
     context = _build_context(user, token, use_https)
 
-    Mailer = EmailSender(site_name, site_domain)
+    Mailer = _mailer(site_name, site_domain)
     result = Mailer.activation_email(user.email, context)
     if result:
         log.save()
@@ -63,28 +74,41 @@ def send_register_email(request, user, use_https=False):
 
 def send_changemail_email(request, user, newemail, use_https=False):
 
+    # repeated requests for the same address are coalesced with the previous
+    # one
+    if not cooldown.allow(EmailChangeLog.PURPOSE, user.pk, newemail):
+        return True
+
     site_name, site_domain = _site_information(request)
     log, token = _build_log(user, EmailChangeLog)
     log.email = newemail
 
     context = _build_context(user, token, use_https)
 
-    Mailer = EmailSender(site_name, site_domain)
+    Mailer = _mailer(site_name, site_domain)
     result = Mailer.change_email_email(newemail, context)
     if result:
         log.save()
+    else:
+        cooldown.release(EmailChangeLog.PURPOSE, user.pk, newemail)
     return result
 
 
 def send_recover_email(request, user, use_https=False):
 
+    # repeated requests are coalesced with the previous one
+    if not cooldown.allow(PasswordRecoveryLog.PURPOSE, user.pk):
+        return True
+
     site_name, site_domain = _site_information(request)
     log, token = _build_log(user, PasswordRecoveryLog)
 
     context = _build_context(user, token, use_https)
 
-    Mailer = EmailSender(site_name, site_domain)
+    Mailer = _mailer(site_name, site_domain)
     result = Mailer.recovery_email(user.email, context)
     if result:
         log.save()
+    else:
+        cooldown.release(PasswordRecoveryLog.PURPOSE, user.pk)
     return result
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.http import HttpResponse
+from django.views import View
+
+from samanta.core.metrics import REGISTRY
+
+
+class Metrics(View):
+    """Exposes the samanta metrics in the Prometheus text format. It is added
+    to the samanta urls if EXPOSE_METRICS is True, or it can be routed by the
+    project with its own protection.
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def get(self, request):
+        return HttpResponse(REGISTRY.render(REGISTRY.collect()),
+                            content_type=self.CONTENT_TYPE)
@@ -2,18 +2,97 @@
 # -*- coding: utf-8 -*-
 
 
+from contextlib import ExitStack
+
+from django.db import connections
 from django.views import View
 from django.shortcuts import render
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.http import urlsafe_base64_decode
 from django.utils.translation import gettext as _
 
 from samanta.conf import settings
+from samanta.core.timing import stage
+from samanta.core.metrics import TOKEN_CONFIRMATIONS
+from samanta.core import tokens
+
+
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'COMMIT',
+                          'ROLLBACK')
+"""Statements not counted by the query budgets. Their amount depends on the
+autocommit mode and the backend, not on the view"""
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a view runs more queries than its MAX_QUERIES allows"""
+    pass
+
+
+def decode_uid(uidb64):
+    """Decodes the user id sent within the confirmation links
+
+    :param uidb64: str: base 64 encoded id
+    :return: int or None: id of the user or None if the value is not valid
+    """
+    try:
+        return int(force_text(urlsafe_base64_decode(uidb64)))
+    except (TypeError, ValueError, OverflowError):
+        return None
 
 
 class ViewMixin(View):
     TEMPLATE = 'samanta/missing_template.html'
     TITLE = "No Title"
+    MAX_QUERIES = None
+    """Query budget of the view. It can be an int for all the methods or a
+    dict per method, e.g. {'get': 0, 'post': 3}. None means no budget. It is
+    checked only if ENFORCE_QUERY_BUDGETS is on (DEBUG by default)."""
+    SLIM_USER_QUERIES = 1
+    """Extra query loading the deferred fields of request.user when
+    SLIM_USERS is on, if the view reads any of them"""
+
+    def get_query_budget(self, request):
+        """
+        :param request: HttpRequest: request being processed
+        :return: int or None: maximum amount of queries for the request
+        """
+        budget = self.MAX_QUERIES
+        if isinstance(budget, dict):
+            budget = budget.get(request.method.lower())
+        if budget is not None and settings.SLIM_USERS:
+            budget += self.SLIM_USER_QUERIES
+        return budget
+
+    def dispatch(self, request, *args, **kwargs):
+        budget = self.get_query_budget(request)
+        enforce = settings.ENFORCE_QUERY_BUDGETS
+        if enforce is None:
+            enforce = settings.DEBUG
+        if budget is None or not enforce:
+            return super(ViewMixin, self).dispatch(request, *args, **kwargs)
+
+        # the test utils are not paid when the budgets are not enforced
+        from django.test.utils import CaptureQueriesContext
+
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in connections]
+            response = super(ViewMixin, self).dispatch(request, *args, **kwargs)
+
+        queries = [query['sql'] for context in captured
+                   for query in context.captured_queries
+                   if not query['sql'].lstrip().upper().startswith(
+                       TRANSACTION_STATEMENTS)]
+        if len(queries) > budget:
+            raise QueryBudgetExceeded(
+                '{} {} ran {} queries, the budget is {}:\n{}'.format(
+                    request.method, type(self).__name__, len(queries), budget,
+                    '\n'.join('{}. {}'.format(i, sql)
+                               for i, sql in enumerate(queries, 1))))
+        return response
 
     def beautify_form(self, form, _fields=(), ignore_fields=()):
         """
@@ -25,7 +104,6 @@ class ViewMixin(View):
         use_fields = [f for f in fields if f not in ignore_fields]
 
         for field in use_fields:
-            print(field)
             form.fields[field].widget.attrs['class'] = 'form-control'
 
     def render(self, request, context=None):
@@ -43,7 +121,8 @@ class ViewMixin(View):
             'title': self.TITLE
         }
         context_.update(context)
-        return render(request, self.TEMPLATE, context_)
+        with stage('render'):
+            return render(request, self.TEMPLATE, context_)
 
 
 class TokenBasedView(ViewMixin):
@@ -51,23 +130,25 @@ class TokenBasedView(ViewMixin):
     process of validating and closing tokens
     """
 
-    def process_token(self, request, user, token, token_manager):
+    def process_token(self, request, user_id, token, token_manager):
+        """Consumes the active token of the user if the given value is valid.
+        The token store of the token kind is used (see TOKEN_STORES).
 
-        Token = token_manager.objects.filter(user=user, status=1).last()
+        :param request: HttpRequest: used to send messages to the user
+        :param user_id: int: id of the token owner
+        :param token: str: raw token sent to the user
+        :param token_manager: Model: token model of the kind of token
+        :return: token record or None if the token is not valid. The record
+        gives access to its owner as ``user``.
+        """
 
-        if not Token:
-            messages.warning(request, _('Invalid link.'))
-            return None
+        store = tokens.get_token_store(token_manager)
+        result, Token = store.consume(user_id, token)
+        TOKEN_CONFIRMATIONS.inc(token_manager.PURPOSE, result)
 
-        elif not Token.is_old():
+        if result == tokens.EXPIRED:
             messages.warning(request,
                              _('Token too old. Please request a new one.'))
-            return None
-
-        elif not Token.is_valid(token):
+        elif result != tokens.VALID:
             messages.warning(request, _('Invalid link.'))
-            return None
-
-        # Deactivate token
-        Token.close()
         return Token
@@ -0,0 +1,130 @@
+"""
+Form widgets of samanta.
+
+:class:`CachedCountrySelect` renders the ~250 translated and sorted options
+of a country select once per language, instead of sorting the countries and
+rendering an option template per country on every request. The rendered
+options are kept in the process, bound to the translation catalog they were
+rendered with: when django reloads its catalogs (the autoreloader after a
+.mo change, or override_settings of the languages) they are rendered again.
+"""
+
+import django.conf
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.forms.utils import flatatt
+from django.utils import translation
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from django_countries.widgets import LazySelect
+
+_options = {}
+"""Rendered options: {(cache key, language): CountryOptions}"""
+
+
+def _catalog(language):
+    if not django.conf.settings.USE_I18N:
+        return None
+    from django.utils.translation import trans_real
+    return trans_real.translation(language)
+
+
+class CountryOptions:
+    """Options of a select rendered for a language
+
+    :param html: str: the options, none of them selected
+    :param positions: dict: {value: (start, end, selected option)} to splice
+    the selected option into the html
+    :param first: str or None: value of the first option
+    :param catalog: translation catalog the labels come from
+    """
+
+    def __init__(self, html, positions, first, catalog):
+        self.html = html
+        self.positions = positions
+        self.first = first
+        self.catalog = catalog
+
+    def select(self, value):
+        """:return: str: the options with the given value selected"""
+        position = self.positions.get(value)
+        if position is None:
+            return self.html
+        start, end, option = position
+        return self.html[:start] + option + self.html[end:]
+
+
+class CachedCountrySelect(LazySelect):
+    """Select of countries with its options rendered once per language. The
+    choices are only evaluated to render the options, so neither the
+    countries are sorted nor the templates rendered on the next requests.
+
+    The html is the one of django's Select templates, which are bypassed.
+
+    :param cache_key: str: name of the rendered options. Widgets with
+    different choices, e.g. another blank label, need different keys
+    """
+
+    def __init__(self, attrs=None, choices=(), cache_key='countries'):
+        super(CachedCountrySelect, self).__init__(attrs, choices)
+        self.cache_key = cache_key
+
+    def get_options(self):
+        """:return: CountryOptions: of the active language"""
+        language = translation.get_language() or \
+            django.conf.settings.LANGUAGE_CODE
+        catalog = _catalog(language)
+        key = (self.cache_key, language)
+        options = _options.get(key)
+        if options is None or options.catalog is not catalog:
+            options = _options[key] = self.render_options(catalog)
+        return options
+
+    def render_options(self, catalog):
+        """Renders all the options, none of them selected"""
+        parts, positions, first, length = [], {}, None, 0
+        for group_name, group, _ in self.optgroups('', []):
+            if group_name:
+                parts.append(format_html('\n  <optgroup label="{}">',
+                                         group_name))
+                length += len(parts[-1])
+            for option in group:
+                value, attrs = str(option['value']), option['attrs']
+                html = format_html('\n  <option value="{}"{}>{}</option>',
+                                   value, flatatt(attrs), option['label'])
+                selected = format_html(
+                    '\n  <option value="{}"{}>{}</option>', value,
+                    flatatt(dict(attrs, **self.checked_attribute)),
+                    option['label'])
+                # the first one wins, like in Select
+                positions.setdefault(value, (length, length + len(html),
+                                             selected))
+                first = value if first is None else first
+                parts.append(html)
+                length += len(html)
+            if group_name:
+                parts.append('\n  </optgroup>')
+                length += len(parts[-1])
+        return CountryOptions(''.join(parts), positions, first, catalog)
+
+    def use_required_attribute(self, initial):
+        # like Select, without evaluating the choices
+        return not self.is_hidden and self.get_options().first == ''
+
+    def render(self, name, value, attrs=None, renderer=None):
+        options = self.get_options()
+        values = self.format_value(value)
+        body = options.select(values[0]) if values else options.html
+        final_attrs = self.build_attrs(self.attrs, attrs)
+        return mark_safe(format_html('<select name="{}"{}>', name,
+                                     flatatt(final_attrs)) +
+                         body + '\n</select>')
+
+
+@receiver(setting_changed)
+def _clear_options(setting=None, **kwargs):
+    """The countries of django-countries are configured with the
+    COUNTRIES_* settings"""
+    if setting.startswith('COUNTRIES_') or setting in (
+            'LANGUAGE_CODE', 'LANGUAGES', 'LOCALE_PATHS', 'USE_I18N'):
+        _options.clear()